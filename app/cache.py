@@ -3,18 +3,24 @@ Sistema de caché para Chiknow
 Soporta caché en memoria (desarrollo) y Redis (producción)
 """
 from functools import wraps
+import inspect
 import json
 import hashlib
 from typing import Any, Optional, Callable
 from datetime import datetime, timedelta
 import logging
 
+from sqlalchemy.orm import Session
+
 logger = logging.getLogger(__name__)
 
 # Caché en memoria (desarrollo)
 _cache = {}
 _cache_expiry = {}
 
+# Reloj de las expiraciones (los tests lo sustituyen para no tener que esperar)
+_now = datetime.now
+
 
 def get_cache_key(*args, **kwargs) -> str:
     """
@@ -38,6 +44,32 @@ def get_cache_key(*args, **kwargs) -> str:
         return hashlib.md5(str(datetime.now()).encode()).hexdigest()
 
 
+def _clave_de_valor(valor):
+    """
+    Parte de la clave de caché para un valor
+    
+    Una sesión se sustituye por su bind (motor o conexión): cada petición abre
+    una sesión nueva, que nunca volvería a coincidir y quedaría retenida en el
+    caché. El resto de valores van con su tipo, para no mezclar f(1), f(True)
+    y f(1.0).
+    
+    Por eso una función cacheada que recibe la sesión comparte su resultado
+    entre peticiones durante todo el TTL, e invalidate_cache solo lo limpia en
+    este proceso (no en otros workers). Úsese solo para datos que admiten ese
+    retraso, como los conteos de /health.
+    """
+    if isinstance(valor, Session):
+        return valor.get_bind()
+    return (type(valor), valor)
+
+
+def _clave_de_argumentos(args, kwargs):
+    return (
+        tuple(map(_clave_de_valor, args)),
+        tuple(sorted((k, _clave_de_valor(v)) for k, v in kwargs.items())),
+    )
+
+
 def cache(ttl_seconds: int = 300):
     """
     Decorator para cachear resultados de funciones
@@ -50,17 +82,34 @@ def cache(ttl_seconds: int = 300):
         def expensive_function(param1, param2):
             # código costoso
             return result
+    
+    El resultado se comparte entre peticiones: las funciones cacheadas deben
+    devolver datos planos (tuplas, dicts, sets), nunca instancias ORM ligadas
+    a la sesión que las cargó.
     """
     def decorator(func: Callable) -> Callable:
+        nombre = f"{func.__module__}.{func.__qualname__}"
+        firma = inspect.signature(func)
+        
         @wraps(func)
         def wrapper(*args, **kwargs):
-            # Generar clave de caché
-            cache_key = f"{func.__module__}.{func.__name__}:{get_cache_key(*args, **kwargs)}"
+            # Generar clave de caché sin serializar. Solo con kwargs se asocian
+            # a sus parámetros (firma calculada una vez), para que f("a") y
+            # f(x="a") coincidan; los valores por defecto no se rellenan. Con
+            # argumentos no hashables se recurre al hash MD5
+            try:
+                if kwargs:
+                    argumentos = firma.bind(*args, **kwargs)
+                    args, kwargs = argumentos.args, argumentos.kwargs
+                cache_key = (nombre, _clave_de_argumentos(args, kwargs))
+                hash(cache_key)
+            except TypeError:
+                cache_key = (nombre, get_cache_key(*args, **kwargs))
             
             # Verificar caché
             if cache_key in _cache:
                 if cache_key in _cache_expiry:
-                    if datetime.now() < _cache_expiry[cache_key]:
+                    if _now() < _cache_expiry[cache_key]:
                         logger.debug(f"Cache HIT: {func.__name__}")
                         return _cache[cache_key]
                     else:
@@ -74,7 +123,7 @@ def cache(ttl_seconds: int = 300):
             result = func(*args, **kwargs)
             
             _cache[cache_key] = result
-            _cache_expiry[cache_key] = datetime.now() + timedelta(seconds=ttl_seconds)
+            _cache_expiry[cache_key] = _now() + timedelta(seconds=ttl_seconds)
             
             return result
         
@@ -102,7 +151,7 @@ def invalidate_cache(pattern: Optional[str] = None):
         _cache_expiry.clear()
         logger.info(f"Cache invalidado completamente ({count} entradas)")
     else:
-        keys_to_delete = [k for k in _cache.keys() if pattern in k]
+        keys_to_delete = [k for k in _cache.keys() if pattern in k[0]]
         for key in keys_to_delete:
             del _cache[key]
             if key in _cache_expiry:
@@ -117,7 +166,7 @@ def get_cache_stats() -> dict:
     Returns:
         dict: Estadísticas del caché
     """
-    now = datetime.now()
+    now = _now()
     active_entries = sum(
         1 for key in _cache_expiry.keys()
         if _cache_expiry[key] > now
@@ -136,7 +185,7 @@ def cleanup_expired_cache():
     Limpia entradas expiradas del caché
     Útil para ejecutar periódicamente
     """
-    now = datetime.now()
+    now = _now()
     expired_keys = [
         key for key, expiry in _cache_expiry.items()
         if expiry <= now
@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from .config import config
@@ -22,13 +22,35 @@ elif "postgresql" in DATABASE_URL or "postgres" in DATABASE_URL:
         "pool_size": 10,
         "max_overflow": 20,
         "pool_pre_ping": True,
-        "echo": False
+        "echo": False,
+        # Explícito aunque sea el valor por defecto de PostgreSQL: el repaso SM2
+        # no necesita más. Para tareas de administración que sí lo requieran:
+        # db.connection(execution_options={"isolation_level": "SERIALIZABLE"})
+        "isolation_level": "READ COMMITTED"
     }
     # Si estamos en Render, usar SSL si está disponible
     if os.getenv("RENDER", False):
         engine_params["connect_args"] = {"sslmode": "require"}
 
 engine = create_engine(DATABASE_URL, **engine_params)
+
+if "sqlite" in DATABASE_URL:
+    @event.listens_for(engine, "connect")
+    def _configurar_sqlite(dbapi_connection, connection_record):
+        """
+        Pragmas de rendimiento para SQLite
+        
+        WAL agrupa los commits y permite leer mientras se escribe; con WAL,
+        synchronous=NORMAL solo sincroniza con disco en los checkpoints.
+        """
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA mmap_size=268435456")  # 256 MB
+        cursor.execute("PRAGMA cache_size=-65536")    # 64 MB
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.close()
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
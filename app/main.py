@@ -2,14 +2,17 @@ from fastapi import FastAPI, Depends, Request, Query, HTTPException, status
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy import text  # ✅ FIX CRÍTICO
+from pydantic import conlist
 import logging
 import os
 
 # Importamos nuestros módulos locales
 from . import models, service, repository, database, schemas
+from .cache import cache
 from .config import config
 from .logging_config import setup_logging_from_env
 from .middleware import setup_middleware
@@ -29,7 +32,8 @@ except Exception as e:
     print("ℹ️  Continuando sin tablas (puede que ya existan)")
 
 # CREAR APP
-app = FastAPI(title="Chiknow", version="1.1.0")
+# Las respuestas JSON se serializan en C con orjson (en requirements.txt)
+app = FastAPI(title="Chiknow", version="1.1.0", default_response_class=ORJSONResponse)
 
 # ✅ Setup logging estructurado
 logger = setup_logging_from_env()
@@ -77,6 +81,22 @@ def ejemplos_page(request: Request):
 def sm2_page(request: Request):
     return templates.TemplateResponse("sm2.html", {"request": request})
 
+@cache(ttl_seconds=5)
+def _contar_filas_bd(db: Session):
+    """
+    Cuenta las filas principales para /health
+    
+    Solo se cachean estos conteos, unos segundos por motor (la clave de una
+    sesión es su bind), para que los sondeos seguidos del balanceador no
+    recorran las tablas cada vez. La conexión no: health_check la comprueba
+    en cada petición.
+    """
+    return {
+        "total_palabras": db.query(models.HSK).count(),
+        "palabras_diccionario": db.query(models.Diccionario).count(),
+        "tarjetas_activas": db.query(models.Tarjeta).filter(models.Tarjeta.activa == True).count()
+    }
+
 @app.get("/health")
 def health_check(db: Session = Depends(database.get_db)):
     """Endpoint de salud mejorado para verificar que la app está funcionando"""
@@ -87,16 +107,11 @@ def health_check(db: Session = Depends(database.get_db)):
     }
     
     try:
-        # Test de conexión a BD
+        # Test de conexión a BD (sin caché) y stats adicionales
         db.execute(text("SELECT 1"))
+        stats = _contar_filas_bd(db)
         health["database"] = "connected"
-        
-        # Stats adicionales
-        health["stats"] = {
-            "total_palabras": db.query(models.HSK).count(),
-            "palabras_diccionario": db.query(models.Diccionario).count(),
-            "tarjetas_activas": db.query(models.Tarjeta).filter(models.Tarjeta.activa == True).count()
-        }
+        health["stats"] = stats
         
     except Exception as e:
         health["database"] = "error"
@@ -642,6 +657,39 @@ async def api_procesar_respuesta(
             detail="Error al procesar respuesta"
         )
 
+@app.post("/api/sm2/review/batch")
+async def api_procesar_respuestas(
+    # Sin lotes vacíos; el tope deja margen para repetir las 100 tarjetas de /cards/due
+    reviews: conlist(schemas.ReviewRequest, min_length=1, max_length=200),
+    db: Session = Depends(database.get_db)
+):
+    """
+    Procesa en una sola petición varias respuestas de la sesión
+    Devuelve la lista de resultados en el mismo orden que las respuestas
+    """
+    try:
+        resultado = service.procesar_respuestas(
+            db, [review.model_dump() for review in reviews]
+        )
+        
+        if isinstance(resultado, dict) and "error" in resultado:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=resultado["error"]
+            )
+        
+        logger.debug(f"Lote de {len(reviews)} respuestas procesado")
+        return resultado
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error procesando lote de respuestas: {e}", exc_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error al procesar respuestas"
+        )
+
 @app.post("/api/sm2/session/end/{session_id}")
 async def api_finalizar_sesion(session_id: int, db: Session = Depends(database.get_db)):
     """Finaliza una sesión de estudio"""
@@ -141,7 +141,8 @@ class SM2Progress(Base):
     version = Column(Integer, default=1, nullable=False)
     
     __table_args__ = (
-        Index('idx_next_review', 'next_review'),  # Para queries rápidas
+        # Tarjetas pendientes (next_review <= ahora) sin leer la tabla: índice que cubre la consulta
+        Index('idx_progress_due', 'next_review', 'tarjeta_id'),
         Index('idx_estado', 'estado'),  # Para filtros por estado
     )
 
@@ -1,13 +1,11 @@
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import or_, and_, func, text
+from sqlalchemy import or_, and_, case, func, delete, insert, select, text
 from sqlalchemy.exc import SQLAlchemyError
 from datetime import datetime, timezone, timedelta
 import json
-import random
 import logging
 
 from . import models
-from .cache import cache, invalidate_cache
 from .utils import now_utc, normalize_text
 
 logger = logging.getLogger(__name__)
@@ -16,15 +14,29 @@ logger = logging.getLogger(__name__)
 # FUNCIONES HSK
 # ============================================================================
 
-@cache(ttl_seconds=300)  # ✅ Caché 5 minutos
 def get_hsk_all(db: Session):
-    """Obtiene todas las palabras HSK (cacheado)"""
+    """
+    Obtiene todas las palabras HSK
+    
+    Devuelve filas planas (id, numero, nivel, hanzi, pinyin, espanol), sin
+    instancias ORM que el listado no necesita.
+    
+    Sin @cache: compartido entre peticiones no vería las traducciones añadidas
+    (ni en otros workers, a los que invalidate_cache no llega).
+    """
     logger.debug("Cargando todas las palabras HSK")
-    return db.query(models.HSK).all()
+    return db.execute(select(
+        models.HSK.id,
+        models.HSK.numero,
+        models.HSK.nivel,
+        models.HSK.hanzi,
+        models.HSK.pinyin,
+        models.HSK.espanol,
+    )).all()
 
 def get_hsk_by_id(db: Session, hsk_id: int):
-    """Obtiene una palabra HSK por ID"""
-    return db.query(models.HSK).filter(models.HSK.id == hsk_id).first()
+    """Obtiene una palabra HSK por ID (usa el identity map de la sesión)"""
+    return db.get(models.HSK, hsk_id)
 
 def search_hsk(db: Session, query: str):
     """
@@ -127,16 +139,21 @@ def get_all_notas(db: Session):
 # FUNCIONES DICCIONARIO
 # ============================================================================
 
-@cache(ttl_seconds=60)  # ✅ Caché 1 minuto (se actualiza frecuentemente)
 def get_diccionario_hsk_ids(db: Session):
     """
     Retorna un set con los IDs de HSK que están en el diccionario
-    ✅ OPTIMIZADO: Cacheado
+    Sin @cache, como get_hsk_all: las altas y bajas se ven en la petición siguiente
     """
     logger.debug("Cargando IDs de diccionario")
     resultados = db.query(models.Diccionario.hsk_id).all()
     return {r.hsk_id for r in resultados}
 
+def get_diccionario_count(db: Session):
+    """Cuenta las palabras HSK distintas del diccionario (len de get_diccionario_hsk_ids, sin cargarlas)"""
+    return db.execute(
+        select(func.count(models.Diccionario.hsk_id.distinct()))
+    ).scalar_one()
+
 def existe_en_diccionario(db: Session, hsk_id: int):
     """Verifica si una palabra HSK ya está en el diccionario"""
     return db.query(models.Diccionario).filter(
@@ -151,9 +168,6 @@ def create_diccionario_entry(db: Session, hsk_id: int):
         db.commit()
         db.refresh(nueva_entrada)
         
-        # ✅ Invalidar caché
-        invalidate_cache("get_diccionario_hsk_ids")
-        
         logger.info(f"Entrada creada en diccionario para HSK {hsk_id}")
         return nueva_entrada
         
@@ -175,9 +189,6 @@ def delete_diccionario_entry(db: Session, diccionario_id: int):
             models.Diccionario.id == diccionario_id
         ).delete()
         
-        # ✅ Invalidar caché
-        invalidate_cache("get_diccionario_hsk_ids")
-        
         logger.info(f"Entrada eliminada del diccionario: {diccionario_id}")
         
     except SQLAlchemyError as e:
@@ -186,14 +197,14 @@ def delete_diccionario_entry(db: Session, diccionario_id: int):
         raise
 
 def activar_diccionario_entry(db: Session, hsk_id: int):
-    """Activa una entrada del diccionario"""
+    """Activa una entrada del diccionario (sin commit: lo hace el servicio que llama)"""
     try:
         entry = db.query(models.Diccionario).filter(
             models.Diccionario.hsk_id == hsk_id
         ).first()
         if entry:
             entry.activo = True
-            db.commit()
+            db.flush()
             logger.debug(f"Entrada activada en diccionario: HSK {hsk_id}")
     except SQLAlchemyError as e:
         db.rollback()
@@ -201,38 +212,57 @@ def activar_diccionario_entry(db: Session, hsk_id: int):
         raise
 
 def desactivar_diccionario_entry(db: Session, hsk_id: int):
-    """Desactiva una entrada del diccionario (cuando está cubierta por una frase)"""
+    """
+    Desactiva una entrada del diccionario (cuando está cubierta por una frase)
+    Sin commit: lo hace el servicio que llama
+    """
     try:
         entry = db.query(models.Diccionario).filter(
             models.Diccionario.hsk_id == hsk_id
         ).first()
         if entry:
             entry.activo = False
-            db.commit()
+            db.flush()
             logger.debug(f"Entrada desactivada en diccionario: HSK {hsk_id}")
     except SQLAlchemyError as e:
         db.rollback()
         logger.error(f"Error desactivando entrada: {e}", exc_info=True)
         raise
 
+# Columnas que devuelven los listados del diccionario (una fila por entrada)
+_COLUMNAS_DICCIONARIO = (
+    models.Diccionario.id,
+    models.HSK.id.label("hsk_id"),
+    models.HSK.numero,
+    models.HSK.nivel,
+    models.HSK.hanzi,
+    models.HSK.pinyin,
+    models.HSK.espanol,
+    models.Diccionario.activo,
+)
+
 def get_all_diccionario_with_hsk(db: Session):
-    """Obtiene todas las entradas del diccionario con información de HSK"""
-    return db.query(models.Diccionario, models.HSK).join(
-        models.HSK, models.Diccionario.hsk_id == models.HSK.id
-    ).all()
+    """Obtiene todas las entradas del diccionario con información de HSK (solo las columnas del listado)"""
+    return db.execute(
+        select(*_COLUMNAS_DICCIONARIO).join(
+            models.HSK, models.Diccionario.hsk_id == models.HSK.id
+        )
+    ).mappings().all()
 
 def search_diccionario(db: Session, query: str):
     """Busca en el diccionario por hanzi, pinyin o español"""
     search_pattern = f"%{query}%"
-    return db.query(models.Diccionario, models.HSK).join(
-        models.HSK, models.Diccionario.hsk_id == models.HSK.id
-    ).filter(
-        or_(
-            models.HSK.hanzi.like(search_pattern),
-            models.HSK.pinyin.like(search_pattern),
-            models.HSK.espanol.like(search_pattern)
+    return db.execute(
+        select(*_COLUMNAS_DICCIONARIO).join(
+            models.HSK, models.Diccionario.hsk_id == models.HSK.id
+        ).where(
+            or_(
+                models.HSK.hanzi.like(search_pattern),
+                models.HSK.pinyin.like(search_pattern),
+                models.HSK.espanol.like(search_pattern)
+            )
         )
-    ).all()
+    ).mappings().all()
 
 # ============================================================================
 # FUNCIONES TARJETAS (MEJORADAS)
@@ -251,42 +281,58 @@ def create_tarjeta(db: Session, datos_tarjeta: dict):
         logger.error(f"Error creando tarjeta: {e}", exc_info=True)
         raise
 
+def bulk_create_tarjetas(db: Session, filas: list):
+    """
+    Crea varias tarjetas con un único INSERT
+    
+    Returns:
+        list[int]: IDs de las tarjetas creadas. No se pide que sigan el orden
+        de las filas: en SQLite eso obligaría a un INSERT por fila
+    """
+    try:
+        ids = db.scalars(insert(models.Tarjeta).returning(models.Tarjeta.id), filas).all()
+        logger.debug(f"Tarjetas creadas: {ids}")
+        return ids
+    except SQLAlchemyError as e:
+        db.rollback()
+        logger.error(f"Error creando tarjetas: {e}", exc_info=True)
+        raise
+
+def _delete_tarjetas_where(db: Session, condicion):
+    """
+    Elimina las tarjetas que cumplen la condición junto a sus reviews y progreso
+    
+    Las dependencias se borran con una subconsulta sobre los IDs, así que son
+    tres DELETE sea cual sea el número de tarjetas y no se carga ninguna fila.
+    
+    Returns:
+        int: Número de tarjetas eliminadas
+    """
+    sin_sincronizar = {"synchronize_session": False}
+    ids = select(models.Tarjeta.id).where(condicion)
+    
+    db.execute(
+        delete(models.SM2Review).where(models.SM2Review.tarjeta_id.in_(ids)),
+        execution_options=sin_sincronizar
+    )
+    db.execute(
+        delete(models.SM2Progress).where(models.SM2Progress.tarjeta_id.in_(ids)),
+        execution_options=sin_sincronizar
+    )
+    return db.execute(
+        delete(models.Tarjeta).where(condicion),
+        execution_options=sin_sincronizar
+    ).rowcount
+
 def delete_tarjetas_by_diccionario_id(db: Session, diccionario_id: int):
     """
     Elimina todas las tarjetas asociadas a una entrada del diccionario
     ✅ MEJORADO: Maneja correctamente las dependencias de foreign keys
     """
     try:
-        # 1. Obtener todas las tarjetas asociadas
-        tarjetas = db.query(models.Tarjeta).filter(
-            models.Tarjeta.diccionario_id == diccionario_id
-        ).all()
-        
-        if not tarjetas:
-            return True
-        
-        logger.info(f"Eliminando {len(tarjetas)} tarjetas del diccionario {diccionario_id}")
-        
-        # 2. Para cada tarjeta, eliminar dependencias en orden
-        for tarjeta in tarjetas:
-            # 2a. Eliminar reviews (SM2Review)
-            db.query(models.SM2Review).filter(
-                models.SM2Review.tarjeta_id == tarjeta.id
-            ).delete(synchronize_session=False)
-            
-            # 2b. Eliminar progreso (SM2Progress)
-            db.query(models.SM2Progress).filter(
-                models.SM2Progress.tarjeta_id == tarjeta.id
-            ).delete(synchronize_session=False)
-        
-        # 3. Ahora sí eliminar las tarjetas
-        db.query(models.Tarjeta).filter(
-            models.Tarjeta.diccionario_id == diccionario_id
-        ).delete(synchronize_session=False)
-        
-        # 4. Commit de todos los cambios
+        eliminadas = _delete_tarjetas_where(db, models.Tarjeta.diccionario_id == diccionario_id)
         db.commit()
-        logger.info(f"Tarjetas eliminadas exitosamente")
+        logger.info(f"Eliminadas {eliminadas} tarjetas del diccionario {diccionario_id}")
         return True
         
     except Exception as e:
@@ -300,29 +346,9 @@ def delete_tarjetas_by_ejemplo_id(db: Session, ejemplo_id: int):
     ✅ MEJORADO: Maneja correctamente las dependencias de foreign keys
     """
     try:
-        tarjetas = db.query(models.Tarjeta).filter(
-            models.Tarjeta.ejemplo_id == ejemplo_id
-        ).all()
-        
-        if not tarjetas:
-            return True
-        
-        logger.info(f"Eliminando {len(tarjetas)} tarjetas del ejemplo {ejemplo_id}")
-        
-        for tarjeta in tarjetas:
-            db.query(models.SM2Review).filter(
-                models.SM2Review.tarjeta_id == tarjeta.id
-            ).delete(synchronize_session=False)
-            
-            db.query(models.SM2Progress).filter(
-                models.SM2Progress.tarjeta_id == tarjeta.id
-            ).delete(synchronize_session=False)
-        
-        db.query(models.Tarjeta).filter(
-            models.Tarjeta.ejemplo_id == ejemplo_id
-        ).delete(synchronize_session=False)
-        
+        eliminadas = _delete_tarjetas_where(db, models.Tarjeta.ejemplo_id == ejemplo_id)
         db.commit()
+        logger.info(f"Eliminadas {eliminadas} tarjetas del ejemplo {ejemplo_id}")
         return True
         
     except Exception as e:
@@ -357,12 +383,12 @@ def delete_tarjeta_by_id(db: Session, tarjeta_id: int):
         raise
 
 def activar_tarjeta(db: Session, tarjeta_id: int):
-    """Activa una tarjeta"""
+    """Activa una tarjeta (sin commit: lo hace el servicio que llama)"""
     try:
         tarjeta = db.query(models.Tarjeta).filter(models.Tarjeta.id == tarjeta_id).first()
         if tarjeta:
             tarjeta.activa = True
-            db.commit()
+            db.flush()
             logger.debug(f"Tarjeta {tarjeta_id} activada")
     except SQLAlchemyError as e:
         db.rollback()
@@ -370,27 +396,45 @@ def activar_tarjeta(db: Session, tarjeta_id: int):
         raise
 
 def desactivar_tarjeta(db: Session, tarjeta_id: int):
-    """Desactiva una tarjeta"""
+    """Desactiva una tarjeta (sin commit: lo hace el servicio que llama)"""
     try:
         tarjeta = db.query(models.Tarjeta).filter(models.Tarjeta.id == tarjeta_id).first()
         if tarjeta:
             tarjeta.activa = False
-            db.commit()
+            db.flush()
             logger.debug(f"Tarjeta {tarjeta_id} desactivada")
     except SQLAlchemyError as e:
         db.rollback()
         logger.error(f"Error desactivando tarjeta: {e}", exc_info=True)
         raise
 
+def get_tarjetas_by_ids(db: Session, tarjeta_ids):
+    """Obtiene varias tarjetas en una consulta, como dict id -> tarjeta"""
+    tarjetas = db.query(models.Tarjeta).filter(models.Tarjeta.id.in_(tarjeta_ids)).all()
+    return {tarjeta.id: tarjeta for tarjeta in tarjetas}
+
 def get_tarjetas_by_hsk_id(db: Session, hsk_id: int):
     """Obtiene todas las tarjetas de un hanzi específico"""
     return db.query(models.Tarjeta).filter(models.Tarjeta.hsk_id == hsk_id).all()
 
 def get_all_tarjetas_with_info(db: Session):
-    """Obtiene todas las tarjetas con información completa"""
-    return db.query(models.Tarjeta, models.HSK).outerjoin(
-        models.HSK, models.Tarjeta.hsk_id == models.HSK.id
-    ).all()
+    """Obtiene las tarjetas de palabras con la información de su HSK (solo las columnas del listado)"""
+    return db.execute(
+        select(
+            models.Tarjeta.id,
+            models.Tarjeta.hsk_id,
+            models.Tarjeta.diccionario_id,
+            models.Tarjeta.ejemplo_id,
+            models.HSK.hanzi,
+            models.HSK.pinyin,
+            models.HSK.espanol,
+            models.Tarjeta.mostrado1,
+            models.Tarjeta.mostrado2,
+            models.Tarjeta.audio,
+            models.Tarjeta.requerido,
+            models.Tarjeta.activa,
+        ).join(models.HSK, models.Tarjeta.hsk_id == models.HSK.id)
+    ).mappings().all()
 
 def get_tarjetas_count(db: Session):
     """Cuenta el total de tarjetas"""
@@ -491,13 +535,18 @@ def get_ejemplos_en_diccionario(db: Session):
     """Obtiene ejemplos añadidos al diccionario por el usuario"""
     return db.query(models.Ejemplo).filter(models.Ejemplo.en_diccionario == True).all()
 
+def get_ejemplos_en_diccionario_count(db: Session):
+    """Cuenta los ejemplos añadidos al diccionario sin cargarlos"""
+    return db.execute(
+        select(func.count()).select_from(models.Ejemplo).where(models.Ejemplo.en_diccionario == True)
+    ).scalar_one()
+
 def activar_ejemplo(db: Session, ejemplo_id: int, motivo: str, hanzi_ids: list):
-    """Activa un ejemplo y registra la activación"""
+    """Activa un ejemplo y registra la activación (sin commit: lo hace el servicio que llama)"""
     try:
         ejemplo = db.query(models.Ejemplo).filter(models.Ejemplo.id == ejemplo_id).first()
         if ejemplo:
             ejemplo.activado = True
-            db.commit()
             
             activacion = models.EjemploActivacion(
                 ejemplo_id=ejemplo_id,
@@ -505,7 +554,7 @@ def activar_ejemplo(db: Session, ejemplo_id: int, motivo: str, hanzi_ids: list):
                 hanzi_ids=json.dumps(hanzi_ids)
             )
             db.add(activacion)
-            db.commit()
+            db.flush()
             logger.info(f"Ejemplo {ejemplo_id} activado: {motivo}")
     except SQLAlchemyError as e:
         db.rollback()
@@ -565,6 +614,26 @@ def get_hanzi_de_ejemplo(db: Session, ejemplo_id: int):
         models.HSKEjemplo.ejemplo_id == ejemplo_id
     ).order_by(models.HSKEjemplo.posicion).all()
 
+def get_hanzi_de_ejemplos(db: Session, ejemplo_ids):
+    """
+    Obtiene en una consulta los hanzi que componen varios ejemplos
+    
+    Returns:
+        dict: ejemplo_id -> lista de hanzi ordenados por posición
+    """
+    filas = db.execute(
+        select(models.HSKEjemplo.ejemplo_id, models.HSK.hanzi).join(
+            models.HSK, models.HSKEjemplo.hsk_id == models.HSK.id
+        ).where(
+            models.HSKEjemplo.ejemplo_id.in_(ejemplo_ids)
+        ).order_by(models.HSKEjemplo.ejemplo_id, models.HSKEjemplo.posicion)
+    )
+    
+    componentes = {}
+    for ejemplo_id, hanzi in filas:
+        componentes.setdefault(ejemplo_id, []).append(hanzi)
+    return componentes
+
 def get_ejemplos_de_hanzi(db: Session, hsk_id: int):
     """Obtiene todos los ejemplos que contienen un hanzi específico"""
     return db.query(models.HSKEjemplo, models.Ejemplo).join(
@@ -649,6 +718,30 @@ def get_or_create_progress(db: Session, tarjeta_id: int):
         db.refresh(progress)
     return progress
 
+def bulk_create_progress(db: Session, tarjeta_ids: list):
+    """Crea el progreso inicial (valores por defecto) de varias tarjetas con un único INSERT"""
+    db.execute(
+        insert(models.SM2Progress),
+        [{"tarjeta_id": tarjeta_id} for tarjeta_id in tarjeta_ids]
+    )
+
+def get_or_create_progress_many(db: Session, tarjeta_ids):
+    """
+    Obtiene el progreso de varias tarjetas como dict tarjeta_id -> progreso
+    Los que falten se crean con un único INSERT y se leen junto al resto
+    """
+    def leer(ids):
+        return db.query(models.SM2Progress).filter(
+            models.SM2Progress.tarjeta_id.in_(ids)
+        ).with_for_update().all()
+    
+    progresos = {progress.tarjeta_id: progress for progress in leer(tarjeta_ids)}
+    faltantes = set(tarjeta_ids) - progresos.keys()
+    if faltantes:
+        bulk_create_progress(db, faltantes)
+        progresos.update((progress.tarjeta_id, progress) for progress in leer(faltantes))
+    return progresos
+
 def update_progress(db: Session, tarjeta_id: int, easiness: float, repetitions: int, 
                    interval: int, next_review: datetime, estado: str):
     """
@@ -693,38 +786,77 @@ def increment_progress_stats(db: Session, tarjeta_id: int, is_correct: bool):
     return progress
 
 def get_cards_due_for_review(db: Session, limite: int = None):
-    """Obtiene tarjetas ACTIVAS que necesitan revisión (ORDEN ALEATORIO)"""
-    query = db.query(models.Tarjeta, models.HSK, models.SM2Progress, models.Ejemplo).outerjoin(
+    """
+    Obtiene tarjetas ACTIVAS que necesitan revisión (ORDEN ALEATORIO)
+    
+    Devuelve filas con las columnas del payload de estudio: los textos salen del
+    HSK o del ejemplo según el tipo de tarjeta y los valores de progreso por
+    defecto (tarjetas sin progreso) se resuelven con COALESCE. El orden
+    aleatorio y el límite se aplican en la BD, sin cargar todas las pendientes.
+    """
+    es_palabra = models.Tarjeta.hsk_id != None
+    stmt = select(
+        models.Tarjeta.id.label("tarjeta_id"),
+        models.Tarjeta.hsk_id,
+        models.Tarjeta.ejemplo_id,
+        case((es_palabra, models.HSK.hanzi), else_=models.Ejemplo.hanzi).label("hanzi"),
+        case((es_palabra, models.HSK.pinyin), else_=models.Ejemplo.pinyin).label("pinyin"),
+        case((es_palabra, models.HSK.espanol), else_=models.Ejemplo.espanol).label("espanol"),
+        models.Tarjeta.mostrado1,
+        models.Tarjeta.mostrado2,
+        models.Tarjeta.audio,
+        models.Tarjeta.requerido,
+        (func.coalesce(models.SM2Progress.total_reviews, 0) == 0).label("es_nueva"),
+        func.coalesce(models.SM2Progress.repetitions, 0).label("repeticiones"),
+        func.coalesce(models.SM2Progress.easiness_factor, 2.5).label("facilidad"),
+        func.coalesce(models.SM2Progress.estado, "nuevo").label("estado"),
+        models.SM2Progress.next_review.label("proxima_revision"),
+    ).outerjoin(
         models.HSK, models.Tarjeta.hsk_id == models.HSK.id
     ).outerjoin(
         models.Ejemplo, models.Tarjeta.ejemplo_id == models.Ejemplo.id
     ).outerjoin(
         models.SM2Progress, models.Tarjeta.id == models.SM2Progress.tarjeta_id
-    ).filter(
-        models.Tarjeta.activa == True
-    ).filter(
+    ).where(
+        models.Tarjeta.activa == True,
+        or_(models.Tarjeta.hsk_id != None, models.Tarjeta.ejemplo_id != None),
         or_(
             models.SM2Progress.next_review <= now_utc(),  # ✅ FIX: Timezone consistente
             models.SM2Progress.next_review == None
         )
-    ).all()
-    
-    # Mezclar aleatoriamente
-    tarjetas_list = list(query)
-    random.shuffle(tarjetas_list)
+    ).order_by(func.random())
     
-    # Aplicar límite después de mezclar
     if limite:
-        tarjetas_list = tarjetas_list[:limite]
+        stmt = stmt.limit(limite)
     
-    return tarjetas_list
+    return db.execute(stmt).mappings().all()
 
 def get_all_progress_with_cards(db: Session):
-    """Obtiene todo el progreso con información de tarjetas"""
-    return db.query(models.SM2Progress, models.Tarjeta, models.HSK).join(
-        models.Tarjeta, models.SM2Progress.tarjeta_id == models.Tarjeta.id
-    ).outerjoin(
-        models.HSK, models.Tarjeta.hsk_id == models.HSK.id
+    """
+    Obtiene todo el progreso con información de tarjetas (solo las columnas necesarias)
+    obtener_progreso_detallado desempaqueta las filas por posición: mantener el orden
+    """
+    return db.execute(
+        select(
+            models.Tarjeta.id.label("tarjeta_id"),
+            models.Tarjeta.hsk_id,
+            models.Tarjeta.activa,
+            models.HSK.hanzi,
+            models.HSK.pinyin,
+            models.HSK.espanol,
+            models.SM2Progress.easiness_factor,
+            models.SM2Progress.repetitions,
+            models.SM2Progress.interval,
+            models.SM2Progress.estado,
+            models.SM2Progress.next_review,
+            models.SM2Progress.total_reviews,
+            models.SM2Progress.correct_reviews,
+            models.SM2Progress.last_review,
+        ).join(
+            models.Tarjeta, models.SM2Progress.tarjeta_id == models.Tarjeta.id
+        ).outerjoin(
+            models.HSK, models.Tarjeta.hsk_id == models.HSK.id
+        )
     ).all()
 
 def get_progress_by_tarjeta(db: Session, tarjeta_id: int):
@@ -775,6 +907,18 @@ def create_review(db: Session, tarjeta_id: int, session_id: int, quality: int,
     db.commit()
     return review
 
+def bulk_create_reviews(db: Session, filas: list):
+    """
+    Registra varias revisiones con un único INSERT
+    Cada fila lleva las columnas de SM2Review; hanzi_fallados se pasa como lista
+    """
+    if not filas:
+        return  # Un INSERT sin filas guardaría una revisión vacía
+    db.execute(insert(models.SM2Review), [
+        {**fila, "hanzi_fallados": json.dumps(fila["hanzi_fallados"]) if fila["hanzi_fallados"] else None}
+        for fila in filas
+    ])
+
 def get_reviews_by_tarjeta(db: Session, tarjeta_id: int):
     """Obtiene el historial de revisiones de una tarjeta"""
     return db.query(models.SM2Review).filter(
@@ -787,22 +931,49 @@ def get_reviews_by_session(db: Session, session_id: int):
         models.SM2Review.session_id == session_id
     ).all()
 
+def get_session_review_counts(db: Session, session_id: int):
+    """
+    Cuenta las revisiones de una sesión sin cargarlas
+    
+    Returns:
+        tuple: (total, correctas), donde correcta es quality >= 1 (Hard o Easy)
+    """
+    total, correctas = db.execute(
+        select(
+            func.count(),
+            func.coalesce(func.sum(case((models.SM2Review.quality >= 1, 1), else_=0)), 0)
+        ).where(models.SM2Review.session_id == session_id)
+    ).one()
+    return total, correctas
+
 # ============================================================================
 # FUNCIONES ESTADÍSTICAS
 # ============================================================================
 
+def _contar(modelo, *condiciones):
+    """Subconsulta escalar COUNT(*) sobre un modelo con condiciones opcionales"""
+    return select(func.count()).select_from(modelo).where(*condiciones).scalar_subquery()
+
 def get_sm2_statistics(db: Session):
-    """Obtiene estadísticas generales del sistema SM2"""
-    total_cards = db.query(models.Tarjeta).filter(models.Tarjeta.activa == True).count()
-    cards_with_progress = db.query(models.SM2Progress).count()
-    cards_due = db.query(models.SM2Progress).filter(
-        models.SM2Progress.next_review <= now_utc()  # ✅ FIX: Timezone consistente
-    ).count()
-    total_reviews = db.query(models.SM2Review).count()
+    """Obtiene estadísticas generales del sistema SM2 en una sola consulta"""
+    revisiones = func.coalesce(models.SM2Progress.total_reviews, 0)
+    
+    def contar_activas(condicion):
+        """Tarjetas activas (con o sin progreso) que cumplen la condición"""
+        return select(func.count()).select_from(models.Tarjeta).outerjoin(
+            models.SM2Progress, models.Tarjeta.id == models.SM2Progress.tarjeta_id
+        ).where(models.Tarjeta.activa == True, condicion).scalar_subquery()
     
-    return {
-        "total_tarjetas": total_cards,
-        "tarjetas_con_progreso": cards_with_progress,
-        "tarjetas_pendientes_revision": cards_due,
-        "total_revisiones": total_reviews
-    }
\ No newline at end of file
+    fila = db.execute(select(
+        _contar(models.Tarjeta, models.Tarjeta.activa == True).label("total_tarjetas"),
+        # Estudiadas y nuevas se reparten las activas: con revisiones o sin ellas
+        # (nuevas como en get_cards_due_for_review: sin progreso o sin revisiones)
+        contar_activas(revisiones > 0).label("tarjetas_estudiadas"),
+        contar_activas(revisiones == 0).label("tarjetas_nuevas"),
+        _contar(
+            models.SM2Progress,
+            models.SM2Progress.next_review <= now_utc()  # ✅ FIX: Timezone consistente
+        ).label("tarjetas_pendientes_revision"),
+        _contar(models.SM2Review).label("total_revisiones"),
+    )).one()
+    return dict(fila._mapping)
\ No newline at end of file
@@ -6,6 +6,14 @@ from typing import List, Optional
 from datetime import datetime
 
 
+# Caracteres/palabras SQL no permitidos en búsquedas, con su versión en
+# minúsculas precalculada (el validador se ejecuta en cada búsqueda)
+_SQL_PELIGROSO = tuple(
+    (patron, patron.lower())
+    for patron in (';', '--', '/*', '*/', 'xp_', 'sp_', 'DROP', 'DELETE', 'INSERT')
+)
+
+
 class ReviewRequest(BaseModel):
     """Request para revisar una tarjeta en SM2"""
     tarjeta_id: int = Field(..., gt=0, description="ID de la tarjeta")
@@ -49,12 +57,11 @@ class SearchQuery(BaseModel):
     def sanitize_query(cls, v):
         """Sanitiza y valida el query de búsqueda"""
         # Eliminar caracteres SQL peligrosos
-        dangerous = [';', '--', '/*', '*/', 'xp_', 'sp_', 'DROP', 'DELETE', 'INSERT']
         v_lower = v.lower()
         
-        for char in dangerous:
-            if char.lower() in v_lower:
-                raise ValueError(f"Carácter/palabra no permitida: {char}")
+        for patron, patron_lower in _SQL_PELIGROSO:
+            if patron_lower in v_lower:
+                raise ValueError(f"Carácter/palabra no permitida: {patron}")
         
         return v.strip()[:100]
 
@@ -102,7 +109,8 @@ class EjemploCreate(BaseModel):
     @validator('hanzi_ids')
     def validate_hanzi_ids(cls, v):
         """Valida que todos los IDs sean positivos"""
-        if not all(id > 0 for id in v):
+        # min() recorre la lista en C; min_items=1 garantiza que no está vacía
+        if min(v) <= 0:
             raise ValueError("Todos los IDs deben ser positivos")
         return v
 
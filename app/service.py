@@ -13,6 +13,51 @@ logger = logging.getLogger(__name__)
 # FUNCIONES DICCIONARIO
 # ============================================================================
 
+# Reglas de las 6 tarjetas de una palabra: (mostrado1, mostrado2, audio, requerido),
+# con los textos como índices sobre (hanzi, pinyin, español, "")
+_HANZI, _PINYIN, _ESPANOL, _VACIO = range(4)
+_REGLAS_TARJETAS = (
+    (_HANZI, _PINYIN, True, _ESPANOL),
+    (_HANZI, _VACIO, False, _ESPANOL),
+    (_VACIO, _VACIO, True, _ESPANOL),
+    (_ESPANOL, _PINYIN, True, _HANZI),
+    (_ESPANOL, _VACIO, True, _HANZI),
+    (_ESPANOL, _VACIO, False, _HANZI),
+)
+
+def generar_datos_tarjetas(fuente, hsk_id: int = None, diccionario_id: int = None,
+                           ejemplo_id: int = None):
+    """
+    Genera los datos de las 6 tarjetas de una palabra HSK o de un ejemplo
+    
+    Args:
+        fuente: Objeto con hanzi, pinyin y espanol (HSK o Ejemplo)
+        hsk_id, diccionario_id, ejemplo_id: Claves de las tarjetas generadas
+    
+    Returns:
+        list[dict]: Un dict de columnas de Tarjeta por cada regla
+    """
+    textos = (fuente.hanzi, fuente.pinyin, fuente.espanol, "")
+    
+    return [
+        {
+            "hsk_id": hsk_id,
+            "diccionario_id": diccionario_id,
+            "ejemplo_id": ejemplo_id,
+            "mostrado1": textos[m1] or None,
+            "mostrado2": textos[m2] or None,
+            "audio": aud,
+            "requerido": textos[req],
+            "activa": True
+        }
+        for m1, m2, aud, req in _REGLAS_TARJETAS
+    ]
+
+def _crear_tarjetas_con_progreso(db: Session, filas: list):
+    """Crea las tarjetas y su progreso inicial (un INSERT para cada tabla)"""
+    tarjeta_ids = repository.bulk_create_tarjetas(db, filas)
+    repository.bulk_create_progress(db, tarjeta_ids)
+
 @transactional  # ✅ Manejo automático de transacciones
 def agregar_palabra_y_generar_tarjetas(db: Session, hsk_id: int):
     """Agrega palabra al diccionario y genera 6 tarjetas"""
@@ -24,31 +69,12 @@ def agregar_palabra_y_generar_tarjetas(db: Session, hsk_id: int):
     # 1. Crear entrada en diccionario
     entrada_dict = repository.create_diccionario_entry(db, hsk_id)
     
-    # 2. Definir las 6 reglas
-    reglas = [
-        (palabra.hanzi, palabra.pinyin, True, palabra.espanol),
-        (palabra.hanzi, "", False, palabra.espanol),
-        ("", "", True, palabra.espanol),
-        (palabra.espanol, palabra.pinyin, True, palabra.hanzi),
-        (palabra.espanol, "", True, palabra.hanzi),
-        (palabra.espanol, "", False, palabra.hanzi),
-    ]
-    
-    # 3. Crear tarjetas y progreso inicial
-    for m1, m2, aud, req in reglas:
-        tarjeta = repository.create_tarjeta(db, {
-            "hsk_id": palabra.id,
-            "diccionario_id": entrada_dict.id,
-            "ejemplo_id": None,
-            "mostrado1": m1 if m1 else None,
-            "mostrado2": m2 if m2 else None,
-            "audio": aud,
-            "requerido": req,
-            "activa": True
-        })
-        repository.get_or_create_progress(db, tarjeta.id)
+    # 2. Crear las 6 tarjetas y su progreso inicial
+    _crear_tarjetas_con_progreso(db, generar_datos_tarjetas(
+        palabra, hsk_id=palabra.id, diccionario_id=entrada_dict.id
+    ))
     
-    # 4. Verificar si este hanzi activa algún ejemplo
+    # 3. Verificar si este hanzi activa algún ejemplo
     verificar_y_activar_ejemplos(db)
     
     logger.info(f"Palabra {hsk_id} agregada con 6 tarjetas")
@@ -62,52 +88,24 @@ def eliminar_palabra_y_tarjetas(db: Session, hsk_id: int):
         logger.warning(f"Palabra {hsk_id} no encontrada en diccionario")
         return False
     
-    repository.delete_tarjetas_by_diccionario_id(db, entrada.id)
-    repository.delete_diccionario_entry(db, entrada.id)
+    # El id se guarda antes: el commit de las tarjetas expira la entrada
+    diccionario_id = entrada.id
+    repository.delete_tarjetas_by_diccionario_id(db, diccionario_id)
+    repository.delete_diccionario_entry(db, diccionario_id)
     
     logger.info(f"Palabra {hsk_id} eliminada del diccionario")
     return True
 
 def obtener_diccionario_completo(db: Session):
     """Obtiene todas las palabras del diccionario"""
-    entradas = repository.get_all_diccionario_with_hsk(db)
-    
-    resultado = []
-    for diccionario, hsk in entradas:
-        resultado.append({
-            "id": diccionario.id,
-            "hsk_id": hsk.id,
-            "numero": hsk.numero,
-            "nivel": hsk.nivel,
-            "hanzi": hsk.hanzi,
-            "pinyin": hsk.pinyin,
-            "espanol": hsk.espanol,
-            "activo": diccionario.activo
-        })
-    
-    return resultado
+    return [dict(entrada) for entrada in repository.get_all_diccionario_with_hsk(db)]
 
 def buscar_en_diccionario(db: Session, query: str):
     """Busca palabras en el diccionario"""
     if not query or query.strip() == "":
         return obtener_diccionario_completo(db)
     
-    entradas = repository.search_diccionario(db, query)
-    
-    resultado = []
-    for diccionario, hsk in entradas:
-        resultado.append({
-            "id": diccionario.id,
-            "hsk_id": hsk.id,
-            "numero": hsk.numero,
-            "nivel": hsk.nivel,
-            "hanzi": hsk.hanzi,
-            "pinyin": hsk.pinyin,
-            "espanol": hsk.espanol,
-            "activo": diccionario.activo
-        })
-    
-    return resultado
+    return [dict(entrada) for entrada in repository.search_diccionario(db, query)]
 
 @transactional  # ✅ Manejo automático de transacciones
 def añadir_traduccion_alternativa(db: Session, hsk_id: int, traduccion: str):
@@ -240,27 +238,7 @@ def añadir_ejemplo_a_estudio(db: Session, ejemplo_id: int):
     repository.añadir_ejemplo_a_diccionario(db, ejemplo_id)
     
     # Generar las 6 tarjetas para el ejemplo
-    reglas = [
-        (ejemplo.hanzi, ejemplo.pinyin, True, ejemplo.espanol),
-        (ejemplo.hanzi, "", False, ejemplo.espanol),
-        ("", "", True, ejemplo.espanol),
-        (ejemplo.espanol, ejemplo.pinyin, True, ejemplo.hanzi),
-        (ejemplo.espanol, "", True, ejemplo.hanzi),
-        (ejemplo.espanol, "", False, ejemplo.hanzi),
-    ]
-    
-    for m1, m2, aud, req in reglas:
-        tarjeta = repository.create_tarjeta(db, {
-            "hsk_id": None,
-            "diccionario_id": None,
-            "ejemplo_id": ejemplo.id,
-            "mostrado1": m1 if m1 else None,
-            "mostrado2": m2 if m2 else None,
-            "audio": aud,
-            "requerido": req,
-            "activa": True
-        })
-        repository.get_or_create_progress(db, tarjeta.id)
+    _crear_tarjetas_con_progreso(db, generar_datos_tarjetas(ejemplo, ejemplo_id=ejemplo.id))
     
     # Verificar jerarquía y desactivar tarjetas de hanzi si procede
     gestionar_desactivacion_por_ejemplo(db, ejemplo_id)
@@ -268,10 +246,10 @@ def añadir_ejemplo_a_estudio(db: Session, ejemplo_id: int):
     logger.info(f"Ejemplo {ejemplo_id} añadido al estudio")
     return {"status": "ok", "message": "Ejemplo añadido al estudio"}
 
-@transactional  # ✅ Manejo automático de transacciones
 def gestionar_desactivacion_por_ejemplo(db: Session, ejemplo_id: int):
     """
     Cuando un ejemplo está dominado, desactiva las tarjetas de sus hanzi componentes
+    Sin commit: forma parte de la transacción del servicio que llama
     """
     # Obtener hanzi del ejemplo
     hanzi_relaciones = repository.get_hanzi_de_ejemplo(db, ejemplo_id)
@@ -321,10 +299,10 @@ def esta_ejemplo_dominado(db: Session, ejemplo_id: int):
     
     return True
 
-@transactional  # ✅ Manejo automático de transacciones
 def reactivar_hanzi_desde_ejemplo(db: Session, ejemplo_id: int, hanzi_fallados: list):
     """
     Reactiva las tarjetas de hanzi específicos que fallaron en un ejemplo
+    Sin commit: forma parte de la transacción del servicio que llama
     
     Args:
         hanzi_fallados: lista de hanzi (caracteres) que fallaron
@@ -466,34 +444,14 @@ def obtener_ejemplos_por_hanzi(db: Session, hsk_id: int):
 
 def obtener_tarjetas_completas(db: Session):
     """Obtiene todas las tarjetas con información"""
-    tarjetas = repository.get_all_tarjetas_with_info(db)
-    
-    resultado = []
-    for tarjeta, hsk in tarjetas:
-        # Solo procesar tarjetas de palabras (no ejemplos por ahora)
-        if tarjeta.hsk_id and hsk:
-            resultado.append({
-                "id": tarjeta.id,
-                "hsk_id": tarjeta.hsk_id,
-                "diccionario_id": tarjeta.diccionario_id,
-                "ejemplo_id": tarjeta.ejemplo_id,
-                "hanzi": hsk.hanzi,
-                "pinyin": hsk.pinyin,
-                "espanol": hsk.espanol,
-                "mostrado1": tarjeta.mostrado1,
-                "mostrado2": tarjeta.mostrado2,
-                "audio": tarjeta.audio,
-                "requerido": tarjeta.requerido,
-                "activa": tarjeta.activa
-            })
-    
-    return resultado
+    # Solo tarjetas de palabras (no ejemplos por ahora): el JOIN con HSK ya las filtra
+    return [dict(tarjeta) for tarjeta in repository.get_all_tarjetas_with_info(db)]
 
 def obtener_estadisticas_tarjetas(db: Session):
     """Obtiene estadísticas sobre las tarjetas"""
     total_tarjetas = repository.get_tarjetas_count(db)
-    total_palabras = len(repository.get_diccionario_hsk_ids(db))
-    total_ejemplos = len(repository.get_ejemplos_en_diccionario(db))
+    total_palabras = repository.get_diccionario_count(db)
+    total_ejemplos = repository.get_ejemplos_en_diccionario_count(db)
     
     return {
         "total_tarjetas": total_tarjetas,
@@ -506,6 +464,20 @@ def obtener_estadisticas_tarjetas(db: Session):
 # FUNCIONES SM2
 # ============================================================================
 
+# Mapeo de quality 0-2 a escala original 0-5 para el cálculo
+_QUALITY_SM2_ORIGINAL = {
+    0: 0,  # Again -> 0 (olvidé completamente)
+    1: 3,  # Hard -> 3 (recordé con dificultad)
+    2: 5   # Easy -> 5 (perfecto)
+}
+
+# Variación del factor de facilidad para cada quality. Solo depende de la
+# quality, así que la fórmula SM2 se evalúa una vez al importar
+_DELTA_FACILIDAD = {
+    quality: 0.1 - (5 - q_original) * (0.08 + (5 - q_original) * 0.02)
+    for quality, q_original in _QUALITY_SM2_ORIGINAL.items()
+}
+
 def calcular_sm2_simplificado(quality: int, easiness: float, repetitions: int, interval: int):
     """
     Algoritmo SM2 modificado para escala 0-2
@@ -519,17 +491,8 @@ def calcular_sm2_simplificado(quality: int, easiness: float, repetitions: int, i
     Returns:
         tuple: (new_easiness, new_repetitions, new_interval, new_estado)
     """
-    # Mapeo de quality 0-2 a escala original 0-5 para el cálculo
-    quality_map = {
-        0: 0,  # Again -> 0 (olvidé completamente)
-        1: 3,  # Hard -> 3 (recordé con dificultad)
-        2: 5   # Easy -> 5 (perfecto)
-    }
-    
-    q_original = quality_map[quality]
-    
     # Calcular nuevo factor de facilidad
-    new_easiness = easiness + (0.1 - (5 - q_original) * (0.08 + (5 - q_original) * 0.02))
+    new_easiness = easiness + _DELTA_FACILIDAD[quality]
     
     # Límite mínimo de facilidad
     if new_easiness < 1.3:
@@ -581,52 +544,24 @@ def obtener_tarjetas_para_estudiar(db: Session, limite: int = 20):
     """Obtiene tarjetas ACTIVAS que necesitan revisión"""
     tarjetas_data = repository.get_cards_due_for_review(db, limite)
     
+    # Hanzi componentes de todos los ejemplos en una sola consulta
+    ejemplo_ids = {fila["ejemplo_id"] for fila in tarjetas_data if not fila["hsk_id"]}
+    componentes = repository.get_hanzi_de_ejemplos(db, ejemplo_ids) if ejemplo_ids else {}
+    
     resultado = []
-    for tarjeta, hsk, progress, ejemplo in tarjetas_data:
+    for fila in tarjetas_data:
+        tarjeta = dict(fila)
         # Determinar si es palabra o ejemplo
-        if tarjeta.hsk_id:
-            # Es una palabra
-            resultado.append({
-                "tarjeta_id": tarjeta.id,
-                "tipo": "palabra",
-                "hsk_id": hsk.id,
-                "hanzi": hsk.hanzi,
-                "pinyin": hsk.pinyin,
-                "espanol": hsk.espanol,
-                "mostrado1": tarjeta.mostrado1,
-                "mostrado2": tarjeta.mostrado2,
-                "audio": tarjeta.audio,
-                "requerido": tarjeta.requerido,
-                "es_nueva": progress is None or progress.total_reviews == 0,
-                "repeticiones": progress.repetitions if progress else 0,
-                "facilidad": progress.easiness_factor if progress else 2.5,
-                "estado": progress.estado if progress else "nuevo",
-                "proxima_revision": progress.next_review.isoformat() if progress else None
-            })
-        elif tarjeta.ejemplo_id:
-            # Es un ejemplo
-            # Obtener hanzi componentes
-            hanzi_relaciones = repository.get_hanzi_de_ejemplo(db, ejemplo.id)
-            hanzi_componentes = [hsk_rel.hanzi for rel, hsk_rel in hanzi_relaciones]
-            
-            resultado.append({
-                "tarjeta_id": tarjeta.id,
-                "tipo": "ejemplo",
-                "ejemplo_id": ejemplo.id,
-                "hanzi": ejemplo.hanzi,
-                "pinyin": ejemplo.pinyin,
-                "espanol": ejemplo.espanol,
-                "hanzi_componentes": hanzi_componentes,
-                "mostrado1": tarjeta.mostrado1,
-                "mostrado2": tarjeta.mostrado2,
-                "audio": tarjeta.audio,
-                "requerido": tarjeta.requerido,
-                "es_nueva": progress is None or progress.total_reviews == 0,
-                "repeticiones": progress.repetitions if progress else 0,
-                "facilidad": progress.easiness_factor if progress else 2.5,
-                "estado": progress.estado if progress else "nuevo",
-                "proxima_revision": progress.next_review.isoformat() if progress else None
-            })
+        if tarjeta["hsk_id"]:
+            tarjeta["tipo"] = "palabra"
+            del tarjeta["ejemplo_id"]
+        else:
+            tarjeta["tipo"] = "ejemplo"
+            del tarjeta["hsk_id"]
+            tarjeta["hanzi_componentes"] = componentes.get(tarjeta["ejemplo_id"], [])
+        if tarjeta["proxima_revision"]:
+            tarjeta["proxima_revision"] = tarjeta["proxima_revision"].isoformat()
+        resultado.append(tarjeta)
     
     logger.debug(f"Devueltas {len(resultado)} tarjetas para estudiar")
     return resultado
@@ -646,79 +581,144 @@ def procesar_respuesta(db: Session, tarjeta_id: int, session_id: int, quality: i
     if quality < 0 or quality > 2:
         return {"error": "Quality debe estar entre 0 y 2"}
     
-    # Obtener tarjeta y progreso
-    tarjeta = db.query(models.Tarjeta).filter(
-        models.Tarjeta.id == tarjeta_id
-    ).first()
-    
-    if not tarjeta:
+    tarjetas = repository.get_tarjetas_by_ids(db, [tarjeta_id])
+    if not tarjetas:
         logger.warning(f"Tarjeta {tarjeta_id} no encontrada")
         return {"error": "Tarjeta no encontrada"}
     
-    progress = repository.get_or_create_progress(db, tarjeta_id)
-    
-    # Guardar valores anteriores
-    prev_easiness = progress.easiness_factor
-    prev_interval = progress.interval
-    prev_repetitions = progress.repetitions
-    prev_estado = progress.estado
-    
-    # Calcular nuevos valores con SM2
-    new_easiness, new_repetitions, new_interval, new_estado = calcular_sm2_simplificado(
-        quality, prev_easiness, prev_repetitions, prev_interval
-    )
-    
-    # Calcular fecha de próxima revisión
-    next_review = now_utc() + timedelta(days=new_interval)  # ✅ FIX: Timezone consistente
+    # Una respuesta es un lote de uno: mismo cálculo y mismas escrituras
+    resultado, = _aplicar_respuestas(db, [{
+        "tarjeta_id": tarjeta_id,
+        "session_id": session_id,
+        "quality": quality,
+        "hanzi_fallados": hanzi_fallados,
+        "frase_fallada": frase_fallada,
+        "respuesta_usuario": respuesta_usuario
+    }], tarjetas)
     
-    # Actualizar progreso
-    repository.update_progress(db, tarjeta_id, new_easiness, new_repetitions, 
-                              new_interval, next_review, new_estado)
+    logger.info(f"Respuesta procesada - Tarjeta: {tarjeta_id}, Quality: {quality}, Nuevo estado: {resultado['nuevo_estado']}")
+    return resultado
+
+@transactional  # ✅ Manejo automático de transacciones
+def procesar_respuestas(db: Session, respuestas: list):
+    """
+    Procesa en orden un lote de respuestas de una sesión
     
-    # Actualizar estadísticas
-    is_correct = quality >= 1
-    repository.increment_progress_stats(db, tarjeta_id, is_correct)
+    El lote es una sola transacción: ningún paso hace commit y @transactional
+    confirma una vez al final, o lo revierte entero si algo falla.
     
-    # Registrar revisión
-    repository.create_review(
-        db, tarjeta_id, session_id, quality,
-        prev_easiness, new_easiness,
-        prev_interval, new_interval,
-        prev_estado, new_estado,
-        hanzi_fallados, frase_fallada,
-        respuesta_usuario
-    )
+    Args:
+        respuestas: Lista de dicts con los argumentos de procesar_respuesta
     
-    # Si es un ejemplo y fallaron hanzi específicos, reactivarlos
-    if tarjeta.ejemplo_id and hanzi_fallados and len(hanzi_fallados) > 0:
-        reactivar_hanzi_desde_ejemplo(db, tarjeta.ejemplo_id, hanzi_fallados)
+    Returns:
+        list[dict] con el resultado de cada respuesta, o {"error": ...} sin
+        aplicar ninguna si alguna tarjeta no existe
+    """
+    ids = {r["tarjeta_id"] for r in respuestas}
+    tarjetas = repository.get_tarjetas_by_ids(db, ids)
+    faltantes = ids - tarjetas.keys()
+    if faltantes:
+        logger.warning(f"Tarjetas no encontradas en el lote: {sorted(faltantes)}")
+        return {"error": f"Tarjetas no encontradas: {sorted(faltantes)}"}
+    
+    resultados = _aplicar_respuestas(db, respuestas, tarjetas)
+    logger.info(f"Lote de {len(respuestas)} respuestas procesado")
+    return resultados
+
+def _aplicar_respuestas(db: Session, respuestas: list, tarjetas: dict):
+    """
+    Aplica SM2 a las respuestas, en orden, sobre tarjetas ya comprobadas
     
-    # Si es un ejemplo y ahora está dominado, gestionar desactivaciones
-    if tarjeta.ejemplo_id and new_estado in ['dominada', 'madura']:
-        gestionar_desactivacion_por_ejemplo(db, tarjeta.ejemplo_id)
+    El progreso se lee con una consulta y se actualiza en memoria (una tarjeta
+    puede repetirse en el lote) y las revisiones se escriben en un único
+    INSERT al final. Los efectos sobre ejemplos y hanzi de cada respuesta se
+    aplican justo después de calcularla, como si el lote se procesara de una
+    en una: pueden reiniciar el progreso de tarjetas que aparecen más adelante.
+    Nada de esto hace commit: el servicio que llama confirma o revierte el
+    lote entero, así que un error a mitad no deja progreso sin su revisión.
     
-    # Si es un hanzi y ahora está dominado, verificar ejemplos
-    if tarjeta.hsk_id and new_estado in ['dominada', 'madura']:
-        verificar_y_activar_ejemplos(db)
+    Args:
+        tarjetas: dict id -> Tarjeta con todas las tarjetas de las respuestas
+    """
+    progresos = repository.get_or_create_progress_many(db, tarjetas.keys())
+    ahora = now_utc()  # Una sola lectura del reloj para todo el lote
+    
+    resultados = []
+    revisiones = []
+    for r in respuestas:
+        progress = progresos[r["tarjeta_id"]]
+        quality = r["quality"]
+        
+        prev_easiness = progress.easiness_factor
+        prev_interval = progress.interval
+        prev_estado = progress.estado
+        
+        new_easiness, new_repetitions, new_interval, new_estado = calcular_sm2_simplificado(
+            quality, prev_easiness, progress.repetitions, prev_interval
+        )
+        next_review = ahora + timedelta(days=new_interval)
+        is_correct = quality >= 1
+        
+        progress.easiness_factor = new_easiness
+        progress.repetitions = new_repetitions
+        progress.interval = new_interval
+        progress.next_review = next_review
+        progress.estado = new_estado
+        progress.last_review = ahora
+        progress.version += 1
+        progress.total_reviews += 1
+        if is_correct:
+            progress.correct_reviews += 1
+        
+        revisiones.append({
+            "tarjeta_id": r["tarjeta_id"],
+            "session_id": r["session_id"],
+            "quality": quality,
+            "respuesta_usuario": r.get("respuesta_usuario"),
+            "previous_easiness": prev_easiness,
+            "new_easiness": new_easiness,
+            "previous_interval": prev_interval,
+            "new_interval": new_interval,
+            "previous_estado": prev_estado,
+            "new_estado": new_estado,
+            "hanzi_fallados": r.get("hanzi_fallados"),
+            "frase_fallada": r.get("frase_fallada", False)
+        })
+        resultados.append({
+            "success": True,
+            "nueva_facilidad": round(new_easiness, 2),
+            "nuevo_intervalo": new_interval,
+            "nuevo_estado": new_estado,
+            "proxima_revision": next_review.isoformat(),
+            "es_correcta": is_correct
+        })
+        
+        # Efectos sobre ejemplos y hanzi (actualizan los mismos objetos de
+        # progresos, así que las respuestas siguientes ya los ven)
+        tarjeta = tarjetas[r["tarjeta_id"]]
+        dominada = new_estado in ['dominada', 'madura']
+        
+        # Si es un ejemplo y fallaron hanzi específicos, reactivarlos
+        if tarjeta.ejemplo_id and r.get("hanzi_fallados"):
+            reactivar_hanzi_desde_ejemplo(db, tarjeta.ejemplo_id, r["hanzi_fallados"])
+        
+        # Si es un ejemplo y ahora está dominado, gestionar desactivaciones
+        if tarjeta.ejemplo_id and dominada:
+            gestionar_desactivacion_por_ejemplo(db, tarjeta.ejemplo_id)
+        
+        # Si es un hanzi y ahora está dominado, verificar ejemplos
+        if tarjeta.hsk_id and dominada:
+            verificar_y_activar_ejemplos(db)
     
-    logger.info(f"Respuesta procesada - Tarjeta: {tarjeta_id}, Quality: {quality}, Nuevo estado: {new_estado}")
+    repository.bulk_create_reviews(db, revisiones)
+    db.flush()
     
-    return {
-        "success": True,
-        "nueva_facilidad": round(new_easiness, 2),
-        "nuevo_intervalo": new_interval,
-        "nuevo_estado": new_estado,
-        "proxima_revision": next_review.isoformat(),
-        "es_correcta": is_correct
-    }
+    return resultados
 
 @transactional  # ✅ Manejo automático de transacciones
 def finalizar_sesion_estudio(db: Session, session_id: int):
     """Finaliza una sesión de estudio y calcula estadísticas"""
-    reviews = repository.get_reviews_by_session(db, session_id)
-    
-    estudiadas = len(reviews)
-    correctas = sum(1 for r in reviews if r.quality >= 1)
+    estudiadas, correctas = repository.get_session_review_counts(db, session_id)
     incorrectas = estudiadas - correctas
     
     session = repository.update_sm2_session(db, session_id, estudiadas, correctas, incorrectas)
@@ -737,40 +737,36 @@ def obtener_estadisticas_sm2(db: Session):
     """Obtiene estadísticas generales del sistema SM2"""
     stats = repository.get_sm2_statistics(db)
     
-    # Tarjetas nuevas (sin progreso)
-    tarjetas_nuevas = stats["total_tarjetas"] - stats["tarjetas_con_progreso"]
-    
     return {
         "total_tarjetas": stats["total_tarjetas"],
-        "tarjetas_estudiadas": stats["tarjetas_con_progreso"],
-        "tarjetas_nuevas": tarjetas_nuevas,
+        "tarjetas_estudiadas": stats["tarjetas_estudiadas"],
+        "tarjetas_nuevas": stats["tarjetas_nuevas"],
         "tarjetas_pendientes_hoy": stats["tarjetas_pendientes_revision"],
         "total_revisiones": stats["total_revisiones"]
     }
 
 def obtener_progreso_detallado(db: Session):
     """Obtiene el progreso detallado de todas las tarjetas"""
-    progreso_data = repository.get_all_progress_with_cards(db)
-    
-    resultado = []
-    for progress, tarjeta, hsk in progreso_data:
-        resultado.append({
-            "tarjeta_id": tarjeta.id,
-            "tipo": "palabra" if tarjeta.hsk_id else "ejemplo",
-            "hanzi": hsk.hanzi if hsk else None,
-            "pinyin": hsk.pinyin if hsk else None,
-            "espanol": hsk.espanol if hsk else None,
-            "facilidad": round(progress.easiness_factor, 2),
-            "repeticiones": progress.repetitions,
-            "intervalo_dias": progress.interval,
-            "estado": progress.estado,
-            "proxima_revision": progress.next_review.isoformat(),
-            "total_revisiones": progress.total_reviews,
-            "revisiones_correctas": progress.correct_reviews,
-            "tasa_acierto": round((progress.correct_reviews / progress.total_reviews * 100) 
-                                  if progress.total_reviews > 0 else 0, 1),
-            "ultima_revision": progress.last_review.isoformat() if progress.last_review else None,
-            "activa": tarjeta.activa
-        })
-    
-    return resultado
\ No newline at end of file
+    # Las filas se desempaquetan en el orden de columnas de get_all_progress_with_cards
+    return [
+        {
+            "tarjeta_id": tarjeta_id,
+            "tipo": "palabra" if hsk_id else "ejemplo",
+            "hanzi": hanzi,
+            "pinyin": pinyin,
+            "espanol": espanol,
+            "facilidad": round(facilidad, 2),
+            "repeticiones": repeticiones,
+            "intervalo_dias": intervalo,
+            "estado": estado,
+            "proxima_revision": proxima.isoformat(),
+            "total_revisiones": total,
+            "revisiones_correctas": correctas,
+            "tasa_acierto": round(correctas * 100 / max(total, 1), 1),
+            "ultima_revision": ultima.isoformat() if ultima else None,
+            "activa": activa
+        }
+        for (tarjeta_id, hsk_id, activa, hanzi, pinyin, espanol, facilidad, repeticiones,
+             intervalo, estado, proxima, total, correctas, ultima)
+        in repository.get_all_progress_with_cards(db)
+    ]
\ No newline at end of file
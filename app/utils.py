@@ -2,7 +2,9 @@
 Utilidades comunes para el proyecto Chiknow
 """
 from datetime import datetime, timezone
+from itertools import chain
 from typing import Optional
+import re
 import unicodedata
 
 
@@ -16,6 +18,30 @@ def now_utc() -> datetime:
     return datetime.now(timezone.utc)
 
 
+def _quitar_diacriticos(text: str) -> str:
+    """Descompone el texto (NFD) y elimina las marcas diacríticas"""
+    nfd = unicodedata.normalize('NFD', text)
+    return ''.join(
+        c for c in nfd 
+        if unicodedata.category(c) != 'Mn'
+    )
+
+
+# Tabla de traducción para los caracteres latinos precompuestos (acentos, ñ,
+# tonos del pinyin...) y las marcas combinantes más comunes, calculada una vez
+# con la misma regla que normalize_text
+_TABLA_DIACRITICOS = str.maketrans({
+    c: _quitar_diacriticos(c)
+    for c in map(chr, chain(range(0xC0, 0x370), range(0x1E00, 0x1F00)))
+    if _quitar_diacriticos(c) != c
+})
+
+# Caracteres fuera de los rangos que la tabla deja resueltos: latín, puntuación
+# CJK, hanzi y formas de ancho completo (tras traducir, ninguno de esos cambia
+# al descomponerlo ni es una marca diacrítica)
+_FUERA_DE_TABLA = re.compile(r'[^\x00-\u02ff\u3000-\u3029\u4e00-\u9fff\uff00-\uffef]')
+
+
 def normalize_text(text: str) -> str:
     """
     Normaliza texto removiendo acentos y marcas diacríticas
@@ -33,14 +59,13 @@ def normalize_text(text: str) -> str:
     if not text:
         return ""
     
-    # Descomponer caracteres Unicode
-    nfd = unicodedata.normalize('NFD', text)
+    # Caso habitual (español, pinyin, hanzi): basta con la tabla precalculada
+    text = text.translate(_TABLA_DIACRITICOS)
+    if not _FUERA_DE_TABLA.search(text):
+        return text
     
-    # Eliminar marcas diacríticas
-    return ''.join(
-        c for c in nfd 
-        if unicodedata.category(c) != 'Mn'
-    )
+    # Marcas combinantes sueltas u otros alfabetos: descomposición completa
+    return _quitar_diacriticos(text)
 
 
 def sanitize_input(text: str, max_length: int = 500) -> str:
@@ -71,16 +96,7 @@ def sanitize_input(text: str, max_length: int = 500) -> str:
     return text
 
 
-def format_interval_display(days: int) -> str:
-    """
-    Formatea intervalo de días para display
-    
-    Args:
-        days: Número de días
-        
-    Returns:
-        str: Texto formateado (ej: "5d", "2m", "1y")
-    """
+def _formatear_intervalo(days: int) -> str:
     if days < 1:
         return "<1d"
     elif days < 30:
@@ -91,3 +107,22 @@ def format_interval_display(days: int) -> str:
     else:
         years = days // 365
         return f"{years}y"
+
+
+# Textos precalculados para el primer año, donde caen casi todos los intervalos
+_INTERVALOS_PRIMER_AÑO = tuple(_formatear_intervalo(d) for d in range(365))
+
+
+def format_interval_display(days: int) -> str:
+    """
+    Formatea intervalo de días para display
+    
+    Args:
+        days: Número de días
+        
+    Returns:
+        str: Texto formateado (ej: "5d", "2m", "1y")
+    """
+    if type(days) is int and 0 <= days < 365:
+        return _INTERVALOS_PRIMER_AÑO[days]
+    return _formatear_intervalo(days)
@@ -31,11 +31,18 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspa
 from app.database import SessionLocal, engine, Base
 from app import models
 
+# Separadores que se eliminan al comparar nombres de columnas
+_WS_RE = re.compile(r'[_\s]+')
+
 def normalizar_nombre_columna(nombre):
     """
     Normaliza nombres de columnas para hacerlos comparables
     Elimina TODOS los acentos y marcas diacríticas, convierte a minúsculas
     """
+    # Quick Check: un nombre ASCII no tiene acentos, no hace falta NFD
+    if nombre.isascii():
+        return _WS_RE.sub('', nombre.lower().strip())
+    
     # Normalizar a NFD (descomponer caracteres con acentos)
     nombre_nfd = unicodedata.normalize('NFD', nombre)
     
@@ -49,7 +56,7 @@ def normalizar_nombre_columna(nombre):
     nombre_limpio = nombre_ascii.lower().strip()
     
     # Eliminar guiones bajos y espacios para comparación
-    nombre_comparable = re.sub(r'[_\s]+', '', nombre_limpio)
+    nombre_comparable = _WS_RE.sub('', nombre_limpio)
     
     return nombre_comparable
 
@@ -175,7 +182,8 @@ def cargar_ejemplos_desde_csv(csv_path: str = "data/ejemplos.csv"):
                 ejemplo_id = idx + 1
             
             # Buscar si existe
-            existing = db.query(models.Ejemplo).filter(models.Ejemplo.id == ejemplo_id).first()
+            # Session.get consulta primero el identity map (sin compilar SQL)
+            existing = db.get(models.Ejemplo, ejemplo_id)
             
             # Preparar datos básicos usando mapeo
             datos = {
@@ -232,7 +240,7 @@ def cargar_ejemplos_desde_csv(csv_path: str = "data/ejemplos.csv"):
                     
                     for posicion, hsk_id in enumerate(hanzi_ids, start=1):
                         # Verificar que el hanzi existe
-                        hanzi_existe = db.query(models.HSK).filter(models.HSK.id == hsk_id).first()
+                        hanzi_existe = db.get(models.HSK, hsk_id)
                         if hanzi_existe:
                             relacion = models.HSKEjemplo(
                                 hsk_id=hsk_id,
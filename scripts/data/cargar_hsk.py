@@ -17,6 +17,8 @@ NOTA: El script detecta automáticamente las rutas correctas
 
 import sys
 import os
+import functools
+import logging
 import pandas as pd
 from sqlalchemy.orm import Session
 import unicodedata
@@ -49,78 +51,103 @@ print(f"📁 Directorio de trabajo actual: {os.getcwd()}")
 from app.database import SessionLocal, engine, Base
 import app.models as models
 
+logger = logging.getLogger(__name__)
+
+# Salida de depuración opcional: CHIKNOW_DEBUG=1 python scripts/data/cargar_hsk.py
+DEBUG = os.environ.get('CHIKNOW_DEBUG') == '1'
+
 # ============================================================================
 # FUNCIONES
 # ============================================================================
 
+# Separadores que se eliminan al comparar nombres de columnas
+_WS_RE = re.compile(r'[_\s]+')
+
+@functools.lru_cache(maxsize=256)
 def normalizar_nombre_columna(nombre):
     """
     Normaliza nombres de columnas para hacerlos comparables
     Elimina TODOS los acentos y marcas diacríticas, convierte a minúsculas
+
+    Los nombres ASCII no tienen marcas diacríticas, así que se saltan la
+    descomposición NFD (caso habitual en las cabeceras del CSV).
     """
+    if nombre.isascii():
+        return _WS_RE.sub('', nombre.lower().strip())
+    
     nombre_nfd = unicodedata.normalize('NFD', nombre)
     nombre_ascii = ''.join(
         c for c in nombre_nfd 
         if unicodedata.category(c) != 'Mn'
     )
     nombre_limpio = nombre_ascii.lower().strip()
-    nombre_comparable = re.sub(r'[_\s]+', '', nombre_limpio)
+    nombre_comparable = _WS_RE.sub('', nombre_limpio)
     return nombre_comparable
 
+# Variaciones conocidas de cada columna, ya normalizadas con
+# normalizar_nombre_columna (sin acentos, minúsculas, sin '_' ni espacios)
+_VARIACIONES = {
+    'nivel': 'nivel',
+    'level': 'nivel',
+    'hanzi': 'hanzi',
+    'caracteres': 'hanzi',
+    'pinyin': 'pinyin',
+    'romanizacion': 'pinyin',
+    'espanol': 'espanol',
+    'spanish': 'espanol',
+    'traduccion': 'espanol',
+    'hanzialt': 'hanzi_alt',
+    'hanzialternativo': 'hanzi_alt',
+    'pinyinalt': 'pinyin_alt',
+    'pinyinalternativo': 'pinyin_alt',
+    'categoria': 'categoria',
+    'category': 'categoria',
+    'tipo': 'categoria',
+    'ejemplo': 'ejemplo',
+    'example': 'ejemplo',
+    'sample': 'ejemplo',
+    'significadoejemplo': 'significado_ejemplo',
+    'examplemeaning': 'significado_ejemplo',
+}
+
 def mapear_columnas(columnas_csv):
     """
     Crea un mapeo entre nombres de columnas del CSV y nombres estándar
     """
-    variaciones = {
-        'nivel': 'nivel',
-        'level': 'nivel',
-        'hanzi': 'hanzi',
-        'hanzi': 'hanzi',
-        'caracteres': 'hanzi',
-        'pinyin': 'pinyin',
-        'pinyin': 'pinyin',
-        'romanizacion': 'pinyin',
-        'español': 'espanol',
-        'espanol': 'espanol',
-        'spanish': 'espanol',
-        'traduccion': 'espanol',
-        'hanzialt': 'hanzi_alt',
-        'hanzi_alt': 'hanzi_alt',
-        'hanzialternativo': 'hanzi_alt',
-        'pinyinalt': 'pinyin_alt',
-        'pinyin_alt': 'pinyin_alt',
-        'pinyinalternativo': 'pinyin_alt',
-        'categoria': 'categoria',
-        'categoria': 'categoria',
-        'category': 'categoria',
-        'tipo': 'categoria',
-        'ejemplo': 'ejemplo',
-        'example': 'ejemplo',
-        'sample': 'ejemplo',
-        'significadoejemplo': 'significado_ejemplo',
-        'significado_ejemplo': 'significado_ejemplo',
-        'significado ejemplo': 'significado_ejemplo',
-        'examplemeaning': 'significado_ejemplo',
-    }
-    
     mapeo = {}
-    mapeo_debug = {}
+    # El detalle de normalización solo se construye con CHIKNOW_DEBUG=1
+    mapeo_debug = {} if DEBUG else None
     
     for col_csv in columnas_csv:
         col_normalizada = normalizar_nombre_columna(col_csv)
-        mapeo_debug[col_csv] = col_normalizada
+        if mapeo_debug is not None:
+            mapeo_debug[col_csv] = col_normalizada
         
-        if col_normalizada in variaciones:
-            nombre_estandar = variaciones[col_normalizada]
+        if col_normalizada in _VARIACIONES:
+            nombre_estandar = _VARIACIONES[col_normalizada]
             mapeo[nombre_estandar] = col_csv
     
-    print(f"\n🔍 Debug - Columnas normalizadas:")
-    for original, normalizada in mapeo_debug.items():
-        encontrada = "✅" if normalizada in variaciones else "❌"
-        print(f"   {encontrada} '{original}' → '{normalizada}'")
+    if mapeo_debug is not None:
+        logger.debug("🔍 Debug - Columnas normalizadas:")
+        for original, normalizada in mapeo_debug.items():
+            encontrada = "✅" if normalizada in _VARIACIONES else "❌"
+            logger.debug("   %s '%s' → '%s'", encontrada, original, normalizada)
     
     return mapeo
 
+def leer_csv(csv_path):
+    """
+    Lee el CSV con el motor de pyarrow (multihilo, cadenas sin copia)
+    Si pyarrow no está instalado, usa el motor C
+    
+    Ningún motor fuerza tipos por nombre de columna: las cabeceras aún no están
+    normalizadas, y el nivel se convierte a int fila a fila al importarlo.
+    """
+    try:
+        return pd.read_csv(csv_path, engine='pyarrow', dtype_backend='pyarrow')
+    except ImportError:
+        return pd.read_csv(csv_path, engine='c')
+
 def cargar_hsk_desde_csv(csv_path: str = None):
     """
     Carga o actualiza datos de HSK desde CSV
@@ -143,7 +170,7 @@ def cargar_hsk_desde_csv(csv_path: str = None):
     # Leer CSV
     print(f"\n📖 Leyendo {csv_path}...")
     try:
-        df = pd.read_csv(csv_path)
+        df = leer_csv(csv_path)
     except FileNotFoundError:
         print(f"❌ Error: No se encontró el archivo {csv_path}")
         return False
@@ -180,56 +207,70 @@ def cargar_hsk_desde_csv(csv_path: str = None):
         registros_nuevos = 0
         registros_actualizados = 0
         
-        for idx, row in df.iterrows():
-            # Generar ID basado en el índice
-            hsk_id = idx + 1
+        # Una única transacción explícita para toda la importación
+        with db.begin():
+            # IDs ya presentes en la BD (una sola consulta en vez de una por fila)
+            existing_ids = {i for (i,) in db.query(models.HSK.id).all()}
             
-            # Buscar si existe el registro
-            existing = db.query(models.HSK).filter(models.HSK.id == hsk_id).first()
+            # Filas acumuladas para escribirlas en bloque al final
+            update_dicts = []
+            new_dicts = []
             
-            # Preparar datos
-            datos = {
-                'id': hsk_id,
-                'numero': hsk_id,
+            # Posición de cada columna en las tuplas (+1: la posición 0 es el índice)
+            col_idx = {
+                std: df.columns.get_loc(csv_col) + 1 for std, csv_col in mapeo.items()
             }
+            campos_opcionales = [
+                c for c in ['hanzi_alt', 'pinyin_alt', 'categoria', 'ejemplo', 'significado_ejemplo']
+                if c in col_idx
+            ]
             
-            # Añadir campos requeridos
-            for campo_estandar in ['nivel', 'hanzi', 'pinyin', 'espanol']:
-                col_csv = mapeo[campo_estandar]
-                valor = row[col_csv]
+            for row in df.itertuples(index=True, name=None):
+                # Generar ID basado en el índice
+                idx = row[0]
+                hsk_id = idx + 1
                 
-                if campo_estandar == 'nivel':
-                    datos[campo_estandar] = int(valor) if pd.notna(valor) else 1
-                else:
-                    datos[campo_estandar] = str(valor).strip() if pd.notna(valor) else ''
-            
-            # Añadir campos opcionales
-            for campo_opcional in ['hanzi_alt', 'pinyin_alt', 'categoria', 'ejemplo', 'significado_ejemplo']:
-                if campo_opcional in mapeo:
-                    col_csv = mapeo[campo_opcional]
-                    valor = row[col_csv]
-                    datos[campo_opcional] = str(valor).strip() if pd.notna(valor) else None
-            
-            if existing:
-                # ACTUALIZAR
-                for key, value in datos.items():
-                    if key != 'id':
-                        setattr(existing, key, value)
-                registros_actualizados += 1
+                # Comprobar si existe el registro
+                is_update = hsk_id in existing_ids
                 
-                if (registros_actualizados % 100 == 0):
-                    print(f"   Actualizados: {registros_actualizados}")
-            else:
-                # CREAR
-                nuevo_registro = models.HSK(**datos)
-                db.add(nuevo_registro)
-                registros_nuevos += 1
+                # Preparar datos
+                datos = {
+                    'id': hsk_id,
+                    'numero': hsk_id,
+                }
                 
-                if (registros_nuevos % 100 == 0):
-                    print(f"   Nuevos: {registros_nuevos}")
-        
-        # Commit final
-        db.commit()
+                # Añadir campos requeridos
+                for campo_estandar in ['nivel', 'hanzi', 'pinyin', 'espanol']:
+                    valor = row[col_idx[campo_estandar]]
+                    
+                    if campo_estandar == 'nivel':
+                        datos[campo_estandar] = int(valor) if pd.notna(valor) else 1
+                    else:
+                        datos[campo_estandar] = str(valor).strip() if pd.notna(valor) else ''
+                
+                # Añadir campos opcionales
+                for campo_opcional in campos_opcionales:
+                    valor = row[col_idx[campo_opcional]]
+                    datos[campo_opcional] = str(valor).strip() if pd.notna(valor) else None
+                
+                if is_update:
+                    # ACTUALIZAR (bulk_update_mappings localiza la fila por 'id')
+                    update_dicts.append(datos)
+                    registros_actualizados += 1
+                    
+                    if (registros_actualizados % 100 == 0):
+                        logger.info("   Actualizados: %d", registros_actualizados)
+                else:
+                    # CREAR
+                    new_dicts.append(datos)
+                    registros_nuevos += 1
+                    
+                    if (registros_nuevos % 100 == 0):
+                        logger.info("   Nuevos: %d", registros_nuevos)
+            
+            # Escritura en bloque, sin construir instancias ORM fila a fila
+            db.bulk_update_mappings(models.HSK, update_dicts)
+            db.bulk_insert_mappings(models.HSK, new_dicts)
         
         print("\n" + "="*50)
         print("✅ IMPORTACIÓN COMPLETADA")
@@ -241,7 +282,7 @@ def cargar_hsk_desde_csv(csv_path: str = None):
         return True
         
     except Exception as e:
-        db.rollback()
+        # db.begin() ya ha hecho rollback al salir con excepción
         print(f"\n❌ Error durante la importación: {e}")
         import traceback
         traceback.print_exc()
@@ -251,6 +292,8 @@ def cargar_hsk_desde_csv(csv_path: str = None):
 
 def main():
     """Función principal"""
+    logging.basicConfig(level=logging.DEBUG if DEBUG else logging.INFO, format="%(message)s")
+    
     print("\n" + "="*50)
     print("🚀 CARGADOR DE DATOS HSK")
     print("="*50 + "\n")
@@ -7,11 +7,31 @@ Uso:
   python3 gestionar_ejemplos.py estadisticas    # Ver estadísticas detalladas
 """
 
+import re
 import sys
+from itertools import groupby
+from sqlalchemy import func, desc
 from database import SessionLocal
 import models
 import repository
 
+# Ideogramas CJK unificados (rango básico U+4E00–U+9FFF)
+_CJK_RE = re.compile(r'[\u4e00-\u9fff]')
+
+def _cargar_hsk_por_id_y_hanzi(db):
+    """Precarga la tabla HSK indexada por id y por hanzi (primer id gana)"""
+    hsk_by_id = {}
+    hsk_by_hanzi = {}
+    for h in db.query(models.HSK).order_by(models.HSK.id).all():
+        hsk_by_id[h.id] = h
+        hsk_by_hanzi.setdefault(h.hanzi, h)
+    return hsk_by_id, hsk_by_hanzi
+
+def _relaciones_por_ejemplo(db):
+    """Agrupa todas las relaciones HSK-Ejemplo por ejemplo_id en una pasada"""
+    all_rels = db.query(models.HSKEjemplo).order_by(models.HSKEjemplo.ejemplo_id).all()
+    return {k: list(v) for k, v in groupby(all_rels, key=lambda r: r.ejemplo_id)}
+
 def listar_ejemplos():
     """Lista todos los ejemplos cargados"""
     db = SessionLocal()
@@ -28,13 +48,18 @@ def listar_ejemplos():
             print("   Ejecuta: python3 cargar_ejemplos.py")
             return
         
+        # Hanzi componentes de todos los ejemplos en una sola consulta
+        rows = db.query(models.HSKEjemplo, models.HSK).join(
+            models.HSK, models.HSKEjemplo.hsk_id == models.HSK.id
+        ).order_by(
+            models.HSKEjemplo.ejemplo_id, models.HSKEjemplo.posicion
+        ).all()
+        relations_by_ej = {
+            k: list(v) for k, v in groupby(rows, key=lambda r: r[0].ejemplo_id)
+        }
+        
         for ej in ejemplos:
-            # Obtener hanzi componentes
-            relaciones = db.query(models.HSKEjemplo, models.HSK).join(
-                models.HSK, models.HSKEjemplo.hsk_id == models.HSK.id
-            ).filter(
-                models.HSKEjemplo.ejemplo_id == ej.id
-            ).order_by(models.HSKEjemplo.posicion).all()
+            relaciones = relations_by_ej.get(ej.id, [])
             
             estado = "✓" if ej.activado else "○"
             en_dict = "📚" if ej.en_diccionario else "  "
@@ -74,22 +99,24 @@ def analizar_y_completar_relaciones():
         ejemplos_sin_relaciones = []
         ejemplos_con_hanzi_faltantes = []
         
+        # Precargar HSK y relaciones para no consultar por cada ejemplo
+        hsk_by_id, hsk_by_hanzi = _cargar_hsk_por_id_y_hanzi(db)
+        relations_by_ej = _relaciones_por_ejemplo(db)
+        
         for ej in ejemplos:
             # Obtener relaciones existentes
-            relaciones = db.query(models.HSKEjemplo).filter(
-                models.HSKEjemplo.ejemplo_id == ej.id
-            ).all()
+            relaciones = relations_by_ej.get(ej.id, [])
             
             if not relaciones:
                 ejemplos_sin_relaciones.append(ej)
                 continue
             
             # Analizar cada hanzi de la frase
-            hanzi_en_frase = [c for c in ej.hanzi if '\u4e00' <= c <= '\u9fff']
+            hanzi_en_frase = _CJK_RE.findall(ej.hanzi)
             hanzi_relacionados = set()
             
             for rel in relaciones:
-                hsk = db.query(models.HSK).filter(models.HSK.id == rel.hsk_id).first()
+                hsk = hsk_by_id.get(rel.hsk_id)
                 if hsk:
                     hanzi_relacionados.add(hsk.hanzi)
             
@@ -113,7 +140,7 @@ def analizar_y_completar_relaciones():
                 
                 # Buscar estos hanzi en HSK
                 for hanzi in faltantes:
-                    hsk = db.query(models.HSK).filter(models.HSK.hanzi == hanzi).first()
+                    hsk = hsk_by_hanzi.get(hanzi)
                     if hsk:
                         print(f"             → {hanzi}: Encontrado en HSK ID:{hsk.id}")
                     else:
@@ -141,48 +168,45 @@ def completar_relaciones_automaticas(db):
     ejemplos = db.query(models.Ejemplo).all()
     relaciones_añadidas = 0
     
+    # Precargar HSK y relaciones una sola vez en lugar de consultar por ejemplo
+    hsk_by_id, hsk_by_hanzi = _cargar_hsk_por_id_y_hanzi(db)
+    rels_by_ej = _relaciones_por_ejemplo(db)
+    
+    # Relaciones nuevas acumuladas para un único INSERT en bloque
+    new_rels = []
+    
     for ej in ejemplos:
         # Obtener relaciones existentes
-        relaciones_existentes = db.query(models.HSKEjemplo).filter(
-            models.HSKEjemplo.ejemplo_id == ej.id
-        ).all()
-        
-        hanzi_ya_relacionados = set()
-        max_posicion = 0
+        rels = rels_by_ej.get(ej.id, [])
         
-        for rel in relaciones_existentes:
-            hsk = db.query(models.HSK).filter(models.HSK.id == rel.hsk_id).first()
-            if hsk:
-                hanzi_ya_relacionados.add(hsk.hanzi)
-            if rel.posicion > max_posicion:
-                max_posicion = rel.posicion
+        hanzi_ya_relacionados = {
+            hsk_by_id[r.hsk_id].hanzi for r in rels if r.hsk_id in hsk_by_id
+        }
+        max_posicion = max((r.posicion for r in rels), default=0)
         
         # Analizar hanzi en la frase
         posicion = max_posicion + 1
-        for caracter in ej.hanzi:
-            # Solo hanzi chinos
-            if not ('\u4e00' <= caracter <= '\u9fff'):
-                continue
-            
+        # Solo hanzi chinos
+        for caracter in _CJK_RE.findall(ej.hanzi):
             # Si ya está relacionado, saltar
             if caracter in hanzi_ya_relacionados:
                 continue
             
             # Buscar en HSK
-            hsk = db.query(models.HSK).filter(models.HSK.hanzi == caracter).first()
+            hsk = hsk_by_hanzi.get(caracter)
             
             if hsk:
                 # Crear relación
-                nueva_relacion = models.HSKEjemplo(
-                    hsk_id=hsk.id,
-                    ejemplo_id=ej.id,
-                    posicion=posicion
-                )
-                db.add(nueva_relacion)
+                new_rels.append({
+                    'hsk_id': hsk.id,
+                    'ejemplo_id': ej.id,
+                    'posicion': posicion
+                })
                 relaciones_añadidas += 1
                 posicion += 1
                 print(f"  ✓ Añadida relación: Ejemplo {ej.id} ↔ HSK {hsk.id} ({hsk.hanzi})")
     
+    db.bulk_insert_mappings(models.HSKEjemplo, new_rels)
     db.commit()
     print(f"\n✅ Se añadieron {relaciones_añadidas} relaciones nuevas")
 
@@ -224,10 +248,10 @@ def mostrar_estadisticas():
         print(f"\n🏆 Top 10 ejemplos más complejos:")
         ejemplos_complejos = db.query(
             models.Ejemplo,
-            db.query(models.HSKEjemplo).filter(
-                models.HSKEjemplo.ejemplo_id == models.Ejemplo.id
-            ).count().label('num_hanzi')
-        ).order_by('num_hanzi DESC').limit(10).all()
+            func.count(models.HSKEjemplo.id).label('num_hanzi')
+        ).outerjoin(
+            models.HSKEjemplo, models.HSKEjemplo.ejemplo_id == models.Ejemplo.id
+        ).group_by(models.Ejemplo.id).order_by(desc('num_hanzi')).limit(10).all()
         
         for i, (ej, num_hanzi) in enumerate(ejemplos_complejos, 1):
             print(f"  {i:2d}. {ej.hanzi} ({num_hanzi} hanzi)")
@@ -13,26 +13,48 @@ SOLO usar cuando:
 """
 import sys
 import os
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, PROJECT_ROOT)
 
+import io
+import queue
 import subprocess
+import threading
 from datetime import datetime
 from dotenv import load_dotenv
-import shutil
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.orm import sessionmaker
+import sqlite3
+import traceback
 
 load_dotenv()
 
+# Rutas y URL resueltas una sola vez
+TEST_DB_PATH = os.path.join(PROJECT_ROOT, "data", "test.db")
+BACKUPS_DIR = os.path.join(PROJECT_ROOT, "backups")
+_url_produccion = os.getenv("DATABASE_URL_PRODUCTION", "")
+# SQLAlchemy exige el esquema postgresql://
+RENDER_URL = (
+    _url_produccion.replace("postgres://", "postgresql://", 1)
+    if _url_produccion.startswith("postgres://")
+    else _url_produccion
+)
+
+# Filas por lote en la subida a producción (memoria acotada en el cliente)
+TAMANO_LOTE = 10_000
+# Lotes ya formateados que el hilo lector puede adelantar al escritor
+LOTES_EN_COLA = 4
+
 def verificar_prerequisitos():
     """Verifica que todo esté listo"""
     # CORREGIDO: usar data/test.db
-    if not os.path.exists("data/test.db"):
+    if not os.path.exists(TEST_DB_PATH):
         print("❌ No existe data/test.db")
         print("   No hay datos locales para subir")
         return False
     
     # Verificar que existe DATABASE_URL_PRODUCTION
-    render_url = os.getenv("DATABASE_URL_PRODUCTION")
-    if not render_url:
+    if not RENDER_URL:
         print("❌ DATABASE_URL_PRODUCTION no configurada en .env")
         return False
     
@@ -52,6 +74,114 @@ def verificar_prerequisitos():
     
     return True
 
+def _valor_copy(valor):
+    """Formatea un valor para COPY ... FROM STDIN (FORMAT text); NULL es \\N"""
+    if valor is None:
+        return "\\N"
+    if valor is True:
+        return "t"
+    if valor is False:
+        return "f"
+    if isinstance(valor, str):
+        return (valor.replace("\\", "\\\\")
+                     .replace("\t", "\\t")
+                     .replace("\n", "\\n")
+                     .replace("\r", "\\r"))
+    return str(valor)
+
+def _producir_lotes(filas, cola, parar):
+    """Hilo lector: formatea las filas locales en lotes COPY y los encola.
+    
+    Encola tuplas (buffer, num_filas), luego None como fin; si falla, encola la excepción.
+    Si el escritor activa `parar` (falló la subida), termina antes del siguiente put
+    sin leer el resto de la tabla.
+    """
+    try:
+        buf = io.StringIO()
+        en_buf = 0
+        for fila in filas:
+            buf.write("\t".join(map(_valor_copy, fila)))
+            buf.write("\n")
+            en_buf += 1
+            if en_buf >= TAMANO_LOTE:
+                if parar.is_set():
+                    return
+                cola.put((buf, en_buf))
+                buf = io.StringIO()
+                en_buf = 0
+        if parar.is_set():
+            return
+        if en_buf:
+            cola.put((buf, en_buf))
+        cola.put(None)
+    except BaseException as e:
+        if not parar.is_set():
+            cola.put(e)
+
+def _copiar_tabla(db_local, cursor, tabla):
+    """Copia una tabla del SQLite local a producción con COPY; devuelve las filas copiadas.
+    
+    Un hilo lee y formatea el siguiente lote mientras este envía el actual por la red;
+    la cola acotada limita la memoria en vuelo.
+    """
+    columnas = ", ".join(c.name for c in tabla.columns)
+    copy_sql = f"COPY {tabla.name} ({columnas}) FROM STDIN WITH (FORMAT text)"
+    
+    # Lectura en streaming del SQLite local: memoria O(lote), no O(tabla).
+    # SELECT de Core sobre la tabla: tuplas en el orden de las columnas,
+    # sin construir instancias ORM ni pasar por el identity map
+    filas = db_local.execute(
+        select(tabla).execution_options(stream_results=True, yield_per=2000)
+    )
+    cola = queue.Queue(maxsize=LOTES_EN_COLA)
+    parar = threading.Event()
+    lector = threading.Thread(target=_producir_lotes, args=(filas, cola, parar), daemon=True)
+    lector.start()
+    
+    total = 0
+    try:
+        while (lote := cola.get()) is not None:
+            if isinstance(lote, BaseException):
+                raise lote
+            buf, en_buf = lote
+            buf.seek(0)
+            cursor.copy_expert(copy_sql, buf)
+            total += en_buf
+    except BaseException:
+        # Avisar al lector y vaciar la cola por si estaba bloqueado en put():
+        # como mucho termina el lote en curso y sale sin volver a encolar
+        parar.set()
+        while True:
+            try:
+                cola.get_nowait()
+            except queue.Empty:
+                break
+        lector.join()
+        raise
+    lector.join()
+    return total
+
+def _verificar_fks(conn, tablas):
+    """Valida en bloque las FKs de las tablas ya cargadas; lanza si hay filas huérfanas.
+    
+    Hace falta cuando la carga se hizo con los triggers de FK desactivados: SQLite
+    no aplica las FKs, así que la copia local puede traer huérfanas. Un anti-join
+    NOT EXISTS por FK, en vez de la comprobación fila a fila de los triggers.
+    """
+    huerfanas = []
+    for tabla in tablas:
+        for fk in tabla.foreign_keys:
+            destino = fk.column.table.name
+            n = conn.execute(text(
+                f"SELECT COUNT(*) FROM {tabla.name} t "
+                f"WHERE t.{fk.parent.name} IS NOT NULL AND NOT EXISTS "
+                f"(SELECT 1 FROM {destino} d WHERE d.{fk.column.name} = t.{fk.parent.name})"
+            )).scalar_one()
+            if n:
+                huerfanas.append(f"{tabla.name}.{fk.parent.name} -> {destino}: {n}")
+    if huerfanas:
+        raise RuntimeError("Filas huérfanas en la copia local: " + "; ".join(huerfanas))
+
 def bd_local_a_render():
     """Sube base de datos local a producción en Render"""
     
@@ -69,9 +199,7 @@ def bd_local_a_render():
     if not verificar_prerequisitos():
         return False
     
-    render_url = os.getenv("DATABASE_URL_PRODUCTION")
-    if render_url.startswith("postgres://"):
-        render_url = render_url.replace("postgres://", "postgresql://", 1)
+    render_url = RENDER_URL
     
     # Triple confirmación
     print("\n🔴 CONFIRMACIÓN 1/3:")
@@ -97,16 +225,20 @@ def bd_local_a_render():
         return False
     
     try:
-        os.makedirs("backups", exist_ok=True)
+        os.makedirs(BACKUPS_DIR, exist_ok=True)
+        # Misma marca de tiempo para los dos backups de esta ejecución
+        marca = datetime.now().strftime('%Y%m%d_%H%M%S')
         
         # Paso 1: BACKUP de producción (MUY IMPORTANTE)
         print("\n💾 Paso 1: BACKUP de producción (por seguridad)...")
-        backup_file = f"backups/render_backup_pre_upload_{datetime.now().strftime('%Y%m%d_%H%M%S')}.sql"
+        backup_file = os.path.join(BACKUPS_DIR, f"render_backup_pre_upload_{marca}.dump")
         
         print("   Conectando a Render...")
         try:
+            # Formato custom: comprimido, pg_dump lo escribe directamente al archivo
+            # (sin pasar el volcado entero por memoria) y pg_restore -j lo restaura en paralelo
             result = subprocess.run(
-                ["pg_dump", render_url],
+                ["pg_dump", "--format=custom", "--file", backup_file, render_url],
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
                 check=False,
@@ -122,12 +254,10 @@ def bd_local_a_render():
                     return False
                 print("\n⚠️  Continuando SIN backup de producción...")
             else:
-                with open(backup_file, 'w', encoding='utf-8') as f:
-                    f.write(result.stdout)
-                
                 backup_size = os.path.getsize(backup_file) / 1024 / 1024  # MB
                 print(f"✅ Backup guardado: {backup_file} ({backup_size:.2f} MB)")
                 print("   ⚠️  GUARDA ESTE ARCHIVO. Es tu única forma de recuperar datos.")
+                print(f"   Restaurar: pg_restore -j 4 --clean -d '<DATABASE_URL_PRODUCTION>' {backup_file}")
         except Exception as e:
             print(f"⚠️  No se pudo hacer backup: {e}")
             print("\n❓ ¿Continuar sin backup? (MUY PELIGROSO)")
@@ -138,204 +268,160 @@ def bd_local_a_render():
         
         # Paso 2: Copiar test.db como backup
         print("\n💾 Paso 2: Backup de data/test.db local...")
-        backup_local = f"backups/local_pre_upload_{datetime.now().strftime('%Y%m%d_%H%M%S')}.db"
-        shutil.copy2("data/test.db", backup_local)
+        backup_local = os.path.join(BACKUPS_DIR, f"local_pre_upload_{marca}.db")
+        # API de backup online de SQLite: copia consistente aunque haya
+        # otra conexión abierta o un WAL pendiente (copy2 copiaría bytes a medias)
+        origen = sqlite3.connect(TEST_DB_PATH)
+        destino = sqlite3.connect(backup_local)
+        try:
+            origen.backup(destino)
+        finally:
+            destino.close()
+            origen.close()
         print(f"✅ Backup local guardado: {backup_local}")
         
         # Paso 3: Conectar a producción y LIMPIAR
         print("\n🗑️  Paso 3: Limpiando base de datos de producción...")
         print("   ⚠️  Borrando todos los datos...")
         
-        from sqlalchemy import create_engine, text
         engine_prod = create_engine(render_url)
         
-        with engine_prod.connect() as conn:
-            # NO necesitamos desactivar foreign keys si borramos en el orden correcto
-            # Orden inverso a las dependencias (de hijos a padres)
-            
-            tables_to_clear = [
-                # 1. Primero las tablas que dependen de otras
-                ("sm2_reviews", "SM2 Reviews"),
-                ("sm2_progress", "SM2 Progress"),
-                ("sm2_sessions", "SM2 Sessions"),
-                ("ejemplo_activacion", "Activación de Ejemplos"),
-                ("ejemplo_jerarquia", "Jerarquía de Ejemplos"),
-                ("hsk_ejemplo", "Relaciones HSK-Ejemplo"),
-                ("tarjetas", "Tarjetas"),
-                ("notas", "Notas"),
-                # 2. Luego las tablas base
-                ("ejemplos", "Ejemplos"),
-                ("diccionario", "Diccionario"),
-                ("hsk", "HSK")
-            ]
-            
-            total_deleted = 0
-            for table, nombre in tables_to_clear:
-                try:
-                    result = conn.execute(text(f"DELETE FROM {table}"))
-                    count = result.rowcount
-                    total_deleted += count
-                    if count > 0:
-                        print(f"   ✅ {nombre}: {count} registros eliminados")
-                    else:
-                        print(f"   ℹ️  {nombre}: vacía")
-                    conn.commit()
-                except Exception as e:
-                    print(f"   ⚠️  {nombre}: {str(e)[:100]}")
-                    conn.rollback()
-                    # Continuar con la siguiente tabla
-            
-            print(f"\n   📊 Total eliminados: {total_deleted} registros")
-        
-        print("✅ Base de datos de producción limpiada")
-        
-        # Paso 4: Copiar datos de local a producción
-        print("\n📥 Paso 4: Subiendo datos locales a producción...")
+        # Todas las tablas del modelo; TRUNCATE ... CASCADE no necesita orden
+        tables_to_clear = [
+            "sm2_reviews",
+            "sm2_progress",
+            "sm2_sessions",
+            "ejemplo_activacion",
+            "ejemplo_jerarquia",
+            "hsk_ejemplo",
+            "tarjetas",
+            "notas",
+            "ejemplos",
+            "diccionario",
+            "hsk",
+        ]
         
         # IMPORTANTE: Configurar entorno antes de importar
         os.environ["DB_ENVIRONMENT"] = "local"
-        os.environ["DATABASE_URL_LOCAL"] = "sqlite:///./data/test.db"
+        os.environ["DATABASE_URL_LOCAL"] = f"sqlite:///{TEST_DB_PATH}"
         
         # Conectar a local
-        from sqlalchemy import create_engine as create_eng
-        from sqlalchemy.orm import sessionmaker
         from app import models
         
-        engine_local = create_eng("sqlite:///./data/test.db", connect_args={"check_same_thread": False})
+        engine_local = create_engine(f"sqlite:///{TEST_DB_PATH}", connect_args={"check_same_thread": False})
         Session_local = sessionmaker(bind=engine_local)
         db_local = Session_local()
         
-        # Conectar a producción
-        Session_prod = sessionmaker(bind=engine_prod)
-        db_prod = Session_prod()
+        # Tablas a subir agrupadas por capas de dependencias (FKs): cada capa solo
+        # depende de las anteriores. Se suben en serie sobre UNA conexión para que
+        # la carga siga siendo una única transacción (todo o nada)
+        capas_subida = [
+            # Capa 0: sin FKs
+            [
+                (models.HSK, "HSK", "palabras subidas"),
+                (models.Ejemplo, "Ejemplos", "frases"),
+                (models.SM2Session, "Sesiones SM2", "sesiones"),
+            ],
+            # Capa 1: -> hsk, ejemplos
+            [
+                (models.Diccionario, "Diccionario", "entradas"),
+                (models.Notas, "Notas", "notas"),
+                (models.HSKEjemplo, "Relaciones HSK-Ejemplo", "enlaces"),
+            ],
+            # Capa 2: -> hsk, diccionario, ejemplos
+            [
+                (models.Tarjeta, "Tarjetas", "tarjetas"),
+            ],
+            # Capa 3: -> tarjetas, sm2_sessions
+            [
+                (models.SM2Progress, "Progreso SM2", "registros"),
+                (models.SM2Review, "Revisiones SM2", "revisiones"),
+            ],
+        ]
+        modelos_a_subir = [modelo for capa in capas_subida for modelo in capa]
         
+        # Paso 3 y 4 sobre UNA conexión y UNA transacción: el TRUNCATE y la carga
+        # se confirman juntos, y si algo falla producción queda como estaba
+        conn = engine_prod.connect()
         try:
-            # Copiar HSK
-            print("   Subiendo HSK...")
-            hsk_items = db_local.query(models.HSK).all()
-            for item in hsk_items:
-                new_item = models.HSK(
-                    id=item.id,
-                    numero=item.numero,
-                    nivel=item.nivel,
-                    hanzi=item.hanzi,
-                    pinyin=item.pinyin,
-                    espanol=item.espanol,
-                    hanzi_alt=item.hanzi_alt,
-                    pinyin_alt=item.pinyin_alt,
-                    categoria=item.categoria,
-                    ejemplo=item.ejemplo,
-                    significado_ejemplo=item.significado_ejemplo
-                )
-                db_prod.add(new_item)
-            db_prod.commit()
-            print(f"   ✅ HSK: {len(hsk_items)} palabras subidas")
-            
-            # Copiar Diccionario
-            print("   Subiendo Diccionario...")
-            dict_items = db_local.query(models.Diccionario).all()
-            for item in dict_items:
-                new_item = models.Diccionario(
-                    id=item.id,
-                    hsk_id=item.hsk_id,
-                    activo=item.activo
-                )
-                db_prod.add(new_item)
-            db_prod.commit()
-            print(f"   ✅ Diccionario: {len(dict_items)} entradas")
-            
-            # Copiar Ejemplos
-            print("   Subiendo Ejemplos...")
-            ejemplos = db_local.query(models.Ejemplo).all()
-            for item in ejemplos:
-                new_item = models.Ejemplo(
-                    id=item.id,
-                    hanzi=item.hanzi,
-                    pinyin=item.pinyin,
-                    espanol=item.espanol,
-                    nivel=item.nivel,
-                    complejidad=item.complejidad,
-                    activado=item.activado,
-                    en_diccionario=item.en_diccionario,
-                    created_at=item.created_at
-                )
-                db_prod.add(new_item)
-            db_prod.commit()
-            print(f"   ✅ Ejemplos: {len(ejemplos)} frases")
-            
-            # Copiar Tarjetas
-            print("   Subiendo Tarjetas...")
-            tarjetas = db_local.query(models.Tarjeta).all()
-            for item in tarjetas:
-                new_item = models.Tarjeta(
-                    id=item.id,
-                    hsk_id=item.hsk_id,
-                    diccionario_id=item.diccionario_id,
-                    ejemplo_id=item.ejemplo_id,
-                    mostrado1=item.mostrado1,
-                    mostrado2=item.mostrado2,
-                    audio=item.audio,
-                    requerido=item.requerido,
-                    activa=item.activa
-                )
-                db_prod.add(new_item)
-            db_prod.commit()
-            print(f"   ✅ Tarjetas: {len(tarjetas)} tarjetas")
-            
-            # Copiar Progreso SM2
-            print("   Subiendo Progreso SM2...")
-            progress = db_local.query(models.SM2Progress).all()
-            for item in progress:
-                new_item = models.SM2Progress(
-                    id=item.id,
-                    tarjeta_id=item.tarjeta_id,
-                    easiness_factor=item.easiness_factor,
-                    repetitions=item.repetitions,
-                    interval=item.interval,
-                    next_review=item.next_review,
-                    estado=item.estado,
-                    total_reviews=item.total_reviews,
-                    correct_reviews=item.correct_reviews,
-                    last_review=item.last_review,
-                    created_at=item.created_at
-                )
-                db_prod.add(new_item)
-            db_prod.commit()
-            print(f"   ✅ Progreso: {len(progress)} registros")
-            
-            # Copiar Relaciones HSK-Ejemplo
-            print("   Subiendo Relaciones HSK-Ejemplo...")
-            relaciones = db_local.query(models.HSKEjemplo).all()
-            for item in relaciones:
-                new_item = models.HSKEjemplo(
-                    id=item.id,
-                    hsk_id=item.hsk_id,
-                    ejemplo_id=item.ejemplo_id,
-                    posicion=item.posicion
-                )
-                db_prod.add(new_item)
-            db_prod.commit()
-            print(f"   ✅ Relaciones: {len(relaciones)} enlaces")
-            
-            # Copiar Notas
-            print("   Subiendo Notas...")
-            notas = db_local.query(models.Notas).all()
-            for item in notas:
-                new_item = models.Notas(
-                    id=item.id,
-                    hsk_id=item.hsk_id,
-                    nota=item.nota,
-                    created_at=item.created_at,
-                    updated_at=item.updated_at
-                )
-                db_prod.add(new_item)
-            db_prod.commit()
-            print(f"   ✅ Notas: {len(notas)} notas")
+            with conn.begin():
+                # Un único TRUNCATE: no genera tuplas muertas ni dispara
+                # los triggers de FK fila a fila como DELETE
+                conn.execute(text(
+                    "TRUNCATE TABLE " + ", ".join(tables_to_clear) + " RESTART IDENTITY CASCADE"
+                ))
+                print(f"   ✅ {len(tables_to_clear)} tablas vaciadas")
+                print("✅ Base de datos de producción limpiada (pendiente de confirmar)")
+                
+                # Índices secundarios (los que no respaldan una PK/UNIQUE): se borran antes
+                # de la carga y se recrean al final con su DDL, en vez de mantenerlos fila a fila
+                indices = conn.execute(text(
+                    "SELECT i.indexname, i.indexdef FROM pg_indexes i "
+                    "WHERE i.schemaname = current_schema() AND i.tablename = ANY(:tablas) "
+                    "AND NOT EXISTS (SELECT 1 FROM pg_constraint c "
+                    "WHERE c.conindid = format('%I.%I', i.schemaname, i.indexname)::regclass)"
+                ), {"tablas": tables_to_clear}).all()
+                for nombre_indice, _ in indices:
+                    conn.execute(text(f'DROP INDEX "{nombre_indice}"'))
+                print(f"   ℹ️  {len(indices)} índices secundarios desactivados durante la carga")
+                
+                # Paso 4: Copiar datos de local a producción
+                print("\n📥 Paso 4: Subiendo datos locales a producción...")
+                # COPY FROM STDIN de Postgres (vía copy_expert de psycopg2) en lugar de INSERT.
+                # Se envía por lotes de TAMANO_LOTE filas para acotar la memoria.
+                cursor = conn.connection.driver_connection.cursor()
+                
+                # La copia local es consistente: desactivar los triggers de FK durante
+                # la carga. SET LOCAL vuelve a 'origin' solo al terminar la transacción.
+                # Requiere permisos de superusuario; si no los hay se carga con FKs activas
+                fks_diferidas = False
+                try:
+                    with conn.begin_nested():
+                        conn.execute(text("SET LOCAL session_replication_role = replica"))
+                    fks_diferidas = True
+                    print("   ℹ️  Comprobación de FKs desactivada durante la carga")
+                except Exception as e:
+                    print(f"   ℹ️  FKs activas durante la carga: {str(e).splitlines()[0][:100]}")
+                
+                for model, nombre, unidad in modelos_a_subir:
+                    print(f"   Subiendo {nombre}...")
+                    total = _copiar_tabla(db_local, cursor, model.__table__)
+                    print(f"   ✅ {nombre}: {total} {unidad}")
+                
+                # Recrear los índices secundarios de una vez sobre los datos ya cargados
+                # (CREATE INDEX normal: CONCURRENTLY no puede ir dentro de una transacción)
+                for _, definicion in indices:
+                    conn.execute(text(definicion))
+                if indices:
+                    print(f"   ✅ {len(indices)} índices recreados")
+                
+                # Con los triggers desactivados nada ha comprobado las FKs: validarlas
+                # ahora, antes del commit (si hay huérfanas se revierte todo)
+                if fks_diferidas:
+                    _verificar_fks(conn, [model.__table__ for model, _, _ in modelos_a_subir])
+                    print("   ✅ FKs verificadas: sin filas huérfanas")
+                
+                # Los ids se copian explícitos y no avanzan las secuencias
+                # (reiniciadas por RESTART IDENTITY): sincronizarlas con MAX(id)
+                for model, _, _ in modelos_a_subir:
+                    tabla = model.__table__
+                    if "id" not in tabla.c:
+                        continue
+                    conn.execute(text(
+                        f"SELECT setval(pg_get_serial_sequence('{tabla.name}', 'id'), "
+                        f"COALESCE((SELECT MAX(id) FROM {tabla.name}), 0) + 1, false)"
+                    ))
+                
+                # Estadísticas frescas para el planificador: tras vaciar y recargar todo,
+                # las anteriores no valen hasta que pase el autovacuum
+                for tabla in tables_to_clear:
+                    conn.execute(text(f"ANALYZE {tabla}"))
+                print(f"   ✅ Estadísticas actualizadas (ANALYZE) en {len(tables_to_clear)} tablas")
             
             print("\n" + "="*70)
             print("✅ SINCRONIZACIÓN COMPLETADA EXITOSAMENTE")
             print("="*70)
-            print(f"\n📁 Backups guardados en: backups/")
+            print(f"\n📁 Backups guardados en: {BACKUPS_DIR}")
             print(f"   - Producción (antes): {backup_file}")
             print(f"   - Local (antes): {backup_local}")
             print("\n💡 Los usuarios ahora verán estos datos en:")
@@ -343,16 +429,13 @@ def bd_local_a_render():
             
         except Exception as e:
             print(f"\n❌ ERROR durante la copia: {e}")
-            print("\n⚠️  La base de datos de producción puede estar en estado inconsistente")
-            print(f"   Restaurar desde backup: {backup_file}")
-            print("\n📖 Para restaurar:")
-            print(f"   psql '{render_url}' < {backup_file}")
-            import traceback
+            print("\n⚠️  La transacción se ha revertido: producción sigue como antes del Paso 3")
+            print(f"   Backup de producción: {backup_file}")
             traceback.print_exc()
             return False
         finally:
             db_local.close()
-            db_prod.close()
+            conn.close()
         
         return True
         
@@ -361,7 +444,6 @@ def bd_local_a_render():
         return False
     except Exception as e:
         print(f"\n❌ Error: {e}")
-        import traceback
         traceback.print_exc()
         return False
 
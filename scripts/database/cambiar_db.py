@@ -29,6 +29,10 @@ def cambiar_entorno(nuevo_entorno):
     updated = False
     for i, line in enumerate(lines):
         if line.startswith('DB_ENVIRONMENT='):
+            # Ya está en ese entorno: no reescribir el archivo
+            if line.strip() == f'DB_ENVIRONMENT={nuevo_entorno}':
+                print(f"ℹ️  El entorno ya es {nuevo_entorno.upper()} (.env sin cambios)")
+                return True
             lines[i] = f'DB_ENVIRONMENT={nuevo_entorno}\n'
             updated = True
             break
@@ -36,9 +40,12 @@ def cambiar_entorno(nuevo_entorno):
     if not updated:
         lines.append(f'\nDB_ENVIRONMENT={nuevo_entorno}\n')
     
-    # Escribir .env
-    with open(env_file, 'w', encoding='utf-8') as f:
+    # Escribir .env de forma atómica: temporal + os.replace, así nadie
+    # lee nunca un .env a medio escribir
+    tmp_file = env_file + '.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as f:
         f.writelines(lines)
+    os.replace(tmp_file, env_file)
     
     print(f"✅ Entorno cambiado a: {nuevo_entorno.upper()}")
     
@@ -7,9 +7,12 @@ import sys
 import os
 
 # Añadir el directorio raíz al path
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, PROJECT_ROOT)
 
-from app.database import Base, engine, init_db
+from sqlalchemy import inspect
+
+from app.database import Base, engine
 
 def main():
     """Función principal para inicializar la base de datos"""
@@ -19,18 +22,16 @@ def main():
         # Importar todos los modelos para que SQLAlchemy los reconozca
         from app import models
         
-        # Crear todas las tablas
-        Base.metadata.create_all(bind=engine)
-        print("✅ Tablas creadas exitosamente")
-        
-        # Verificar conexión
-        with engine.connect() as conn:
+        # Una sola conexión (sin Session) para el DDL y la verificación
+        with engine.begin() as conn:
             print("✅ Conexión a base de datos exitosa")
             
-        # Contar tablas creadas
-        from sqlalchemy import inspect
-        inspector = inspect(engine)
-        tablas = inspector.get_table_names()
+            # Crear todas las tablas
+            Base.metadata.create_all(bind=conn)
+            print("✅ Tablas creadas exitosamente")
+            
+            # Contar tablas creadas
+            tablas = inspect(conn).get_table_names()
         print(f"📊 Tablas creadas: {len(tablas)}")
         for tabla in tablas:
             print(f"  - {tabla}")
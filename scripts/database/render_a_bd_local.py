@@ -3,18 +3,115 @@
 Descarga base de datos de Render (producción) a local
 USO: python scripts/database/render_a_bd_local.py
 
-NO requiere pg_dump - usa SQLAlchemy directamente
+NO requiere pg_dump - usa COPY TO STDOUT (psycopg2) y SQLAlchemy Core
 """
 import sys
 import os
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, PROJECT_ROOT)
 
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 from datetime import datetime
 from dotenv import load_dotenv
+from sqlalchemy import create_engine, text
+from sqlalchemy.schema import CreateTable
 import shutil
+import traceback
 
 load_dotenv()
 
+# Rutas resueltas desde la raíz del proyecto (el script puede lanzarse desde cualquier directorio)
+TEST_DB_PATH = os.path.join(PROJECT_ROOT, "data", "test.db")
+BACKUPS_DIR = os.path.join(PROJECT_ROOT, "backups")
+
+# Filas por lote en la copia de producción a local (memoria acotada)
+TAMANO_LOTE = 10_000
+
+# Tablas de producción que se descargan en paralelo (la escritura local es en serie)
+HILOS_DESCARGA = 4
+
+# PRAGMAs de SQLite para la carga masiva en local
+_PRAGMAS_CARGA = (
+    "PRAGMA journal_mode=WAL",  # la app puede seguir leyendo durante la carga
+    "PRAGMA wal_autocheckpoint=10000",
+    "PRAGMA synchronous=NORMAL",  # en WAL solo hay fsync en los checkpoints
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-262144",  # 256 MB
+)
+
+# Secuencias de escape de COPY ... TO STDOUT (FORMAT text)
+_ESCAPES_COPY = {"t": "\t", "n": "\n", "r": "\r", "b": "\b", "f": "\f", "v": "\v", "\\": "\\"}
+_ESCAPE_COPY_RE = re.compile(r"\\(.)")
+_BOOLEANOS_COPY = {"t": True, "f": False}
+
+def _desescapar_copy(valor):
+    """Deshace el escapado de COPY en un campo de texto"""
+    if "\\" not in valor:
+        return valor
+    return _ESCAPE_COPY_RE.sub(lambda m: _ESCAPES_COPY.get(m.group(1), m.group(1)), valor)
+
+def _fecha_sqlite(valor):
+    """Pasa un timestamp de COPY al formato en que SQLAlchemy guarda DateTime en SQLite"""
+    return datetime.fromisoformat(valor).isoformat(" ", "microseconds")
+
+def _conversor_copy(columna):
+    """Devuelve la función que pasa un campo COPY (str) al valor que se guarda en SQLite"""
+    tipo = columna.type.python_type
+    if tipo is bool:
+        return _BOOLEANOS_COPY.__getitem__
+    if tipo is datetime:
+        return _fecha_sqlite
+    if tipo is str:
+        return _desescapar_copy
+    return tipo
+
+def _volcar_tabla(engine_prod, tabla):
+    """Vuelca una tabla de producción con COPY ... TO STDOUT a un fichero temporal.
+    
+    Usa su propia conexión del pool, así que puede ejecutarse en un hilo aparte.
+    Devuelve el fichero abierto y posicionado al principio.
+    """
+    columnas = ", ".join(c.name for c in tabla.columns)
+    volcado = tempfile.TemporaryFile(mode="w+", encoding="utf-8", newline="\n")
+    conexion = engine_prod.raw_connection()
+    try:
+        conexion.cursor().copy_expert(
+            f"COPY {tabla.name} ({columnas}) TO STDOUT WITH (FORMAT text)", volcado
+        )
+    except BaseException:
+        volcado.close()
+        raise
+    finally:
+        conexion.close()
+    volcado.seek(0)
+    return volcado
+
+def _conversor_fila(tabla):
+    """Genera (exec) una función especializada línea COPY -> tupla para la tabla.
+    
+    Cada columna queda desenrollada como una expresión fija, sin el bucle genérico
+    zip/generador por fila.
+    """
+    entorno = {"NULO": "\\N"}
+    expresiones = []
+    for i, columna in enumerate(tabla.columns):
+        entorno[f"conv_{i}"] = _conversor_copy(columna)
+        expresiones.append(f"None if c[{i}] == NULO else conv_{i}(c[{i}])")
+    codigo = (
+        "def convertir(linea):\n"
+        "    c = linea.rstrip('\\n').split('\\t')\n"
+        f"    return ({', '.join(expresiones)},)\n"
+    )
+    exec(codigo, entorno)
+    return entorno["convertir"]
+
+def _filas_volcado(volcado, tabla):
+    """Recorre un volcado COPY línea a línea y genera tuplas en el orden de las columnas"""
+    return map(_conversor_fila(tabla), volcado)
+
 def render_a_bd_local():
     """Copia base de datos de Render a local usando SQLAlchemy (sin pg_dump)"""
     
@@ -23,7 +120,7 @@ def render_a_bd_local():
     print("="*70)
     
     # CORREGIDO: usar data/test.db
-    local_db = "data/test.db"
+    local_db = TEST_DB_PATH
     render_url = os.getenv("DATABASE_URL_PRODUCTION")
     
     if not render_url:
@@ -48,14 +145,16 @@ def render_a_bd_local():
     
     try:
         # Asegurar que existe el directorio data/
-        os.makedirs("data", exist_ok=True)
-        os.makedirs("backups", exist_ok=True)
+        os.makedirs(os.path.dirname(TEST_DB_PATH), exist_ok=True)
+        os.makedirs(BACKUPS_DIR, exist_ok=True)
         
         # Paso 1: Backup de local
         print("\n💾 Paso 1: Backup de base de datos local...")
         backup_local = None
         if os.path.exists(local_db):
-            backup_local = f"backups/local_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.db"
+            backup_local = os.path.join(
+                BACKUPS_DIR, f"local_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.db"
+            )
             shutil.copy2(local_db, backup_local)
             size_mb = os.path.getsize(backup_local) / 1024 / 1024
             print(f"✅ Backup guardado: {backup_local} ({size_mb:.2f} MB)")
@@ -65,7 +164,6 @@ def render_a_bd_local():
         # Cerrar cualquier conexión existente antes de eliminar
         try:
             # NO importar nada todavía, solo cerrar si existe
-            import sys
             # Limpiar imports previos
             mods_to_remove = [k for k in sys.modules.keys() if k.startswith('app.')]
             for mod in mods_to_remove:
@@ -92,7 +190,7 @@ def render_a_bd_local():
         
         # Asegurar que estamos en modo local
         os.environ["DB_ENVIRONMENT"] = "local"
-        os.environ["DATABASE_URL_LOCAL"] = "sqlite:///./data/test.db"
+        os.environ["DATABASE_URL_LOCAL"] = f"sqlite:///{TEST_DB_PATH}"
         print(f"   ✅ Entorno configurado: {os.environ['DATABASE_URL_LOCAL']}")
         
         # AHORA SÍ importar (usará la configuración correcta)
@@ -101,18 +199,28 @@ def render_a_bd_local():
         
         print(f"   ✅ Engine URL: {engine.url}")
         
-        # Crear todas las tablas vacías
-        Base.metadata.create_all(bind=engine)
+        # Crear todas las tablas vacías: el fichero es nuevo, así que se genera todo
+        # el DDL de una vez y se ejecuta en un solo executescript (sin create_all,
+        # que inspecciona y crea tabla a tabla)
+        ddl = "".join(
+            f"{str(CreateTable(tabla).compile(engine)).strip()};\n"
+            for tabla in Base.metadata.sorted_tables
+        )
+        conexion_ddl = engine.raw_connection()
+        try:
+            conexion_ddl.driver_connection.executescript(ddl)
+        finally:
+            conexion_ddl.close()
+        
+        # Sin índices secundarios durante la carga: se crean de una vez en el Paso 6
+        # en vez de mantener cada B-tree fila a fila
+        indices = [idx for tabla in Base.metadata.sorted_tables for idx in tabla.indexes]
         print("✅ Estructura creada")
         
         # Paso 4: Conectar a producción
         print("\n🔌 Paso 4: Conectando a PostgreSQL de Render...")
-        from sqlalchemy import create_engine as create_eng
-        from sqlalchemy.orm import sessionmaker
-        
-        engine_prod = create_eng(render_url)
-        Session_prod = sessionmaker(bind=engine_prod)
-        db_prod = Session_prod()
+        # Conexiones psycopg2 directas: la copia usa COPY TO STDOUT, sin ORM
+        engine_prod = create_engine(render_url)
         
         # Paso 5: Conectar a local
         from app.database import SessionLocal
@@ -134,60 +242,79 @@ def render_a_bd_local():
         ]
         
         total_registros = 0
+        descargas = ThreadPoolExecutor(max_workers=HILOS_DESCARGA)
         
         try:
             print("\n📥 Paso 5: Copiando datos (esto puede tardar)...")
             
+            # Carga masiva en WAL con pocos fsync y una sola transacción
+            # (si algo falla se restaura el backup)
+            for pragma in _PRAGMAS_CARGA:
+                db_local.execute(text(pragma))
+            # pysqlite no abre la transacción antes de un SAVEPOINT: sin este BEGIN
+            # explícito, cada RELEASE confirmaría su tabla por separado
+            db_local.execute(text("BEGIN"))
+            conn_local = db_local.connection()
+            cursor_local = conn_local.connection.driver_connection.cursor()
+            
+            # Producción se vuelca con COPY TO STDOUT (sin SELECT ni objetos ORM).
+            # Las descargas van en paralelo (la espera es de red) a ficheros temporales;
+            # SQLite admite un solo escritor, así que la inserción sigue en serie y en
+            # orden de dependencias conforme cada volcado está listo
+            volcados = {
+                modelo: descargas.submit(_volcar_tabla, engine_prod, modelo.__table__)
+                for _, modelo in tablas
+            }
+            
             # Copiar cada tabla
             for nombre_tabla, modelo in tablas:
                 try:
-                    # Obtener datos de producción
-                    registros = db_prod.query(modelo).all()
-                    
-                    if not registros:
-                        print(f"   ⚠️  {nombre_tabla}: 0 registros")
-                        continue
-                    
-                    # Insertar en local
-                    contador = 0
-                    for registro in registros:
-                        # Crear nuevo objeto con todos los atributos
-                        nuevo = modelo()
+                    # SAVEPOINT por tabla: si una falla se deshace solo esa tabla
+                    with conn_local.begin_nested(), volcados.pop(modelo).result() as volcado:
+                        # executemany de sqlite3 con sentencia preparada, por lotes.
+                        # OR REPLACE: los ids vienen de producción, así que repetir la
+                        # copia sobre filas existentes las sustituye en vez de fallar
+                        tabla = modelo.__table__
+                        insert_sql = (
+                            f"INSERT OR REPLACE INTO {tabla.name} ({', '.join(c.name for c in tabla.columns)}) "
+                            f"VALUES ({', '.join('?' * len(tabla.columns))})"
+                        )
+                        filas = _filas_volcado(volcado, tabla)
+                        contador = 0
+                        while lote := list(islice(filas, TAMANO_LOTE)):
+                            cursor_local.executemany(insert_sql, lote)
+                            contador += len(lote)
                         
-                        # Copiar todos los atributos del objeto
-                        for key, value in registro.__dict__.items():
-                            if not key.startswith('_'):  # Ignorar atributos internos
-                                setattr(nuevo, key, value)
+                        if not contador:
+                            print(f"   ⚠️  {nombre_tabla}: 0 registros")
+                            continue
                         
-                        db_local.add(nuevo)
-                        contador += 1
+                        total_registros += contador
+                        print(f"   ✅ {nombre_tabla}: {contador} registros")
                         
-                        # Commit cada 100 registros para no saturar memoria
-                        if contador % 100 == 0:
-                            db_local.flush()
-                    
-                    db_local.commit()
-                    total_registros += contador
-                    print(f"   ✅ {nombre_tabla}: {contador} registros")
-                    
                 except Exception as e:
-                    db_local.rollback()
                     print(f"   ❌ Error en {nombre_tabla}: {str(e)[:100]}...")
                     # Continuar con la siguiente tabla
             
+            # Un único commit para todas las tablas
+            db_local.commit()
+            
             # Recrear índices y secuencias
             print("\n🔧 Paso 6: Reconstruyendo índices y secuencias...")
             
+            for idx in indices:
+                idx.create(bind=engine)
+            print(f"   ✅ {len(indices)} índices creados")
+            
             # Para SQLite, resetear autoincrementos solo si la tabla existe
             if "sqlite" in str(db_local.bind.url):
-                from sqlalchemy import text as sql_text
                 try:
                     # Verificar si existe la tabla sqlite_sequence
-                    result = db_local.execute(sql_text(
+                    result = db_local.execute(text(
                         "SELECT name FROM sqlite_master WHERE type='table' AND name='sqlite_sequence'"
                     ))
                     if result.fetchone():
-                        db_local.execute(sql_text("DELETE FROM sqlite_sequence"))
+                        db_local.execute(text("DELETE FROM sqlite_sequence"))
                         db_local.commit()
                         print("   ✅ Secuencias SQLite reseteadas")
                     else:
@@ -196,6 +323,10 @@ def render_a_bd_local():
                     print(f"   ⚠️  No se pudieron resetear secuencias: {e}")
                     # No es crítico, continuar
             
+            # Volcar el WAL al fichero principal y dejarlo vacío
+            db_local.execute(text("PRAGMA wal_checkpoint(TRUNCATE)"))
+            db_local.commit()
+            
             print("\n" + "="*70)
             print("✅ SINCRONIZACIÓN COMPLETADA EXITOSAMENTE")
             print("="*70)
@@ -216,7 +347,6 @@ def render_a_bd_local():
             
         except Exception as e:
             print(f"\n❌ Error durante la copia de datos: {e}")
-            import traceback
             traceback.print_exc()
             
             # Restaurar backup si hay error
@@ -228,14 +358,14 @@ def render_a_bd_local():
             return False
             
         finally:
-            db_prod.close()
+            descargas.shutdown(cancel_futures=True)
+            engine_prod.dispose()
             db_local.close()
         
         return True
         
     except Exception as e:
         print(f"\n❌ Error general: {e}")
-        import traceback
         traceback.print_exc()
         return False
 
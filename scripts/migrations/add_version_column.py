@@ -1,35 +1,37 @@
-from sqlalchemy import text
 import sys
 sys.path.insert(0, ".")
-from app.database import SessionLocal
+from app.database import engine
 
 def migrate():
-    db = SessionLocal()
+    # Conexión DBAPI directa: para un único ALTER no hace falta Session ni ORM
+    conn = engine.raw_connection()
     try:
+        cursor = conn.cursor()
+        # BEGIN IMMEDIATE toma el lock de escritura antes de comprobar,
+        # así nadie puede añadir la columna entre la comprobación y el ALTER
+        cursor.execute("BEGIN IMMEDIATE")
+
         # Verificar si la columna ya existe
-        result = db.execute(text("""
-            SELECT COUNT(*) FROM pragma_table_info('sm2_progress') 
-            WHERE name='version'
-        """))
-        column_exists = result.scalar() > 0
-        
+        cursor.execute("PRAGMA table_info(sm2_progress)")
+        column_exists = any(col[1] == 'version' for col in cursor.fetchall())
+
         if not column_exists:
             # Agregar columna version a sm2_progress
-            db.execute(text("""
-                ALTER TABLE sm2_progress 
+            cursor.execute("""
+                ALTER TABLE sm2_progress
                 ADD COLUMN version INTEGER DEFAULT 1 NOT NULL
-            """))
+            """)
             print("✅ Columna 'version' agregada a sm2_progress")
         else:
             print("✅ La columna 'version' ya existe en sm2_progress")
-            
-        db.commit()
+
+        conn.commit()
         print("✅ Migración completada")
     except Exception as e:
-        db.rollback()
+        conn.rollback()
         print(f"❌ Error: {e}")
     finally:
-        db.close()
+        conn.close()
 
 if __name__ == "__main__":
-    migrate()
\ No newline at end of file
+    migrate()
@@ -10,14 +10,23 @@ Este script unifica y actualiza todos los diagnósticos previos:
 
 import sys
 import os
+import io
+import time
+from contextlib import redirect_stdout
+from functools import lru_cache
 
 # Añadir directorio raíz al path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from sqlalchemy import inspect
+from sqlalchemy import inspect, func, select, exists, event
 from database import SessionLocal, engine
 import models
 
+@lru_cache(maxsize=None)
+def _inspector():
+    """Inspector compartido: cachea las consultas al catálogo entre verificaciones"""
+    return inspect(engine)
+
 def print_section(title):
     """Imprime un título de sección"""
     print("\n" + "="*70)
@@ -28,7 +37,7 @@ def verificar_estructura_bd():
     """Verifica que todas las tablas existan"""
     print_section("1. VERIFICACIÓN DE ESTRUCTURA DE BASE DE DATOS")
     
-    inspector = inspect(engine)
+    inspector = _inspector()
     tablas_esperadas = [
         'hsk', 'notas', 'diccionario', 'tarjetas', 'ejemplos', 
         'hsk_ejemplo', 'ejemplo_jerarquia', 'sm2_sessions', 
@@ -61,7 +70,7 @@ def verificar_columnas_hsk():
     """Verifica las columnas de la tabla HSK"""
     print_section("2. VERIFICACIÓN DE COLUMNAS HSK")
     
-    inspector = inspect(engine)
+    inspector = _inspector()
     columnas = [col['name'] for col in inspector.get_columns('hsk')]
     
     columnas_esperadas = [
@@ -89,25 +98,59 @@ def verificar_columnas_hsk():
     
     return todas_ok
 
-def estadisticas_hsk(db):
+def _contar(modelo, *condiciones):
+    """Subconsulta escalar COUNT(*) sobre un modelo, con filtros opcionales"""
+    return select(func.count()).select_from(modelo).where(*condiciones).scalar_subquery()
+
+def obtener_totales(db):
+    """
+    Obtiene todos los totales de las secciones en una sola consulta.
+    
+    Cada total es una subconsulta escalar dentro del mismo SELECT, así que
+    el diagnóstico hace un único viaje a la BD en lugar de uno por COUNT.
+    """
+    consulta = select(
+        _contar(models.HSK).label('hsk'),
+        _contar(models.Notas).label('notas'),
+        _contar(models.Diccionario).label('diccionario'),
+        _contar(models.Diccionario, models.Diccionario.activo == True).label('diccionario_activos'),
+        _contar(models.Tarjeta).label('tarjetas'),
+        _contar(models.Tarjeta, models.Tarjeta.activa == True).label('tarjetas_activas'),
+        _contar(models.Tarjeta, models.Tarjeta.hsk_id != None).label('tarjetas_palabras'),
+        _contar(models.Tarjeta, models.Tarjeta.ejemplo_id != None).label('tarjetas_ejemplos'),
+        _contar(models.Ejemplo).label('ejemplos'),
+        _contar(models.Ejemplo, models.Ejemplo.activado == True).label('ejemplos_activados'),
+        _contar(models.Ejemplo, models.Ejemplo.en_diccionario == True).label('ejemplos_en_diccionario'),
+        _contar(models.HSKEjemplo).label('hsk_ejemplo'),
+        _contar(models.SM2Session).label('sesiones'),
+        _contar(models.SM2Progress).label('progress'),
+        _contar(models.SM2Review).label('reviews'),
+    )
+    return dict(db.execute(consulta).mappings().one())
+
+def estadisticas_hsk(db, totales):
     """Muestra estadísticas de la tabla HSK"""
     print_section("3. ESTADÍSTICAS HSK")
     
-    total = db.query(models.HSK).count()
+    total = totales['hsk']
     
     print(f"\n📊 Total palabras HSK: {total}")
     
     if total > 0:
-        # Por nivel
+        # Por nivel: un único GROUP BY en lugar de un COUNT por nivel
+        por_nivel = dict(
+            db.query(models.HSK.nivel, func.count()).group_by(models.HSK.nivel).all()
+        )
         print("\n📈 Distribución por nivel:")
         for nivel in range(1, 7):
-            count = db.query(models.HSK).filter(models.HSK.nivel == nivel).count()
-            print(f"   HSK {nivel}: {count} palabras")
+            print(f"   HSK {nivel}: {por_nivel.get(nivel, 0)} palabras")
         
-        # Con alternativas
-        con_hanzi_alt = db.query(models.HSK).filter(models.HSK.hanzi_alt != None).count()
-        con_categoria = db.query(models.HSK).filter(models.HSK.categoria != None).count()
-        con_ejemplo = db.query(models.HSK).filter(models.HSK.ejemplo != None).count()
+        # Con alternativas (COUNT(columna) ya ignora los NULL)
+        con_hanzi_alt, con_categoria, con_ejemplo = db.query(
+            func.count(models.HSK.hanzi_alt),
+            func.count(models.HSK.categoria),
+            func.count(models.HSK.ejemplo)
+        ).one()
         
         print(f"\n📝 Datos adicionales:")
         print(f"   Con hanzi alternativo: {con_hanzi_alt}")
@@ -116,29 +159,30 @@ def estadisticas_hsk(db):
     else:
         print("\n⚠️  No hay datos HSK. Ejecuta: python datos/cargar_hsk.py")
 
-def estadisticas_notas(db):
+def estadisticas_notas(db, totales):
     """Muestra estadísticas de la tabla Notas"""
     print_section("4. ESTADÍSTICAS NOTAS")
     
-    total = db.query(models.Notas).count()
+    total = totales['notas']
     print(f"\n📝 Total notas: {total}")
     
     if total > 0:
         print("\n🔍 Muestra de notas:")
-        notas = db.query(models.Notas, models.HSK).join(
+        # Solo las tres columnas que se muestran, no los objetos completos
+        notas = db.query(models.HSK.hanzi, models.HSK.pinyin, models.Notas.nota).join(
             models.HSK, models.Notas.hsk_id == models.HSK.id
-        ).limit(5).all()
+        ).limit(5)
         
-        for nota, hsk in notas:
-            texto_corto = nota.nota[:50] + "..." if len(nota.nota) > 50 else nota.nota
-            print(f"   {hsk.hanzi} ({hsk.pinyin}): {texto_corto}")
+        for hanzi, pinyin, nota in notas:
+            texto_corto = nota[:50] + "..." if len(nota) > 50 else nota
+            print(f"   {hanzi} ({pinyin}): {texto_corto}")
 
-def estadisticas_diccionario(db):
+def estadisticas_diccionario(db, totales):
     """Muestra estadísticas del diccionario"""
     print_section("5. ESTADÍSTICAS DICCIONARIO")
     
-    total = db.query(models.Diccionario).count()
-    activos = db.query(models.Diccionario).filter(models.Diccionario.activo == True).count()
+    total = totales['diccionario']
+    activos = totales['diccionario_activos']
     
     print(f"\n📚 Total palabras en diccionario: {total}")
     print(f"   Activas: {activos}")
@@ -146,21 +190,23 @@ def estadisticas_diccionario(db):
     
     if total > 0:
         # Distribución por nivel
+        por_nivel = dict(
+            db.query(models.HSK.nivel, func.count()).select_from(models.Diccionario).join(
+                models.HSK, models.Diccionario.hsk_id == models.HSK.id
+            ).group_by(models.HSK.nivel).all()
+        )
         print("\n📈 Distribución por nivel HSK:")
         for nivel in range(1, 7):
-            count = db.query(models.Diccionario).join(
-                models.HSK, models.Diccionario.hsk_id == models.HSK.id
-            ).filter(models.HSK.nivel == nivel).count()
-            print(f"   HSK {nivel}: {count} palabras")
+            print(f"   HSK {nivel}: {por_nivel.get(nivel, 0)} palabras")
 
-def estadisticas_tarjetas(db):
+def estadisticas_tarjetas(totales):
     """Muestra estadísticas de tarjetas"""
     print_section("6. ESTADÍSTICAS TARJETAS")
     
-    total = db.query(models.Tarjeta).count()
-    activas = db.query(models.Tarjeta).filter(models.Tarjeta.activa == True).count()
-    de_palabras = db.query(models.Tarjeta).filter(models.Tarjeta.hsk_id != None).count()
-    de_ejemplos = db.query(models.Tarjeta).filter(models.Tarjeta.ejemplo_id != None).count()
+    total = totales['tarjetas']
+    activas = totales['tarjetas_activas']
+    de_palabras = totales['tarjetas_palabras']
+    de_ejemplos = totales['tarjetas_ejemplos']
     
     print(f"\n🗂️  Total tarjetas: {total}")
     print(f"   Activas: {activas}")
@@ -169,57 +215,61 @@ def estadisticas_tarjetas(db):
     print(f"   De palabras: {de_palabras}")
     print(f"   De ejemplos: {de_ejemplos}")
 
-def estadisticas_ejemplos(db):
+def estadisticas_ejemplos(db, totales):
     """Muestra estadísticas de ejemplos"""
     print_section("7. ESTADÍSTICAS EJEMPLOS")
     
-    total = db.query(models.Ejemplo).count()
-    activados = db.query(models.Ejemplo).filter(models.Ejemplo.activado == True).count()
-    en_diccionario = db.query(models.Ejemplo).filter(models.Ejemplo.en_diccionario == True).count()
+    total = totales['ejemplos']
+    activados = totales['ejemplos_activados']
+    en_diccionario = totales['ejemplos_en_diccionario']
     
     print(f"\n💬 Total ejemplos: {total}")
     print(f"   Activados: {activados}")
     print(f"   En diccionario del usuario: {en_diccionario}")
     
     if total > 0:
+        por_complejidad = dict(
+            db.query(models.Ejemplo.complejidad, func.count())
+            .group_by(models.Ejemplo.complejidad).all()
+        )
         print("\n📈 Por complejidad:")
         for comp in [1, 2, 3]:
-            count = db.query(models.Ejemplo).filter(models.Ejemplo.complejidad == comp).count()
             nombre = "Simple" if comp == 1 else "Medio" if comp == 2 else "Complejo"
-            print(f"   {nombre}: {count}")
+            print(f"   {nombre}: {por_complejidad.get(comp, 0)}")
         
         # Relaciones
-        total_relaciones = db.query(models.HSKEjemplo).count()
+        total_relaciones = totales['hsk_ejemplo']
         print(f"\n🔗 Relaciones HSK-Ejemplo: {total_relaciones}")
 
-def estadisticas_sm2(db):
+def estadisticas_sm2(db, totales):
     """Muestra estadísticas del sistema SM2"""
     print_section("8. ESTADÍSTICAS SISTEMA SM2")
     
     # Sesiones
-    total_sesiones = db.query(models.SM2Session).count()
+    total_sesiones = totales['sesiones']
     print(f"\n📅 Total sesiones: {total_sesiones}")
     
     if total_sesiones > 0:
-        ultima_sesion = db.query(models.SM2Session).order_by(
+        ultima_sesion = db.query(models.SM2Session.fecha_inicio).order_by(
             models.SM2Session.fecha_inicio.desc()
         ).first()
         print(f"   Última sesión: {ultima_sesion.fecha_inicio}")
     
     # Progreso
-    total_progress = db.query(models.SM2Progress).count()
+    total_progress = totales['progress']
     print(f"\n📊 Tarjetas con progreso: {total_progress}")
     
     if total_progress > 0:
+        por_estado = dict(
+            db.query(models.SM2Progress.estado, func.count())
+            .group_by(models.SM2Progress.estado).all()
+        )
         print("\n📈 Por estado:")
         for estado in ['nuevo', 'aprendiendo', 'dominada', 'madura']:
-            count = db.query(models.SM2Progress).filter(
-                models.SM2Progress.estado == estado
-            ).count()
-            print(f"   {estado.capitalize()}: {count}")
+            print(f"   {estado.capitalize()}: {por_estado.get(estado, 0)}")
         
         # Estadísticas de revisiones
-        total_reviews = db.query(models.SM2Review).count()
+        total_reviews = totales['reviews']
         print(f"\n🔄 Total revisiones: {total_reviews}")
 
 def verificar_integridad(db):
@@ -228,27 +278,27 @@ def verificar_integridad(db):
     
     problemas = []
     
-    # Diccionario sin HSK
-    dict_sin_hsk = db.query(models.Diccionario).outerjoin(
-        models.HSK, models.Diccionario.hsk_id == models.HSK.id
-    ).filter(models.HSK.id == None).count()
+    # Diccionario sin HSK (NOT EXISTS: anti-join por la clave primaria de hsk)
+    dict_sin_hsk = db.query(func.count()).select_from(models.Diccionario).filter(
+        ~exists().where(models.HSK.id == models.Diccionario.hsk_id)
+    ).scalar()
     
     if dict_sin_hsk > 0:
         problemas.append(f"⚠️  {dict_sin_hsk} entradas de diccionario sin HSK asociado")
     
     # Tarjetas sin referencia
-    tarjetas_huerfanas = db.query(models.Tarjeta).filter(
+    tarjetas_huerfanas = db.query(func.count()).select_from(models.Tarjeta).filter(
         models.Tarjeta.hsk_id == None,
         models.Tarjeta.ejemplo_id == None
-    ).count()
+    ).scalar()
     
     if tarjetas_huerfanas > 0:
         problemas.append(f"⚠️  {tarjetas_huerfanas} tarjetas sin referencia a HSK o Ejemplo")
     
     # Progress sin tarjeta
-    progress_sin_tarjeta = db.query(models.SM2Progress).outerjoin(
-        models.Tarjeta, models.SM2Progress.tarjeta_id == models.Tarjeta.id
-    ).filter(models.Tarjeta.id == None).count()
+    progress_sin_tarjeta = db.query(func.count()).select_from(models.SM2Progress).filter(
+        ~exists().where(models.Tarjeta.id == models.SM2Progress.tarjeta_id)
+    ).scalar()
     
     if progress_sin_tarjeta > 0:
         problemas.append(f"⚠️  {progress_sin_tarjeta} registros de progreso sin tarjeta")
@@ -260,30 +310,26 @@ def verificar_integridad(db):
     else:
         print("\n✅ No se encontraron problemas de integridad")
 
-def recomendaciones(db):
+def recomendaciones(totales):
     """Proporciona recomendaciones"""
     print_section("10. RECOMENDACIONES")
     
     recs = []
     
     # Verificar datos HSK
-    total_hsk = db.query(models.HSK).count()
-    if total_hsk == 0:
+    if totales['hsk'] == 0:
         recs.append("📥 Cargar datos HSK: python datos/cargar_hsk.py")
     
     # Verificar diccionario
-    total_dict = db.query(models.Diccionario).count()
-    if total_dict == 0:
+    if totales['diccionario'] == 0:
         recs.append("📚 Añadir palabras al diccionario desde la interfaz web")
     
     # Verificar ejemplos
-    total_ejemplos = db.query(models.Ejemplo).count()
-    if total_ejemplos == 0:
+    if totales['ejemplos'] == 0:
         recs.append("💬 Cargar ejemplos: python datos/cargar_ejemplos.py")
     
     # Verificar sesiones
-    total_sesiones = db.query(models.SM2Session).count()
-    if total_sesiones == 0:
+    if totales['sesiones'] == 0:
         recs.append("🧠 Iniciar primera sesión de estudio desde /sm2")
     
     if recs:
@@ -293,8 +339,8 @@ def recomendaciones(db):
     else:
         print("\n✅ El sistema está funcionando correctamente")
 
-def main():
-    """Función principal"""
+def ejecutar_diagnostico():
+    """Ejecuta todas las verificaciones imprimiendo el informe"""
     print("\n" + "="*70)
     print("  🔍 DIAGNÓSTICO CONSOLIDADO - CHIKNOW")
     print("="*70)
@@ -306,15 +352,18 @@ def main():
         verificar_estructura_bd()
         verificar_columnas_hsk()
         
-        estadisticas_hsk(db)
-        estadisticas_notas(db)
-        estadisticas_diccionario(db)
-        estadisticas_tarjetas(db)
-        estadisticas_ejemplos(db)
-        estadisticas_sm2(db)
+        # Todos los totales en un único viaje a la BD
+        totales = obtener_totales(db)
+        
+        estadisticas_hsk(db, totales)
+        estadisticas_notas(db, totales)
+        estadisticas_diccionario(db, totales)
+        estadisticas_tarjetas(totales)
+        estadisticas_ejemplos(db, totales)
+        estadisticas_sm2(db, totales)
         
         verificar_integridad(db)
-        recomendaciones(db)
+        recomendaciones(totales)
         
         print("\n" + "="*70)
         print("  ✅ DIAGNÓSTICO COMPLETADO")
@@ -327,5 +376,57 @@ def main():
     finally:
         db.close()
 
+def activar_perfilado():
+    """
+    Registra la duración de cada consulta ejecutada sobre el engine (--profile).
+    
+    Devuelve la lista, que se va llenando con tuplas (segundos, sentencia).
+    """
+    consultas = []
+    
+    @event.listens_for(engine, "before_cursor_execute")
+    def _inicio_consulta(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('inicio_consulta', []).append(time.perf_counter())
+    
+    @event.listens_for(engine, "after_cursor_execute")
+    def _fin_consulta(conn, cursor, statement, parameters, context, executemany):
+        inicio = conn.info['inicio_consulta'].pop()
+        consultas.append((time.perf_counter() - inicio, statement))
+    
+    return consultas
+
+def imprimir_perfil(consultas):
+    """Muestra el número de consultas, el tiempo total y las más lentas"""
+    print_section("PERFIL DE CONSULTAS")
+    
+    total = sum(duracion for duracion, _ in consultas)
+    print(f"\n⏱️  Consultas ejecutadas: {len(consultas)}")
+    print(f"   Tiempo total en BD: {total * 1000:.1f} ms")
+    
+    print("\n🐢 Consultas más lentas:")
+    mas_lentas = sorted(consultas, key=lambda c: c[0], reverse=True)[:5]
+    for duracion, sentencia in mas_lentas:
+        sentencia = " ".join(sentencia.split())
+        if len(sentencia) > 90:
+            sentencia = sentencia[:90] + "..."
+        print(f"   {duracion * 1000:8.2f} ms  {sentencia}")
+    print()
+
+def main():
+    """Función principal"""
+    # Con --profile se mide cada consulta; sin él no se registra ningún evento
+    consultas = activar_perfilado() if "--profile" in sys.argv else None
+    
+    # El informe se acumula en memoria y se escribe de una vez al final,
+    # en lugar de cientos de escrituras sueltas en stdout
+    salida = io.StringIO()
+    try:
+        with redirect_stdout(salida):
+            ejecutar_diagnostico()
+            if consultas is not None:
+                imprimir_perfil(consultas)
+    finally:
+        sys.stdout.write(salida.getvalue())
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -11,69 +11,109 @@ IMPORTANTE: Este script es seguro y no elimina datos existentes.
 
 import sys
 import os
+from functools import lru_cache
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from sqlalchemy import text
+from sqlalchemy import text, inspect, bindparam, DateTime, func
 from database import SessionLocal, engine
 import models
 
+# Columnas que la migración añade a hsk. Es una lista cerrada, así que las
+# sentencias se construyen una sola vez y nunca con datos externos
+COLUMNAS_NUEVAS_HSK = {
+    'categoria': 'TEXT',
+    'ejemplo': 'TEXT',
+    'significado_ejemplo': 'TEXT'
+}
+_ALTER_HSK = {
+    columna: text(f"ALTER TABLE hsk ADD COLUMN {columna} {tipo}")
+    for columna, tipo in COLUMNAS_NUEVAS_HSK.items()
+}
+
+# Notas del diccionario que aún no tienen entrada en la tabla notas
+_NOTAS_SIN_MIGRAR = """
+    FROM diccionario d
+    WHERE d.notas IS NOT NULL AND d.notas != ''
+      AND NOT EXISTS (SELECT 1 FROM notas n WHERE n.hsk_id = d.hsk_id)
+"""
+_MIGRAR_NOTAS = text(f"""
+    INSERT INTO notas (hsk_id, nota, created_at, updated_at)
+    SELECT d.hsk_id, d.notas, :ahora, :ahora
+    {_NOTAS_SIN_MIGRAR}
+""")
+_HAY_NOTAS_SIN_MIGRAR = text(f"SELECT 1 {_NOTAS_SIN_MIGRAR} LIMIT 1")
+
+_BEGIN = text("BEGIN")
+_ANALYZE = text("ANALYZE")
+
 def print_section(title):
     print("\n" + "="*60)
     print(f"  {title}")
     print("="*60)
 
+@lru_cache(maxsize=None)
+def _columnas(table_name):
+    """
+    Nombres de columna de una tabla, leídos una sola vez del catálogo.
+    
+    Tras un ALTER TABLE hay que llamar a _columnas.cache_clear().
+    """
+    return frozenset(col['name'] for col in inspect(engine).get_columns(table_name))
+
+@lru_cache(maxsize=None)
+def _tablas():
+    """
+    Nombres de las tablas de la BD, leídos una sola vez del catálogo.
+    
+    Tras crear una tabla hay que llamar a _tablas.cache_clear().
+    """
+    return frozenset(inspect(engine).get_table_names())
+
 def verificar_columna_existe(table_name, column_name):
     """Verifica si una columna existe en una tabla"""
-    db = SessionLocal()
-    try:
-        query = text(f"PRAGMA table_info({table_name})")
-        result = db.execute(query)
-        columnas = [row[1] for row in result]
-        return column_name in columnas
-    finally:
-        db.close()
+    return column_name in _columnas(table_name)
 
 def agregar_columnas_hsk():
     """Añade las nuevas columnas a la tabla HSK si no existen"""
     print_section("1. ACTUALIZANDO TABLA HSK")
     
-    db = SessionLocal()
-    
     try:
-        columnas_nuevas = {
-            'categoria': 'TEXT',
-            'ejemplo': 'TEXT',
-            'significado_ejemplo': 'TEXT'
-        }
-        
-        for columna, tipo in columnas_nuevas.items():
-            if verificar_columna_existe('hsk', columna):
-                print(f"   ✅ Columna '{columna}' ya existe")
-            else:
-                print(f"   ➕ Añadiendo columna '{columna}'...")
-                query = text(f"ALTER TABLE hsk ADD COLUMN {columna} {tipo}")
-                db.execute(query)
-                db.commit()
-                print(f"   ✅ Columna '{columna}' añadida")
+        # Todos los ALTER en una sola transacción: un único commit (y fsync)
+        # y, si alguno falla, la tabla queda como estaba
+        with engine.begin() as conn:
+            # pysqlite no abre transacción antes de DDL: sin BEGIN explícito
+            # cada ALTER se confirmaría por separado
+            conn.execute(_BEGIN)
+            for columna, alter in _ALTER_HSK.items():
+                if verificar_columna_existe('hsk', columna):
+                    print(f"   ✅ Columna '{columna}' ya existe")
+                else:
+                    print(f"   ➕ Añadiendo columna '{columna}'...")
+                    conn.execute(alter)
+                    print(f"   ✅ Columna '{columna}' añadida")
         
         print("\n✅ Tabla HSK actualizada correctamente")
         
     except Exception as e:
-        db.rollback()
         print(f"\n❌ Error al actualizar tabla HSK: {e}")
         raise
     finally:
-        db.close()
+        _columnas.cache_clear()
 
 def crear_tabla_notas():
     """Crea la tabla Notas si no existe"""
     print_section("2. CREANDO TABLA NOTAS")
     
+    if 'notas' in _tablas():
+        print("   ✅ Tabla 'notas' ya existe")
+        return
+    
     try:
         # Usar SQLAlchemy para crear la tabla
         models.Base.metadata.create_all(bind=engine, tables=[models.Notas.__table__])
-        print("   ✅ Tabla 'notas' creada (o ya existía)")
+        _tablas.cache_clear()
+        print("   ✅ Tabla 'notas' creada")
         
     except Exception as e:
         print(f"   ❌ Error al crear tabla notas: {e}")
@@ -92,27 +132,13 @@ def migrar_notas_diccionario():
     db = SessionLocal()
     
     try:
-        # Obtener todas las entradas del diccionario con notas
-        query = text("SELECT id, hsk_id, notas FROM diccionario WHERE notas IS NOT NULL AND notas != ''")
-        result = db.execute(query)
-        
-        count = 0
-        for row in result:
-            dict_id, hsk_id, notas = row
-            
-            # Verificar si ya existe una nota para este hsk_id
-            nota_existente = db.query(models.Notas).filter(
-                models.Notas.hsk_id == hsk_id
-            ).first()
-            
-            if not nota_existente:
-                # Crear nueva nota
-                nueva_nota = models.Notas(
-                    hsk_id=hsk_id,
-                    nota=notas
-                )
-                db.add(nueva_nota)
-                count += 1
+        # Copiar en bloque las notas del diccionario que aún no tengan nota
+        # para su hsk_id: un solo INSERT ... SELECT en lugar de una consulta
+        # y un objeto ORM por fila. El bindparam tipado guarda la fecha con
+        # el mismo formato que usa el ORM
+        ahora = bindparam("ahora", models.now_utc(), type_=DateTime())
+        result = db.execute(_MIGRAR_NOTAS.bindparams(ahora))
+        count = result.rowcount
         
         db.commit()
         
@@ -128,22 +154,76 @@ def migrar_notas_diccionario():
     finally:
         db.close()
 
+# Índices para los filtros del diagnóstico. Los parciales solo indexan las
+# filas no nulas, así que ocupan poco aunque la columna sea mayoritariamente NULL
+# (nombre, tabla, columna, condición del índice parcial o None)
+INDICES_DIAGNOSTICO = [
+    ('ix_tarjeta_hsk_id', 'tarjetas', 'hsk_id', 'hsk_id IS NOT NULL'),
+    ('ix_tarjeta_ejemplo_id', 'tarjetas', 'ejemplo_id', 'ejemplo_id IS NOT NULL'),
+    ('ix_notas_hsk_id', 'notas', 'hsk_id', None),
+    ('ix_ejemplo_complejidad', 'ejemplos', 'complejidad', None),
+    ('ix_diccionario_activo', 'diccionario', 'activo', None),
+    # Sustituye a idx_next_review en las BDs nuevas (ver models.SM2Progress)
+    ('idx_progress_due', 'sm2_progress', 'next_review, tarjeta_id', None),
+]
+_CREAR_INDICE = {
+    nombre: text(
+        f"CREATE INDEX IF NOT EXISTS {nombre} ON {tabla}({columna})"
+        + (f" WHERE {condicion}" if condicion else "")
+    )
+    for nombre, tabla, columna, condicion in INDICES_DIAGNOSTICO
+}
+# Índices sustituidos por otros de INDICES_DIAGNOSTICO: en las BDs existentes
+# solo costarían una escritura más por revisión
+INDICES_OBSOLETOS = [
+    'idx_next_review',  # -> idx_progress_due
+]
+_BORRAR_INDICE = {
+    nombre: text(f"DROP INDEX IF EXISTS {nombre}")
+    for nombre in INDICES_OBSOLETOS
+}
+
+def crear_indices():
+    """Crea los índices usados por el diagnóstico y actualiza las estadísticas"""
+    print_section("4. CREANDO ÍNDICES")
+    
+    # sm2_progress.estado ya tiene idx_estado definido en el modelo
+    try:
+        with engine.begin() as conn:
+            for nombre, tabla, _, _ in INDICES_DIAGNOSTICO:
+                if tabla not in _tablas():
+                    print(f"   ⏭️  Tabla '{tabla}' no existe, se omite {nombre}")
+                    continue
+                conn.execute(_CREAR_INDICE[nombre])
+                print(f"   ✅ {nombre}")
+            for nombre in INDICES_OBSOLETOS:
+                conn.execute(_BORRAR_INDICE[nombre])
+                print(f"   🗑️  {nombre} (obsoleto)")
+            # Estadísticas para que el planificador use los índices nuevos
+            conn.execute(_ANALYZE)
+        
+        print("\n✅ Índices creados (o ya existían)")
+        
+    except Exception as e:
+        print(f"\n❌ Error al crear índices: {e}")
+        raise
+
 def verificar_migracion():
     """Verifica que la migración se haya completado correctamente"""
-    print_section("4. VERIFICANDO MIGRACIÓN")
+    print_section("5. VERIFICANDO MIGRACIÓN")
     
     db = SessionLocal()
     
     try:
         # Verificar columnas HSK
-        for col in ['categoria', 'ejemplo', 'significado_ejemplo']:
+        for col in COLUMNAS_NUEVAS_HSK:
             if verificar_columna_existe('hsk', col):
                 print(f"   ✅ HSK.{col}")
             else:
                 print(f"   ❌ HSK.{col} - FALTA")
         
         # Verificar tabla Notas
-        total_notas = db.query(models.Notas).count()
+        total_notas = db.query(func.count()).select_from(models.Notas).scalar()
         print(f"\n   📝 Total notas en nueva tabla: {total_notas}")
         
         print("\n✅ Verificación completada")
@@ -153,27 +233,60 @@ def verificar_migracion():
     finally:
         db.close()
 
+def migracion_pendiente():
+    """Comprueba, sin modificar nada, si queda algún paso de la migración por aplicar"""
+    if not all(verificar_columna_existe('hsk', col) for col in COLUMNAS_NUEVAS_HSK):
+        return True
+    
+    if 'notas' not in _tablas():
+        return True
+    
+    if verificar_columna_existe('diccionario', 'notas'):
+        with engine.connect() as conn:
+            if conn.execute(_HAY_NOTAS_SIN_MIGRAR).first() is not None:
+                return True
+    
+    inspector = inspect(engine)
+    indices = {tabla: {idx['name'] for idx in inspector.get_indexes(tabla)} for tabla in _tablas()}
+    for nombre, tabla, _, _ in INDICES_DIAGNOSTICO:
+        if tabla in indices and nombre not in indices[tabla]:
+            return True
+    
+    # Un índice obsoleto que siga existiendo también queda por borrar
+    if any(nombre in nombres for nombres in indices.values() for nombre in INDICES_OBSOLETOS):
+        return True
+    
+    return False
+
 def main():
     """Función principal"""
     print("\n" + "="*60)
     print("  🔄 MIGRACIÓN DE BASE DE DATOS - CHIKNOW")
     print("="*60)
     
+    # Comprobación barata antes de preguntar: si todo está aplicado no hay nada que hacer
+    if not migracion_pendiente():
+        print("\n✅ La base de datos ya está migrada, nada que hacer")
+        return
+    
     print("\n⚠️  IMPORTANTE:")
     print("   - Esta migración es segura y no elimina datos")
     print("   - Se recomienda hacer backup de test.db antes de continuar")
     print("   - La migración puede tardar unos segundos")
     
-    respuesta = input("\n¿Deseas continuar? (s/n): ")
-    
-    if respuesta.lower() != 's':
-        print("\n❌ Migración cancelada")
-        return
+    # --yes / -y evita la pregunta (ejecución no interactiva)
+    if "--yes" not in sys.argv and "-y" not in sys.argv:
+        respuesta = input("\n¿Deseas continuar? (s/n): ")
+        
+        if respuesta.lower() != 's':
+            print("\n❌ Migración cancelada")
+            return
     
     try:
         agregar_columnas_hsk()
         crear_tabla_notas()
         migrar_notas_diccionario()
+        crear_indices()
         verificar_migracion()
         
         print("\n" + "="*60)
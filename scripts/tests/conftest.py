@@ -4,8 +4,9 @@ Configuración global de pytest para Chiknow
 import pytest
 import os
 import sys
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
 
 # Agregar el directorio raíz al path para imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -13,17 +14,41 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from app.database import Base
 
 
-# Configuración de base de datos de prueba
-TEST_DATABASE_URL = "sqlite:///./test_chiknow.db"
+# Configuración de base de datos de prueba: SQLite en memoria. StaticPool hace
+# que todas las conexiones del motor (incluida la del hilo de TestClient)
+# compartan la misma BD, y cada proceso de pytest-xdist tiene la suya
+TEST_DATABASE_URL = "sqlite://"
 
 
 @pytest.fixture(scope="session")
 def test_engine():
-    """Motor de base de datos para tests"""
+    """Motor de base de datos para tests, con el esquema creado una sola vez"""
     engine = create_engine(
         TEST_DATABASE_URL,
-        connect_args={"check_same_thread": False}
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
     )
+    
+    # pysqlite no emite BEGIN por sí mismo (y un SAVEPOINT fuera de transacción
+    # se confirmaría al liberarlo): se desactiva su gestión de transacciones y
+    # SQLAlchemy emite el BEGIN, para que el rollback de cada test deshaga todo.
+    # La BD se tira al terminar, así que tampoco hace falta sincronizar con disco
+    # (solo este motor: el de app.database no se toca)
+    @event.listens_for(engine, "connect")
+    def _configurar_conexion(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA synchronous=OFF")
+        cursor.execute("PRAGMA journal_mode=MEMORY")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA cache_size=-20000")
+        cursor.close()
+    
+    @event.listens_for(engine, "begin")
+    def _emitir_begin(conn):
+        conn.exec_driver_sql("BEGIN")
+    
+    Base.metadata.create_all(bind=engine)
     yield engine
     engine.dispose()
 
@@ -34,23 +59,82 @@ def test_session_factory(test_engine):
     return sessionmaker(autocommit=False, autoflush=False, bind=test_engine)
 
 
+@pytest.fixture(scope="session")
+def sesion_de_prueba(test_session_factory):
+    """Abre sesiones unidas a una conexión con SAVEPOINTs (sus commit() no se confirman)"""
+    def abrir(connection):
+        return test_session_factory(bind=connection, join_transaction_mode="create_savepoint")
+    return abrir
+
+
+@pytest.fixture
+def conexion(test_engine):
+    """
+    Conexión con una transacción externa que se revierte al terminar el test.
+    
+    Las sesiones se unen a ella con SAVEPOINTs, así que los commit() de la app
+    no llegan a confirmarse y cada test empieza con la BD vacía.
+    """
+    connection = test_engine.connect()
+    transaction = connection.begin()
+    yield connection
+    transaction.rollback()
+    connection.close()
+
+
 @pytest.fixture(scope="function")
-def db_session(test_engine, test_session_factory):
+def db_session(conexion, sesion_de_prueba):
+    """Sesión de base de datos para cada test, dentro de la transacción de conexion"""
+    db = sesion_de_prueba(conexion)
+    yield db
+    db.close()
+
+
+@pytest.fixture(scope="session")
+def cliente_compartido():
+    """TestClient único para toda la sesión (el arranque de la app se hace una vez)"""
+    from fastapi.testclient import TestClient
+    from app.main import app
+    
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+def _limitadores(app):
+    """Instancias de RateLimitMiddleware en la pila de middleware de la app"""
+    from app.middleware import RateLimitMiddleware
+    
+    capa = app.middleware_stack
+    while capa is not None:
+        if isinstance(capa, RateLimitMiddleware):
+            yield capa
+        capa = getattr(capa, "app", None)
+
+
+@pytest.fixture(scope="function")
+def client(cliente_compartido, conexion, sesion_de_prueba):
     """
-    Sesión de base de datos para cada test
-    Se crea y destruye para cada test
+    Cliente de prueba, con get_db apuntando a la transacción del test
+    
+    El cliente (y su middleware) se comparte en toda la sesión, así que el
+    contador del rate limit se pone a cero para que cada test empiece libre.
     """
-    # Crear todas las tablas
-    Base.metadata.create_all(bind=test_engine)
+    from app.database import get_db
     
-    # Crear sesión
-    session = test_session_factory()
+    app = cliente_compartido.app
+    for limitador in _limitadores(app):
+        limitador.requests.clear()
     
-    yield session
+    def override_get_db():
+        db = sesion_de_prueba(conexion)
+        try:
+            yield db
+        finally:
+            db.close()
     
-    # Limpiar
-    session.close()
-    Base.metadata.drop_all(bind=test_engine)
+    app.dependency_overrides[get_db] = override_get_db
+    yield cliente_compartido
+    app.dependency_overrides.pop(get_db, None)
 
 
 @pytest.fixture(autouse=True)
@@ -1,51 +1,17 @@
 """
 Tests de integración para la API de Chiknow
+
+La BD es SQLite en memoria y cada proceso tiene la suya, así que el módulo
+puede repartirse entre workers de pytest-xdist sin compartir ficheros:
+
+    pytest -n auto tests/test_api.py
 """
+import asyncio
+import httpx
 import pytest
-from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
 from app.main import app
-from app.database import Base, get_db
-from app import models
-
-
-# Base de datos de prueba en memoria
-SQLALCHEMY_TEST_DATABASE_URL = "sqlite:///./test.db"
-engine = create_engine(SQLALCHEMY_TEST_DATABASE_URL, connect_args={"check_same_thread": False})
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-
-# Override de dependencia
-def override_get_db():
-    try:
-        db = TestingSessionLocal()
-        yield db
-    finally:
-        db.close()
-
-
-app.dependency_overrides[get_db] = override_get_db
-
-
-@pytest.fixture(scope="function")
-def client():
-    """Cliente de prueba"""
-    # Crear tablas
-    Base.metadata.create_all(bind=engine)
-    yield TestClient(app)
-    # Limpiar tablas
-    Base.metadata.drop_all(bind=engine)
-
-
-@pytest.fixture
-def db_session():
-    """Sesión de base de datos para tests"""
-    Base.metadata.create_all(bind=engine)
-    db = TestingSessionLocal()
-    yield db
-    db.close()
-    Base.metadata.drop_all(bind=engine)
+from app.database import get_db
+from app import models, repository, service
 
 
 @pytest.fixture
@@ -60,10 +26,22 @@ def sample_hsk_word(db_session):
     )
     db_session.add(word)
     db_session.commit()
-    db_session.refresh(word)
     return word
 
 
+@pytest.fixture
+def sample_palabra_en_diccionario(db_session, sample_hsk_word):
+    """Palabra de muestra ya añadida al diccionario (con sus 6 tarjetas), sin pasar por HTTP"""
+    assert service.agregar_palabra_y_generar_tarjetas(db_session, sample_hsk_word.id)
+    return sample_hsk_word
+
+
+@pytest.fixture
+def sample_nota(db_session, sample_hsk_word):
+    """Nota de muestra de la palabra HSK, creada sin pasar por HTTP"""
+    return repository.create_or_update_nota(db_session, sample_hsk_word.id, "Nota de prueba")
+
+
 class TestHealthEndpoint:
     """Tests para el endpoint de salud"""
     
@@ -111,6 +89,20 @@ class TestHSKEndpoints:
         assert data[0]["espanol"] == "tú"
         assert "en_diccionario" in data[0]
     
+    def test_list_hsk_sees_previous_request(self, client, sample_hsk_word):
+        """Cada petición ve lo que cambió la anterior (el listado no se cachea)"""
+        assert client.get("/api/hsk").json()[0]["espanol"] == "tú"
+        
+        response = client.post(f"/api/hsk/add-traduccion/{sample_hsk_word.id}?traduccion=usted")
+        assert response.status_code == 200
+        
+        data = client.get("/api/hsk").json()
+        assert data[0]["espanol"] == "tú, usted"
+        assert data[0]["en_diccionario"] is False
+        
+        client.post(f"/api/diccionario/add/{sample_hsk_word.id}")
+        assert client.get("/api/hsk").json()[0]["en_diccionario"] is True
+    
     def test_search_hsk_found(self, client, sample_hsk_word):
         """Buscar HSK - encontrado"""
         response = client.get("/api/hsk/search?query=你")
@@ -147,23 +139,16 @@ class TestDiccionarioEndpoints:
         assert data["status"] == "ok"
         assert "tarjetas creadas" in data["message"]
     
-    def test_add_duplicate_to_diccionario(self, client, sample_hsk_word):
+    def test_add_duplicate_to_diccionario(self, client, sample_palabra_en_diccionario):
         """Agregar palabra duplicada al diccionario"""
-        # Primera vez - éxito
-        client.post(f"/api/diccionario/add/{sample_hsk_word.id}")
-        
-        # Segunda vez - error
-        response = client.post(f"/api/diccionario/add/{sample_hsk_word.id}")
+        # La palabra ya está en el diccionario - error
+        response = client.post(f"/api/diccionario/add/{sample_palabra_en_diccionario.id}")
         assert response.status_code == 400
         assert "ya está" in response.json()["detail"]
     
-    def test_remove_from_diccionario(self, client, sample_hsk_word):
+    def test_remove_from_diccionario(self, client, sample_palabra_en_diccionario):
         """Eliminar palabra del diccionario"""
-        # Primero agregar
-        client.post(f"/api/diccionario/add/{sample_hsk_word.id}")
-        
-        # Luego eliminar
-        response = client.delete(f"/api/diccionario/remove/{sample_hsk_word.id}")
+        response = client.delete(f"/api/diccionario/remove/{sample_palabra_en_diccionario.id}")
         assert response.status_code == 200
         
         data = response.json()
@@ -175,12 +160,8 @@ class TestDiccionarioEndpoints:
         assert response.status_code == 200
         assert response.json() == []
     
-    def test_list_diccionario_with_data(self, client, sample_hsk_word):
+    def test_list_diccionario_with_data(self, client, sample_palabra_en_diccionario):
         """Listar diccionario con datos"""
-        # Agregar palabra
-        client.post(f"/api/diccionario/add/{sample_hsk_word.id}")
-        
-        # Listar
         response = client.get("/api/diccionario")
         assert response.status_code == 200
         
@@ -214,15 +195,8 @@ class TestNotasEndpoints:
         assert data["status"] == "ok"
         assert data["nota"] == "Esta es una nota de prueba"
     
-    def test_update_nota(self, client, sample_hsk_word):
+    def test_update_nota(self, client, sample_hsk_word, sample_nota):
         """Actualizar nota existente"""
-        # Crear nota
-        client.post(
-            f"/api/hsk/{sample_hsk_word.id}/nota",
-            json={"nota": "Nota original"}
-        )
-        
-        # Actualizar
         response = client.post(
             f"/api/hsk/{sample_hsk_word.id}/nota",
             json={"nota": "Nota actualizada"}
@@ -232,30 +206,16 @@ class TestNotasEndpoints:
         data = response.json()
         assert data["nota"] == "Nota actualizada"
     
-    def test_delete_nota(self, client, sample_hsk_word):
+    def test_delete_nota(self, client, sample_hsk_word, sample_nota):
         """Eliminar nota"""
-        # Crear nota
-        client.post(
-            f"/api/hsk/{sample_hsk_word.id}/nota",
-            json={"nota": "Nota para eliminar"}
-        )
-        
-        # Eliminar
         response = client.delete(f"/api/hsk/{sample_hsk_word.id}/nota")
         assert response.status_code == 200
         
         data = response.json()
         assert data["status"] == "ok"
     
-    def test_list_all_notas(self, client, sample_hsk_word):
+    def test_list_all_notas(self, client, sample_nota):
         """Listar todas las notas"""
-        # Crear nota
-        client.post(
-            f"/api/hsk/{sample_hsk_word.id}/nota",
-            json={"nota": "Nota de prueba"}
-        )
-        
-        # Listar
         response = client.get("/api/notas")
         assert response.status_code == 200
         
@@ -273,24 +233,16 @@ class TestTarjetasEndpoints:
         assert response.status_code == 200
         assert response.json() == []
     
-    def test_get_tarjetas_after_adding_word(self, client, sample_hsk_word):
-        """Obtener tarjetas después de agregar palabra"""
-        # Agregar palabra (genera 6 tarjetas)
-        client.post(f"/api/diccionario/add/{sample_hsk_word.id}")
-        
-        # Obtener tarjetas
+    def test_get_tarjetas_after_adding_word(self, client, sample_palabra_en_diccionario):
+        """Obtener tarjetas después de agregar palabra (genera 6 tarjetas)"""
         response = client.get("/api/tarjetas")
         assert response.status_code == 200
         
         data = response.json()
         assert len(data) == 6  # 6 tarjetas por palabra
     
-    def test_get_estadisticas_tarjetas(self, client, sample_hsk_word):
+    def test_get_estadisticas_tarjetas(self, client, sample_palabra_en_diccionario):
         """Obtener estadísticas de tarjetas"""
-        # Agregar palabra
-        client.post(f"/api/diccionario/add/{sample_hsk_word.id}")
-        
-        # Estadísticas
         response = client.get("/api/tarjetas/estadisticas")
         assert response.status_code == 200
         
@@ -299,6 +251,33 @@ class TestTarjetasEndpoints:
         assert data["total_palabras_diccionario"] == 1
 
 
+async def _rafaga(url, n):
+    """
+    Lanza n peticiones GET concurrentes contra la app, sin pasar por TestClient
+    
+    Las peticiones llegan a la vez al middleware; solo el acceso a la BD va
+    por turnos, porque todas comparten la única conexión de StaticPool.
+    """
+    override = app.dependency_overrides[get_db]
+    turno = asyncio.Lock()
+    
+    async def override_por_turnos():
+        async with turno:
+            sesiones = override()
+            try:
+                yield next(sesiones)
+            finally:
+                sesiones.close()
+    
+    app.dependency_overrides[get_db] = override_por_turnos
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as ac:
+            return await asyncio.gather(*[ac.get(url) for _ in range(n)])
+    finally:
+        app.dependency_overrides[get_db] = override
+
+
 class TestRateLimiting:
     """Tests para rate limiting"""
     
@@ -315,16 +294,11 @@ class TestRateLimiting:
         """Rate limit se excede con muchas peticiones"""
         # Este test puede ser lento y depende de la configuración
         # En producción el límite es 100/min
-        # Hacer 101 peticiones rápidas
-        responses = []
-        for _ in range(101):
-            response = client.get("/api/hsk")
-            responses.append(response.status_code)
+        # Hacer 101 peticiones a la vez contra la app ASGI
+        responses = [r.status_code for r in asyncio.run(_rafaga("/api/hsk", 101))]
         
         # Al menos una debe ser 429 (Too Many Requests)
-        # Nota: esto puede no funcionar en tests debido a que cada
-        # test tiene su propia instancia del middleware
-        # assert 429 in responses
+        assert 429 in responses
 
 
 class TestErrorHandling:
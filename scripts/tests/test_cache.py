@@ -9,6 +9,16 @@ from app.schemas import (
 )
 
 
+def _campos_con_error(error):
+    """Campos (loc) que fallaron, sin formatear el mensaje completo del error"""
+    return {tuple(detalle["loc"]) for detalle in error.errors()}
+
+
+def _mensajes_de_error(error):
+    """Mensajes de cada error de validación, unidos en una sola cadena"""
+    return " ".join(detalle["msg"] for detalle in error.errors())
+
+
 class TestReviewRequest:
     """Tests para ReviewRequest schema"""
     
@@ -27,19 +37,19 @@ class TestReviewRequest:
         assert request.hanzi_fallados is None
         assert request.frase_fallada is False
     
-    def test_quality_must_be_between_0_and_2(self):
-        """Quality debe estar entre 0 y 2"""
-        # Válido: 0, 1, 2
-        for quality in [0, 1, 2]:
-            data = {"tarjeta_id": 1, "session_id": 1, "quality": quality}
-            request = ReviewRequest(**data)
-            assert request.quality == quality
-        
-        # Inválido: -1, 3, 10
-        for quality in [-1, 3, 10]:
-            with pytest.raises(ValidationError) as exc_info:
-                ReviewRequest(tarjeta_id=1, session_id=1, quality=quality)
-            assert "quality" in str(exc_info.value)
+    @pytest.mark.parametrize("quality", [0, 1, 2])
+    def test_quality_between_0_and_2_accepted(self, quality):
+        """Quality entre 0 y 2 es válido"""
+        data = {"tarjeta_id": 1, "session_id": 1, "quality": quality}
+        request = ReviewRequest(**data)
+        assert request.quality == quality
+    
+    @pytest.mark.parametrize("quality", [-1, 3, 10])
+    def test_quality_out_of_range_rejected(self, quality):
+        """Quality fuera de 0-2 se rechaza"""
+        with pytest.raises(ValidationError) as exc_info:
+            ReviewRequest(tarjeta_id=1, session_id=1, quality=quality)
+        assert ("quality",) in _campos_con_error(exc_info.value)
     
     def test_tarjeta_id_must_be_positive(self):
         """tarjeta_id debe ser positivo"""
@@ -76,7 +86,7 @@ class TestReviewRequest:
         # Debe rechazar texto demasiado largo
         with pytest.raises(ValidationError) as exc_info:
             ReviewRequest(**data)
-        assert "respuesta_usuario" in str(exc_info.value)
+        assert ("respuesta_usuario",) in _campos_con_error(exc_info.value)
         
         # Texto de exactamente 500 caracteres debe pasar
         valid_data = data.copy()
@@ -128,7 +138,7 @@ class TestNotaRequest:
         # Debe rechazar nota demasiado larga
         with pytest.raises(ValidationError) as exc_info:
             NotaRequest(nota=long_nota)
-        assert "nota" in str(exc_info.value)
+        assert ("nota",) in _campos_con_error(exc_info.value)
         
         # Exactamente 2000 debe pasar
         valid_nota = "a" * 2000
@@ -165,35 +175,39 @@ class TestSearchQuery:
         # Debe rechazar query demasiado largo
         with pytest.raises(ValidationError) as exc_info:
             SearchQuery(query=long_query)
-        assert "query" in str(exc_info.value)
+        assert ("query",) in _campos_con_error(exc_info.value)
         
         # Exactamente 100 debe pasar
         valid_query = "a" * 100
         query = SearchQuery(query=valid_query)
         assert len(query.query) == 100
     
-    def test_dangerous_characters_rejected(self):
-        """Rechaza caracteres SQL peligrosos"""
-        dangerous_queries = [
+    @pytest.mark.parametrize(
+        "dangerous",
+        [
             "hello; DROP TABLE",
             "test--comment",
             "/* comment */",
             "xp_cmdshell",
             "DELETE FROM"
-        ]
-        
-        for dangerous in dangerous_queries:
-            with pytest.raises(ValidationError) as exc_info:
-                SearchQuery(query=dangerous)
-            assert "no permitida" in str(exc_info.value).lower()
-    
-    def test_safe_queries_accepted(self):
+        ],
+        ids=["punto_y_coma", "comentario_linea", "comentario_bloque", "xp_", "delete"]
+    )
+    def test_dangerous_characters_rejected(self, dangerous):
+        """Rechaza caracteres SQL peligrosos"""
+        with pytest.raises(ValidationError) as exc_info:
+            SearchQuery(query=dangerous)
+        assert "no permitida" in _mensajes_de_error(exc_info.value).lower()
+    
+    @pytest.mark.parametrize(
+        "safe",
+        ["你好", "hello", "nǐ hǎo", "test123", "José"],
+        ids=["hanzi", "ascii", "pinyin", "alfanumerico", "acento"]
+    )
+    def test_safe_queries_accepted(self, safe):
         """Acepta queries seguros"""
-        safe_queries = ["你好", "hello", "nǐ hǎo", "test123", "José"]
-        
-        for safe in safe_queries:
-            query = SearchQuery(query=safe)
-            assert query.query == safe
+        query = SearchQuery(query=safe)
+        assert query.query == safe
 
 
 class TestHSKWordCreate:
@@ -322,7 +336,7 @@ class TestEjemploCreate:
                 espanol="Yo bebo té",
                 hanzi_ids=[1, -1, 3]
             )
-        assert "positivos" in str(exc_info.value)
+        assert "positivos" in _mensajes_de_error(exc_info.value)
 
 
 class TestPaginationParams:
@@ -405,27 +419,33 @@ class TestSchemasIntegration:
         assert pagination.limit == 10
 
 
-# Fixtures
-@pytest.fixture
+# Fixtures: los datos se construyen una vez por módulo; los tests que
+# necesiten variarlos crean un dict nuevo en lugar de mutar el compartido
+_VALID_REVIEW = {
+    "tarjeta_id": 1,
+    "session_id": 1,
+    "quality": 2
+}
+
+_VALID_HSK = {
+    "numero": 1,
+    "nivel": 1,
+    "hanzi": "你",
+    "pinyin": "nǐ",
+    "espanol": "tú"
+}
+
+
+@pytest.fixture(scope="module")
 def valid_review_data():
     """Datos válidos para ReviewRequest"""
-    return {
-        "tarjeta_id": 1,
-        "session_id": 1,
-        "quality": 2
-    }
+    return _VALID_REVIEW
 
 
-@pytest.fixture
+@pytest.fixture(scope="module")
 def valid_hsk_data():
     """Datos válidos para HSKWordCreate"""
-    return {
-        "numero": 1,
-        "nivel": 1,
-        "hanzi": "你",
-        "pinyin": "nǐ",
-        "espanol": "tú"
-    }
+    return _VALID_HSK
 
 
 class TestSchemasWithFixtures:
@@ -441,9 +461,7 @@ class TestSchemasWithFixtures:
         """Modifica datos HSK y crea diferentes palabras"""
         words = []
         for i in range(3):
-            data = valid_hsk_data.copy()
-            data["numero"] = i + 1
-            words.append(HSKWordCreate(**data))
+            words.append(HSKWordCreate(**{**valid_hsk_data, "numero": i + 1}))
         
         assert len(words) == 3
         assert [w.numero for w in words] == [1, 2, 3]
@@ -2,114 +2,136 @@
 Tests unitarios para app/cache.py
 """
 import pytest
-import time
+from datetime import datetime, timedelta
 from app.cache import cache, invalidate_cache, get_cache_stats, cleanup_expired_cache
 
 
+@pytest.fixture
+def reloj(monkeypatch):
+    """Reloj simulado para app.cache: avanzar(segundos) adelanta el tiempo sin esperar"""
+    ahora = [datetime(2024, 1, 1, 12, 0, 0)]
+    monkeypatch.setattr("app.cache._now", lambda: ahora[0])
+    
+    def avanzar(segundos):
+        ahora[0] += timedelta(seconds=segundos)
+    
+    return avanzar
+
+
+# Funciones cacheadas compartidas por los tests (se decoran una sola vez);
+# _LLAMADAS cuenta sus ejecuciones y se pone a cero antes de cada test
+_LLAMADAS = {"calcular": 0, "efimero": 0, "saludar": 0, "falla": 0, "lista": 0, "sesion": 0}
+
+
+@cache(ttl_seconds=60)
+def _calcular(*numeros):
+    _LLAMADAS["calcular"] += 1
+    return sum(numeros) if numeros else None
+
+
+@cache(ttl_seconds=1)
+def _efimero():
+    _LLAMADAS["efimero"] += 1
+    return _LLAMADAS["efimero"]
+
+
+@cache(ttl_seconds=60)
+def _saludar(name, greeting="Hello"):
+    _LLAMADAS["saludar"] += 1
+    return f"{greeting}, {name}!"
+
+
+@cache(ttl_seconds=60)
+def _falla():
+    _LLAMADAS["falla"] += 1
+    raise ValueError("Error")
+
+
+@cache(ttl_seconds=60)
+def _lista():
+    _LLAMADAS["lista"] += 1
+    return [1, 2, 3]
+
+
+@cache(ttl_seconds=60)
+def _por_sesion(db):
+    _LLAMADAS["sesion"] += 1
+    return "data"
+
+
+@cache(ttl_seconds=60)
+def _user_data(user_id):
+    return f"data_{user_id}"
+
+
+@cache(ttl_seconds=60)
+def _post_data(post_id):
+    return f"post_{post_id}"
+
+
+@cache(ttl_seconds=60)
+def _repetir_x(size):
+    return "x" * size
+
+
+@pytest.fixture(autouse=True)
+def _reiniciar_llamadas():
+    for nombre in _LLAMADAS:
+        _LLAMADAS[nombre] = 0
+
+
 class TestCacheDecorator:
     """Tests para el decorator @cache"""
     
-    def test_cache_stores_result(self):
-        """Caché almacena resultado de función"""
-        call_count = 0
-        
-        @cache(ttl_seconds=60)
-        def expensive_function(x):
-            nonlocal call_count
-            call_count += 1
-            return x * 2
-        
-        # Primera llamada - ejecuta función
-        result1 = expensive_function(5)
-        assert result1 == 10
-        assert call_count == 1
-        
-        # Segunda llamada - usa caché
-        result2 = expensive_function(5)
-        assert result2 == 10
-        assert call_count == 1  # No incrementó
-    
-    def test_cache_different_arguments(self):
-        """Caché distingue entre diferentes argumentos"""
-        call_count = 0
-        
-        @cache(ttl_seconds=60)
-        def add(a, b):
-            nonlocal call_count
-            call_count += 1
-            return a + b
-        
-        result1 = add(1, 2)
-        result2 = add(3, 4)
-        result3 = add(1, 2)  # Mismos args que result1
-        
-        assert result1 == 3
-        assert result2 == 7
-        assert result3 == 3
-        assert call_count == 2  # Solo 2 ejecuciones (3ra usa caché)
+    @pytest.mark.parametrize("llamadas,esperados,ejecuciones", [
+        ([(5,), (5,)], [5, 5], 1),                  # Segunda llamada usa caché
+        ([(1, 2), (3, 4), (1, 2)], [3, 7, 3], 2),   # 3ra llamada usa caché
+        ([(), ()], [None, None], 1),                # None también se cachea
+        ([(1,), (True,), (1.0,)], [1, 1, 1.0], 3),  # Valores iguales de tipos distintos
+    ], ids=["almacena_resultado", "argumentos_distintos", "retorno_none", "tipos_distintos"])
+    def test_cache_hits_and_misses(self, llamadas, esperados, ejecuciones):
+        """Caché guarda el resultado por argumentos y solo ejecuta en cada MISS"""
+        resultados = [_calcular(*args) for args in llamadas]
+        
+        assert resultados == esperados
+        assert _LLAMADAS["calcular"] == ejecuciones
     
-    def test_cache_expiration(self):
+    def test_cache_expiration(self, reloj):
         """Caché expira después del TTL"""
-        call_count = 0
-        
-        @cache(ttl_seconds=1)  # 1 segundo
-        def get_time():
-            nonlocal call_count
-            call_count += 1
-            return time.time()
-        
         # Primera llamada
-        time1 = get_time()
-        assert call_count == 1
+        time1 = _efimero()
+        assert _LLAMADAS["efimero"] == 1
         
         # Segunda llamada inmediata - usa caché
-        time2 = get_time()
+        time2 = _efimero()
         assert time1 == time2
-        assert call_count == 1
+        assert _LLAMADAS["efimero"] == 1
         
-        # Esperar a que expire
-        time.sleep(1.1)
+        # Dejar que expire (TTL de 1 segundo)
+        reloj(1.1)
         
         # Tercera llamada - caché expiró
-        time3 = get_time()
+        time3 = _efimero()
         assert time3 != time1
-        assert call_count == 2
+        assert _LLAMADAS["efimero"] == 2
     
     def test_cache_with_kwargs(self):
         """Caché funciona con keyword arguments"""
-        call_count = 0
-        
-        @cache(ttl_seconds=60)
-        def greet(name, greeting="Hello"):
-            nonlocal call_count
-            call_count += 1
-            return f"{greeting}, {name}!"
-        
-        result1 = greet("Alice")
-        result2 = greet(name="Alice")
-        result3 = greet("Bob")
+        result1 = _saludar("Alice")
+        result2 = _saludar(name="Alice")
+        result3 = _saludar("Bob")
         
         assert result1 == "Hello, Alice!"
         assert result2 == "Hello, Alice!"
         assert result3 == "Hello, Bob!"
-        assert call_count == 2  # Alice y Bob
+        assert _LLAMADAS["saludar"] == 2  # Alice y Bob
     
-    def test_cache_with_none_return(self):
-        """Caché funciona con funciones que retornan None"""
-        call_count = 0
-        
-        @cache(ttl_seconds=60)
-        def returns_none():
-            nonlocal call_count
-            call_count += 1
-            return None
+    def test_cache_keys_session_by_bind(self, test_session_factory):
+        """Sesiones distintas sobre el mismo motor comparten la entrada del caché"""
+        with test_session_factory() as db1, test_session_factory() as db2:
+            assert _por_sesion(db1) == _por_sesion(db2)
         
-        result1 = returns_none()
-        result2 = returns_none()
-        
-        assert result1 is None
-        assert result2 is None
-        assert call_count == 1
+        assert _LLAMADAS["sesion"] == 1
 
 
 class TestInvalidateCache:
@@ -117,17 +139,9 @@ class TestInvalidateCache:
     
     def test_invalidate_all_cache(self):
         """Invalida todo el caché"""
-        @cache(ttl_seconds=60)
-        def func1():
-            return 1
-        
-        @cache(ttl_seconds=60)
-        def func2():
-            return 2
-        
         # Poblar caché
-        func1()
-        func2()
+        _calcular(1)
+        _calcular(2)
         
         # Verificar que hay caché
         stats = get_cache_stats()
@@ -142,18 +156,10 @@ class TestInvalidateCache:
     
     def test_invalidate_specific_pattern(self):
         """Invalida caché con patrón específico"""
-        @cache(ttl_seconds=60)
-        def user_data(user_id):
-            return f"data_{user_id}"
-        
-        @cache(ttl_seconds=60)
-        def post_data(post_id):
-            return f"post_{post_id}"
-        
         # Poblar caché
-        user_data(1)
-        user_data(2)
-        post_data(1)
+        _user_data(1)
+        _user_data(2)
+        _post_data(1)
         
         # Invalidar solo user_data
         invalidate_cache("user_data")
@@ -187,17 +193,13 @@ class TestGetCacheStats:
         """Estadísticas reflejan operaciones"""
         invalidate_cache()
         
-        @cache(ttl_seconds=60)
-        def test_func(x):
-            return x * 2
-        
         # Sin caché
         stats1 = get_cache_stats()
         initial_count = stats1["total_entries"]
         
         # Agregar al caché
-        test_func(1)
-        test_func(2)
+        _calcular(1)
+        _calcular(2)
         
         stats2 = get_cache_stats()
         assert stats2["total_entries"] >= initial_count + 2
@@ -206,22 +208,18 @@ class TestGetCacheStats:
 class TestCleanupExpiredCache:
     """Tests para cleanup_expired_cache()"""
     
-    def test_cleanup_removes_expired(self):
+    def test_cleanup_removes_expired(self, reloj):
         """Limpieza remueve entradas expiradas"""
         invalidate_cache()
         
-        @cache(ttl_seconds=1)
-        def short_lived():
-            return "data"
-        
-        # Crear entrada
-        short_lived()
+        # Crear entrada (TTL de 1 segundo)
+        _efimero()
         
         stats_before = get_cache_stats()
         assert stats_before["total_entries"] >= 1
         
-        # Esperar a que expire
-        time.sleep(1.1)
+        # Dejar que expire
+        reloj(1.1)
         
         # Limpiar
         cleanup_expired_cache()
@@ -235,12 +233,8 @@ class TestCleanupExpiredCache:
         """Limpieza preserva entradas activas"""
         invalidate_cache()
         
-        @cache(ttl_seconds=60)
-        def long_lived():
-            return "data"
-        
         # Crear entrada que no expira pronto
-        long_lived()
+        _calcular(1)
         
         stats_before = get_cache_stats()
         active_before = stats_before["active_entries"]
@@ -257,32 +251,20 @@ class TestCacheEdgeCases:
     
     def test_cache_with_exception(self):
         """Caché no almacena excepciones"""
-        call_count = 0
-        
-        @cache(ttl_seconds=60)
-        def fails():
-            nonlocal call_count
-            call_count += 1
-            raise ValueError("Error")
-        
         # Primera llamada - falla
         with pytest.raises(ValueError):
-            fails()
-        assert call_count == 1
+            _falla()
+        assert _LLAMADAS["falla"] == 1
         
         # Segunda llamada - ejecuta de nuevo (no usa caché)
         with pytest.raises(ValueError):
-            fails()
-        assert call_count == 2
+            _falla()
+        assert _LLAMADAS["falla"] == 2
     
     def test_cache_with_large_data(self):
         """Caché maneja datos grandes"""
-        @cache(ttl_seconds=60)
-        def large_data():
-            return "x" * 10000
-        
-        result1 = large_data()
-        result2 = large_data()
+        result1 = _repetir_x(10000)
+        result2 = _repetir_x(10000)
         
         assert result1 == result2
         assert len(result1) == 10000
@@ -292,20 +274,12 @@ class TestCacheEdgeCases:
     
     def test_cache_with_mutable_return(self):
         """Caché con retorno mutable (lista, dict)"""
-        call_count = 0
-        
-        @cache(ttl_seconds=60)
-        def get_list():
-            nonlocal call_count
-            call_count += 1
-            return [1, 2, 3]
-        
-        result1 = get_list()
-        result2 = get_list()
+        result1 = _lista()
+        result2 = _lista()
         
         # Ambos apuntan al mismo objeto (cuidado!)
         assert result1 is result2
-        assert call_count == 1
+        assert _LLAMADAS["lista"] == 1
         
         # Modificar result1 también modifica result2
         result1.append(4)
@@ -316,42 +290,23 @@ class TestCachePerformance:
     """Tests de rendimiento del caché"""
     
     def test_cache_improves_performance(self):
-        """Caché mejora el rendimiento"""
-        call_count = 0
-        
-        @cache(ttl_seconds=60)
-        def slow_function():
-            nonlocal call_count
-            call_count += 1
-            time.sleep(0.1)  # Simular operación lenta
-            return "result"
-        
-        # Primera llamada - lenta
-        start1 = time.time()
-        result1 = slow_function()
-        time1 = time.time() - start1
-        
-        # Segunda llamada - rápida (caché)
-        start2 = time.time()
-        result2 = slow_function()
-        time2 = time.time() - start2
+        """Caché evita repetir la operación costosa"""
+        # Primera llamada - ejecuta la función
+        result1 = _calcular(1, 2)
+        
+        # Segunda llamada - sale del caché
+        result2 = _calcular(1, 2)
         
         assert result1 == result2
-        assert call_count == 1
-        assert time2 < time1  # Segunda llamada es más rápida
-        assert time2 < 0.01  # Mucho más rápida que 0.1s
+        assert _LLAMADAS["calcular"] == 1
     
     def test_cache_memory_usage(self):
         """Monitoreo de uso de memoria"""
         invalidate_cache()
         
-        @cache(ttl_seconds=60)
-        def generate_data(size):
-            return "x" * size
-        
         # Generar varios tamaños
         for size in [100, 1000, 10000]:
-            generate_data(size)
+            _repetir_x(size)
         
         stats = get_cache_stats()
         # Debe haber consumido algo de memoria
@@ -359,13 +314,5 @@ class TestCachePerformance:
         assert stats["total_entries"] >= 3
 
 
-# Fixtures
-@pytest.fixture(autouse=True)
-def cleanup_cache_after_test():
-    """Limpia el caché después de cada test"""
-    yield
-    invalidate_cache()
-
-
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
@@ -0,0 +1,34 @@
+"""
+Tests unitarios para scripts/data/cargar_hsk.py
+"""
+import importlib.util
+import os
+from pathlib import Path
+
+import pytest
+
+import app
+
+_RUTA_CARGAR_HSK = Path(app.__file__).resolve().parent.parent / "scripts" / "data" / "cargar_hsk.py"
+
+
+@pytest.fixture(scope="module")
+def cargar_hsk():
+    """Módulo del cargador (no es un paquete, se carga desde su ruta)"""
+    directorio = os.getcwd()  # El script cambia el directorio de trabajo al importarse
+    spec = importlib.util.spec_from_file_location("cargar_hsk", _RUTA_CARGAR_HSK)
+    modulo = importlib.util.module_from_spec(spec)
+    try:
+        spec.loader.exec_module(modulo)
+    finally:
+        os.chdir(directorio)
+    return modulo
+
+
+class TestMapearColumnas:
+    """Tests para el mapeo de columnas del CSV"""
+    
+    def test_variaciones_ya_normalizadas(self, cargar_hsk):
+        """Las claves de _VARIACIONES están normalizadas (si no, nunca coincidirían con una columna)"""
+        for clave in cargar_hsk._VARIACIONES:
+            assert cargar_hsk.normalizar_nombre_columna(clave) == clave
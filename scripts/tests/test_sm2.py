@@ -1,71 +1,98 @@
 """
 Tests de integración para el sistema SM2
+
+La BD es SQLite en memoria y cada proceso tiene la suya, así que el módulo
+puede repartirse entre workers de pytest-xdist sin compartir ficheros:
+
+    pytest -n auto tests/test_sm2.py
 """
 import pytest
-from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import text
 from datetime import datetime, timezone
-from app.main import app
-from app.database import Base, get_db
+from app.database import Base
 from app import models, service
 
 
-# Base de datos de prueba
-SQLALCHEMY_TEST_DATABASE_URL = "sqlite:///./test_sm2.db"
-engine = create_engine(SQLALCHEMY_TEST_DATABASE_URL, connect_args={"check_same_thread": False})
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-
-def override_get_db():
+@pytest.fixture(scope="module")
+def datos_palabra_diccionario(test_engine, sesion_de_prueba):
+    """
+    Filas que genera añadir una palabra al diccionario, capturadas una vez por módulo.
+    
+    La palabra se añade con el mismo servicio que usa el endpoint (sin pasar
+    por HTTP) dentro de una transacción que se revierte al terminar; los
+    tests reinsertan las filas capturadas.
+    """
+    connection = test_engine.connect()
+    transaction = connection.begin()
+    db = sesion_de_prueba(connection)
     try:
-        db = TestingSessionLocal()
-        yield db
+        # Crear palabra HSK
+        word = models.HSK(
+            numero=1,
+            nivel=1,
+            hanzi="你",
+            pinyin="nǐ",
+            espanol="tú"
+        )
+        db.add(word)
+        db.commit()
+        
+        # Agregar al diccionario (genera tarjetas)
+        assert service.agregar_palabra_y_generar_tarjetas(db, word.id)
+        
+        # Tablas en orden de dependencias, para poder reinsertarlas tal cual
+        datos = []
+        for tabla in Base.metadata.sorted_tables:
+            filas = [dict(fila) for fila in connection.execute(tabla.select()).mappings()]
+            if filas:
+                datos.append((tabla, filas))
+        return word.id, datos
     finally:
         db.close()
-
-
-app.dependency_overrides[get_db] = override_get_db
-
-
-@pytest.fixture(scope="function")
-def client():
-    """Cliente de prueba"""
-    Base.metadata.create_all(bind=engine)
-    yield TestClient(app)
-    Base.metadata.drop_all(bind=engine)
+        transaction.rollback()
+        connection.close()
 
 
 @pytest.fixture
-def db_session():
-    """Sesión de base de datos"""
-    Base.metadata.create_all(bind=engine)
-    db = TestingSessionLocal()
-    yield db
-    db.close()
-    Base.metadata.drop_all(bind=engine)
-
-
-@pytest.fixture
-def word_in_diccionario(client, db_session):
+def word_in_diccionario(client, db_session, datos_palabra_diccionario):
     """Palabra agregada al diccionario con tarjetas"""
-    # Crear palabra HSK
-    word = models.HSK(
-        numero=1,
-        nivel=1,
-        hanzi="你",
-        pinyin="nǐ",
-        espanol="tú"
-    )
-    db_session.add(word)
+    word_id, datos = datos_palabra_diccionario
+    
+    # Reinsertar en bloque las filas capturadas, sin repetir la petición
+    for tabla, filas in datos:
+        db_session.execute(tabla.insert(), filas)
     db_session.commit()
-    db_session.refresh(word)
     
-    # Agregar al diccionario (genera tarjetas)
-    response = client.post(f"/api/diccionario/add/{word.id}")
-    assert response.status_code == 200
+    return db_session.get(models.HSK, word_id)
+
+
+def _ejemplo_en_estudio(db, palabra):
+    """
+    Prepara un ejemplo con el hanzi de palabra, activado y añadido al estudio,
+    con progreso avanzado (intervalo 6) en la tarjeta del hanzi
+    
+    Returns:
+        (tarjeta del hanzi, tarjeta del ejemplo)
+    """
+    tarjeta_hanzi = db.query(models.Tarjeta).filter(
+        models.Tarjeta.hsk_id == palabra.id
+    ).first()
+    
+    progreso = db.query(models.SM2Progress).filter(
+        models.SM2Progress.tarjeta_id == tarjeta_hanzi.id
+    ).one()
+    progreso.repetitions = 2
+    progreso.interval = 6
+    db.commit()
     
-    return word
+    ejemplo = service.crear_ejemplo_completo(db, "你好", "nǐ hǎo", "hola", [palabra.id])
+    ejemplo.activado = True
+    db.commit()
+    service.añadir_ejemplo_a_estudio(db, ejemplo.id)
+    tarjeta_ejemplo = db.query(models.Tarjeta).filter(
+        models.Tarjeta.ejemplo_id == ejemplo.id
+    ).first()
+    return tarjeta_hanzi, tarjeta_ejemplo
 
 
 class TestSM2SessionEndpoints:
@@ -134,8 +161,18 @@ class TestSM2CardsEndpoints:
 class TestSM2ReviewEndpoint:
     """Tests para endpoint de review"""
     
-    def test_review_card_quality_0(self, client, word_in_diccionario):
-        """Review con quality 0 (Again)"""
+    @pytest.mark.parametrize(
+        "quality,es_correcta,intervalo_exacto,estado",
+        [
+            (0, False, 1, "aprendiendo"),
+            (1, True, None, None),
+            (2, True, None, None),
+        ],
+        ids=["again", "hard", "easy"]
+    )
+    def test_review_card(self, client, word_in_diccionario, quality, es_correcta,
+                         intervalo_exacto, estado):
+        """Review con quality 0 (Again), 1 (Hard) y 2 (Easy)"""
         # Iniciar sesión
         session_response = client.post("/api/sm2/session/start")
         session_id = session_response.json()["session_id"]
@@ -148,58 +185,19 @@ class TestSM2ReviewEndpoint:
         review_data = {
             "tarjeta_id": card["tarjeta_id"],
             "session_id": session_id,
-            "quality": 0
-        }
-        response = client.post("/api/sm2/review", json=review_data)
-        assert response.status_code == 200
-        
-        data = response.json()
-        assert data["success"] is True
-        assert data["es_correcta"] is False
-        assert data["nuevo_intervalo"] == 1
-        assert data["nuevo_estado"] == "aprendiendo"
-    
-    def test_review_card_quality_1(self, client, word_in_diccionario):
-        """Review con quality 1 (Hard)"""
-        session_response = client.post("/api/sm2/session/start")
-        session_id = session_response.json()["session_id"]
-        
-        cards_response = client.get("/api/sm2/cards/due?limite=1")
-        card = cards_response.json()[0]
-        
-        review_data = {
-            "tarjeta_id": card["tarjeta_id"],
-            "session_id": session_id,
-            "quality": 1
+            "quality": quality
         }
         response = client.post("/api/sm2/review", json=review_data)
         assert response.status_code == 200
         
         data = response.json()
         assert data["success"] is True
-        assert data["es_correcta"] is True
-        assert data["nuevo_intervalo"] >= 1
-    
-    def test_review_card_quality_2(self, client, word_in_diccionario):
-        """Review con quality 2 (Easy)"""
-        session_response = client.post("/api/sm2/session/start")
-        session_id = session_response.json()["session_id"]
-        
-        cards_response = client.get("/api/sm2/cards/due?limite=1")
-        card = cards_response.json()[0]
-        
-        review_data = {
-            "tarjeta_id": card["tarjeta_id"],
-            "session_id": session_id,
-            "quality": 2
-        }
-        response = client.post("/api/sm2/review", json=review_data)
-        assert response.status_code == 200
-        
-        data = response.json()
-        assert data["success"] is True
-        assert data["es_correcta"] is True
+        assert data["es_correcta"] is es_correcta
         assert data["nuevo_intervalo"] >= 1
+        if intervalo_exacto is not None:
+            assert data["nuevo_intervalo"] == intervalo_exacto
+        if estado is not None:
+            assert data["nuevo_estado"] == estado
     
     def test_review_card_invalid_quality(self, client, word_in_diccionario):
         """Review con quality inválido"""
@@ -281,6 +279,31 @@ class TestSM2Algorithm:
         assert data["nuevo_estado"] == "aprendiendo"
 
 
+class TestCalcularSM2:
+    """Tests unitarios de service.calcular_sm2_simplificado"""
+    
+    @pytest.mark.parametrize(
+        "entrada,esperado",
+        [
+            ((0, 2.5, 3, 30), (1.7, 0, 1, "aprendiendo")),
+            ((1, 2.5, 0, 0), (2.36, 1, 1, "aprendiendo")),
+            ((2, 2.5, 0, 0), (2.6, 1, 1, "aprendiendo")),
+            ((2, 2.5, 1, 1), (2.6, 2, 6, "aprendiendo")),
+            ((2, 2.6, 2, 6), (2.7, 3, 16, "aprendiendo")),
+            ((2, 2.5, 3, 15), (2.6, 4, 39, "dominada")),
+            ((2, 2.5, 5, 30), (2.6, 6, 78, "madura")),
+            ((1, 2.5, 3, 30), (2.36, 4, 49, "madura")),
+            ((0, 1.3, 0, 0), (1.3, 0, 1, "aprendiendo")),
+        ]
+    )
+    def test_resultados_conocidos(self, entrada, esperado):
+        """Facilidad, repeticiones, intervalo y estado para casos conocidos"""
+        easiness, repetitions, interval, estado = service.calcular_sm2_simplificado(*entrada)
+        
+        assert easiness == pytest.approx(esperado[0])
+        assert (repetitions, interval, estado) == esperado[1:]
+
+
 class TestSM2Statistics:
     """Tests para estadísticas SM2"""
     
@@ -324,6 +347,24 @@ class TestSM2Statistics:
         data = response.json()
         
         assert data["total_revisiones"] == 1
+        assert data["tarjetas_estudiadas"] == 1
+        assert data["tarjetas_nuevas"] == 5
+    
+    def test_statistics_studied_and_new_add_up(self, client, word_in_diccionario):
+        """Estudiadas y nuevas se reparten el total, antes y después de revisar"""
+        def comprobar():
+            data = client.get("/api/sm2/statistics").json()
+            assert data["tarjetas_estudiadas"] + data["tarjetas_nuevas"] == data["total_tarjetas"]
+            return data
+        
+        assert comprobar()["tarjetas_estudiadas"] == 0
+        
+        session_id = client.post("/api/sm2/session/start").json()["session_id"]
+        card = client.get("/api/sm2/cards/due?limite=1").json()[0]
+        review_data = {"tarjeta_id": card["tarjeta_id"], "session_id": session_id, "quality": 2}
+        client.post("/api/sm2/review", json=review_data)
+        
+        assert comprobar()["tarjetas_estudiadas"] == 1
     
     def test_get_progress_detailed(self, client, word_in_diccionario):
         """Progreso detallado"""
@@ -356,15 +397,18 @@ class TestSM2Integration:
         cards = cards_response.json()
         assert len(cards) <= 3
         
-        # 3. Revisar cada tarjeta
-        for card in cards:
-            review_data = {
+        # 3. Revisar todas las tarjetas en una sola petición
+        reviews = [
+            {
                 "tarjeta_id": card["tarjeta_id"],
                 "session_id": session_id,
                 "quality": 2  # Todas correctas
             }
-            review_response = client.post("/api/sm2/review", json=review_data)
-            assert review_response.status_code == 200
+            for card in cards
+        ]
+        review_response = client.post("/api/sm2/review/batch", json=reviews)
+        assert review_response.status_code == 200
+        assert len(review_response.json()) == len(cards)
         
         # 4. Finalizar sesión
         end_response = client.post(f"/api/sm2/session/end/{session_id}")
@@ -401,6 +445,19 @@ class TestSM2Integration:
         assert data["correctas"] == 2
 
 
+class TestSM2Indices:
+    """Tests de los índices que usan las consultas SM2"""
+    
+    def test_due_progress_uses_covering_index(self, db_session):
+        """Las tarjetas pendientes se resuelven solo con idx_progress_due"""
+        plan = db_session.execute(
+            text("EXPLAIN QUERY PLAN SELECT tarjeta_id FROM sm2_progress WHERE next_review <= :ahora"),
+            {"ahora": datetime.now(timezone.utc)}
+        ).all()
+        detalle = " ".join(fila[-1] for fila in plan)
+        assert "COVERING INDEX idx_progress_due" in detalle
+
+
 class TestSM2EdgeCases:
     """Tests de casos límite SM2"""
     
@@ -417,6 +474,114 @@ class TestSM2EdgeCases:
         response = client.post("/api/sm2/review", json=review_data)
         assert response.status_code == 400
     
+    def test_review_batch_with_nonexistent_card(self, client, word_in_diccionario):
+        """Un lote con una tarjeta inexistente se rechaza sin aplicar ninguna"""
+        session_id = client.post("/api/sm2/session/start").json()["session_id"]
+        card = client.get("/api/sm2/cards/due?limite=1").json()[0]
+        
+        reviews = [
+            {"tarjeta_id": card["tarjeta_id"], "session_id": session_id, "quality": 2},
+            {"tarjeta_id": 999999, "session_id": session_id, "quality": 2}
+        ]
+        response = client.post("/api/sm2/review/batch", json=reviews)
+        assert response.status_code == 400
+        
+        end_response = client.post(f"/api/sm2/session/end/{session_id}")
+        assert end_response.json()["tarjetas_estudiadas"] == 0
+    
+    def test_review_batch_empty_creates_no_reviews(self, db_session):
+        """Un lote vacío no guarda ninguna revisión"""
+        assert service.procesar_respuestas(db_session, []) == []
+        assert db_session.query(models.SM2Review).count() == 0
+    
+    @pytest.mark.parametrize("tamano", [0, 201], ids=["vacio", "excesivo"])
+    def test_review_batch_size_rejected(self, client, word_in_diccionario, tamano):
+        """Un lote vacío o mayor que el tope se rechaza antes de procesarse"""
+        session_id = client.post("/api/sm2/session/start").json()["session_id"]
+        card = client.get("/api/sm2/cards/due?limite=1").json()[0]
+        
+        review_data = {"tarjeta_id": card["tarjeta_id"], "session_id": session_id, "quality": 2}
+        response = client.post("/api/sm2/review/batch", json=[review_data] * tamano)
+        assert response.status_code == 422
+    
+    def test_review_batch_same_card_twice(self, client, word_in_diccionario):
+        """La segunda respuesta de un lote parte del progreso que dejó la primera"""
+        session_id = client.post("/api/sm2/session/start").json()["session_id"]
+        card = client.get("/api/sm2/cards/due?limite=1").json()[0]
+        
+        review_data = {"tarjeta_id": card["tarjeta_id"], "session_id": session_id, "quality": 2}
+        response = client.post("/api/sm2/review/batch", json=[review_data, review_data])
+        assert response.status_code == 200
+        
+        primera, segunda = response.json()
+        assert segunda["nuevo_intervalo"] > primera["nuevo_intervalo"]
+        
+        end_response = client.post(f"/api/sm2/session/end/{session_id}")
+        assert end_response.json()["tarjetas_estudiadas"] == 2
+    
+    @pytest.mark.parametrize("en_lote", [True, False], ids=["lote", "una_a_una"])
+    def test_review_batch_matches_sequential(self, db_session, word_in_diccionario, en_lote):
+        """
+        Un ejemplo con hanzi fallados reinicia su tarjeta de hanzi antes de que
+        se revise en el mismo lote, igual que al enviarlas de una en una
+        """
+        db = db_session
+        tarjeta_hanzi, tarjeta_ejemplo = _ejemplo_en_estudio(db, word_in_diccionario)
+        
+        respuestas = [
+            {"tarjeta_id": tarjeta_ejemplo.id, "session_id": 1, "quality": 1, "hanzi_fallados": ["你"]},
+            {"tarjeta_id": tarjeta_hanzi.id, "session_id": 1, "quality": 2},
+        ]
+        if en_lote:
+            resultados = service.procesar_respuestas(db, respuestas)
+        else:
+            resultados = [service.procesar_respuesta(db, **r) for r in respuestas]
+        
+        # La revisión del hanzi parte del progreso reiniciado por el ejemplo
+        _, _, intervalo_esperado, _ = service.calcular_sm2_simplificado(2, 2.5, 0, 0)
+        assert resultados[1]["nuevo_intervalo"] == intervalo_esperado
+        
+        db.expire_all()
+        progreso = db.query(models.SM2Progress).filter(
+            models.SM2Progress.tarjeta_id == tarjeta_hanzi.id
+        ).one()
+        revision = db.query(models.SM2Review).filter(
+            models.SM2Review.tarjeta_id == tarjeta_hanzi.id
+        ).one()
+        assert progreso.interval == intervalo_esperado
+        assert revision.previous_interval == 0
+        assert revision.new_interval == intervalo_esperado
+    
+    def test_review_batch_failure_applies_nothing(self, db_session, word_in_diccionario, monkeypatch):
+        """
+        Si el lote falla después de los efectos de un ejemplo, no queda ni el
+        progreso ni las revisiones de ninguna respuesta
+        """
+        db = db_session
+        tarjeta_hanzi, tarjeta_ejemplo = _ejemplo_en_estudio(db, word_in_diccionario)
+        
+        def fallar(db, filas):
+            raise RuntimeError("fallo simulado")
+        monkeypatch.setattr(service.repository, "bulk_create_reviews", fallar)
+        
+        respuestas = [
+            {"tarjeta_id": tarjeta_ejemplo.id, "session_id": 1, "quality": 1, "hanzi_fallados": ["你"]},
+            {"tarjeta_id": tarjeta_hanzi.id, "session_id": 1, "quality": 2},
+        ]
+        with pytest.raises(RuntimeError):
+            service.procesar_respuestas(db, respuestas)
+        
+        db.expire_all()
+        progresos = {
+            p.tarjeta_id: p for p in db.query(models.SM2Progress).filter(
+                models.SM2Progress.tarjeta_id.in_([tarjeta_hanzi.id, tarjeta_ejemplo.id])
+            )
+        }
+        assert progresos[tarjeta_ejemplo.id].total_reviews == 0
+        assert progresos[tarjeta_hanzi.id].interval == 6  # Sin el reinicio del ejemplo
+        assert progresos[tarjeta_hanzi.id].total_reviews == 0
+        assert db.query(models.SM2Review).count() == 0
+    
     def test_multiple_reviews_same_card(self, client, word_in_diccionario):
         """Múltiples reviews de la misma tarjeta"""
         session_response = client.post("/api/sm2/session/start")
@@ -108,35 +108,15 @@ class TestSanitizeInput:
 class TestFormatIntervalDisplay:
     """Tests para la función format_interval_display()"""
     
-    def test_less_than_one_day(self):
-        """Formatea intervalos menores a 1 día"""
-        assert format_interval_display(0) == "<1d"
-    
-    def test_days(self):
-        """Formatea días"""
-        assert format_interval_display(1) == "1d"
-        assert format_interval_display(15) == "15d"
-        assert format_interval_display(29) == "29d"
-    
-    def test_months(self):
-        """Formatea meses"""
-        assert format_interval_display(30) == "1m"
-        assert format_interval_display(60) == "2m"
-        assert format_interval_display(180) == "6m"
-        assert format_interval_display(364) == "12m"
-    
-    def test_years(self):
-        """Formatea años"""
-        assert format_interval_display(365) == "1y"
-        assert format_interval_display(730) == "2y"
-        assert format_interval_display(1095) == "3y"
-    
-    def test_boundary_cases(self):
-        """Casos límite"""
-        assert format_interval_display(29) == "29d"
-        assert format_interval_display(30) == "1m"
-        assert format_interval_display(364) == "12m"
-        assert format_interval_display(365) == "1y"
+    @pytest.mark.parametrize("days,esperado", [
+        (0, "<1d"),                                         # Menos de 1 día
+        (1, "1d"), (15, "15d"), (29, "29d"),                # Días
+        (30, "1m"), (60, "2m"), (180, "6m"), (364, "12m"),  # Meses
+        (365, "1y"), (730, "2y"), (1095, "3y"),             # Años
+    ])
+    def test_format(self, days, esperado):
+        """Formatea días, meses y años, incluidos los límites entre unidades"""
+        assert format_interval_display(days) == esperado
 
 
 class TestUtilsIntegration:
@@ -0,0 +1,39 @@
+"""
+Tests unitarios para la validación de búsquedas de app/schemas.py
+"""
+import pytest
+from pydantic import ValidationError
+from app.schemas import SearchQuery, _SQL_PELIGROSO
+
+
+def _variantes_de_mayusculas(patron):
+    """El patrón tal cual, en minúsculas, en mayúsculas y alternando (sin repetidos)"""
+    alterno = "".join(c.upper() if i % 2 else c.lower() for i, c in enumerate(patron))
+    return sorted({patron, patron.lower(), patron.upper(), alterno})
+
+
+class TestSQLPeligroso:
+    """Tests para la lista de patrones SQL precalculada"""
+
+    @pytest.mark.parametrize(
+        "patron,texto",
+        [
+            (patron, f"abc {variante} xyz")
+            for patron, _ in _SQL_PELIGROSO
+            for variante in _variantes_de_mayusculas(patron)
+        ]
+    )
+    def test_dangerous_pattern_rejected_in_any_case(self, patron, texto):
+        """Cada patrón se rechaza escrito con cualquier combinación de mayúsculas"""
+        with pytest.raises(ValidationError) as exc_info:
+            SearchQuery(query=texto)
+        assert patron in " ".join(detalle["msg"] for detalle in exc_info.value.errors())
+
+    def test_benign_query_passes(self):
+        """Un texto sin patrones peligrosos pasa y se recorta"""
+        query = SearchQuery(query="  nǐ hǎo 你好 drip selection  ")
+        assert query.query == "nǐ hǎo 你好 drip selection"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])